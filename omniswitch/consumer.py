@@ -30,13 +30,23 @@ import traceback
 import urllib
 import urllib2
 import cookielib
+import httplib
+import select
+import socket
+import threading
+from StringIO import StringIO
 try:
     import json
 except:
     import simplejson as json
 import re
 import getopt
+from collections import OrderedDict
 from xml.dom.minidom import parseString
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
 from time import time, sleep
 from pprint import pprint
 try:
@@ -110,7 +120,10 @@ If it is not installed, the sample code's display will not be rendered as nicely
 
 
 class AOSException(Exception):
-    pass
+
+    def __init__(self, msg='', diag=None):
+        Exception.__init__(self, msg)
+        self.diag = diag # http code of the failed request, if any
 
 
 class AOSErrorHandler(urllib2.HTTPDefaultErrorHandler):   
@@ -140,6 +153,145 @@ class AOSRedirectHandler(urllib2.HTTPRedirectHandler):
     http_error_301 = http_error_302 = http_error_303 = http_error_307 = http_error_redirect
 
 
+class AOSConnectionPool(object):
+    """
+    Idle HTTP/1.1 keep-alive connections, kept per host, for one AOSConnection.
+    A request takes an idle connection (or opens a new one) and gives it back once its
+    response is read, so consecutive requests to the switch skip the TCP and TLS handshakes.
+    A request is sent again on a new connection only if the idle one failed before the
+    request was written; once written, the switch may have run it and the error is raised.
+    """
+
+
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle
+        self.idle = {}
+        self.lock = threading.Lock()
+
+
+    def open(self, conn_factory, req):
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+        tunnel_host = getattr(req, '_tunnel_host', None)
+        key = (conn_factory, host, tunnel_host)
+
+        conn = self._get(key)
+        if conn is not None and self._dropped(conn):
+            conn.close()
+            conn = None
+        if conn is not None:
+            try:
+                self._write(conn, req)
+            except (socket.error, httplib.HTTPException):
+                # closed by the switch while idle, the request was not written; use a new one
+                conn.close()
+                conn = None
+
+        try:
+            if conn is None:
+                conn = conn_factory(host, timeout=req.timeout)
+                if tunnel_host:
+                    conn.set_tunnel(tunnel_host, getattr(req, '_tunnel_headers', None) or {})
+                self._write(conn, req)
+            return self._read(key, conn, req)
+        except (socket.error, httplib.HTTPException), err:
+            conn.close()
+            raise urllib2.URLError(err)
+
+
+    def close(self):
+        self.lock.acquire()
+        conns = [conn for conn_list in self.idle.values() for conn in conn_list]
+        self.idle = {}
+        self.lock.release()
+        for conn in conns:
+            conn.close()
+
+
+    def _get(self, key):
+        self.lock.acquire()
+        try:
+            conn_list = self.idle.get(key)
+            if conn_list:
+                return conn_list.pop()
+            return None
+        finally:
+            self.lock.release()
+
+
+    def _put(self, key, conn):
+        self.lock.acquire()
+        conn_list = self.idle.setdefault(key, [])
+        if len(conn_list) < self.max_idle:
+            conn_list.append(conn)
+            conn = None
+        self.lock.release()
+        if conn is not None:
+            conn.close()
+
+
+    def _dropped(self, conn):
+        # an idle connection has nothing to read, unless the switch closed it
+        if conn.sock is None:
+            return True
+        try:
+            return len(select.select([conn.sock], [], [], 0)[0]) > 0
+        except (select.error, socket.error):
+            return True
+
+
+    def _write(self, conn, req):
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items() if k not in headers))
+        headers['Connection'] = 'keep-alive'
+        headers = dict((name.title(), val) for name, val in headers.items())
+
+        conn.request(req.get_method(), req.get_selector(), req.data, headers)
+
+
+    def _read(self, key, conn, req):
+        r = conn.getresponse()
+        # the whole response is read, so that the connection can take the next request
+        data = r.read()
+        if r.will_close:
+            conn.close()
+        else:
+            self._put(key, conn)
+
+        resp = urllib.addinfourl(StringIO(data), r.msg, req.get_full_url())
+        resp.code = r.status
+        resp.msg = r.reason
+        return resp
+
+
+class AOSKeepAliveHTTPHandler(urllib2.HTTPHandler):
+
+
+    def __init__(self, pool):
+        urllib2.HTTPHandler.__init__(self)
+        self.pool = pool
+
+
+    def http_open(self, req):
+        return self.pool.open(httplib.HTTPConnection, req)
+
+
+class AOSKeepAliveHTTPSHandler(urllib2.HTTPSHandler):
+
+
+    def __init__(self, pool):
+        urllib2.HTTPSHandler.__init__(self)
+        self.pool = pool
+
+
+    def https_open(self, req):
+        context = getattr(self, '_context', None)
+        if context is None:
+            return self.pool.open(httplib.HTTPSConnection, req)
+        return self.pool.open(lambda host, timeout: httplib.HTTPSConnection(host, timeout=timeout, context=context), req)
+
+
 class AOSXMLDecoder(dict):
 
 
@@ -168,6 +320,99 @@ class AOSXMLDecoder(dict):
         return cur_node_dict
 
 
+class AOSXMLStreamDecoder(dict):
+    """
+    Same structure as AOSXMLDecoder, built with iterparse instead of a DOM: each element
+    is turned into its dict (or text) when it ends and is then freed, so large tables
+    are decoded in one pass without holding the whole document tree. Unlike
+    AOSXMLDecoder, repeated names are collected in a list instead of failing.
+    """
+
+
+    def __init__(self, data, dict_class=dict):
+        stack = [] # [name, children dict, has child elements] of the open elements
+        for event, elem in ElementTree.iterparse(StringIO(data), events=('start', 'end')):
+            if event == 'start':
+                if stack or elem.tag == 'result':
+                    stack.append([elem.get('name', elem.tag), dict_class(), False])
+                continue
+            if not stack:
+                continue
+            name, children, has_child = stack.pop()
+            if has_child:
+                value = children
+            else:
+                value = elem.text or ''
+            elem.clear()
+            if not stack:
+                self[elem.tag] = value
+                return
+            parent = stack[-1]
+            parent[2] = True
+            if name in parent[1]:
+                if not isinstance(parent[1][name], list):
+                    parent[1][name] = [parent[1][name]]
+                parent[1][name].append(value)
+            else:
+                parent[1][name] = value
+        raise ValueError("no result element in the response")
+
+
+class AOSResult(dict):
+    """
+    Read-only result of one request. It is the decoded response, as before, so that
+    result['result'] still works, and it carries its own diag code, errors and data;
+    unlike AOSAPI.diag()/success() which only tell about the last request made, by
+    whichever thread made it.
+    """
+
+
+    def __init__(self, decoded, http_code=200):
+        dict.__init__(self, decoded)
+        result = decoded.get('result')
+        if not isinstance(result, dict):
+            result = {}
+        diag = result.get('diag')
+        try:
+            diag = int(diag)
+        except (TypeError, ValueError):
+            diag = http_code
+        object.__setattr__(self, '_diag', diag)
+        object.__setattr__(self, '_result', result)
+
+
+    def diag(self):
+        return self._diag
+
+
+    def success(self):
+        return self._diag == 200
+
+
+    def errors(self):
+        return self._result.get('error')
+
+
+    def data(self):
+        data = self._result.get('data')
+        if not data:
+            return {}
+        return data
+
+
+    def __reduce__(self):
+        # rebuilt through __init__, so that copy/deepcopy/pickle never set items on it
+        return (AOSResult, (dict(self), self._diag))
+
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("AOSResult is read-only, use dict(result) for a copy to modify")
+
+
+    __setitem__ = __delitem__ = __setattr__ = __delattr__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+
 class AOSHeaders(dict):
 
 
@@ -200,21 +445,28 @@ class AOSConnection(object):
         # cookiejar is public so that we can inspect it
         # should anything go wrong
         self.cookiejar   = cookielib.LWPCookieJar()
+        # each connection has its own opener (and so its own cookie and keep-alive
+        # connections); installing it globally would hand it to every other connection
+        self.pool        = AOSConnectionPool()
         if obeyproxy:
-            urllib2.install_opener(
-                    urllib2.build_opener(
+            self.opener = urllib2.build_opener(
                             urllib2.HTTPCookieProcessor(self.cookiejar),
-                            urllib2.HTTPHandler(debuglevel=0),
+                            AOSKeepAliveHTTPHandler(self.pool),
+                            AOSKeepAliveHTTPSHandler(self.pool),
                             AOSErrorHandler(),
-                            AOSRedirectHandler()))
+                            AOSRedirectHandler())
         else:
-            urllib2.install_opener(
-                    urllib2.build_opener(
+            self.opener = urllib2.build_opener(
                             urllib2.ProxyHandler({}),
                             urllib2.HTTPCookieProcessor(self.cookiejar),
-                            urllib2.HTTPHandler(debuglevel=0),
+                            AOSKeepAliveHTTPHandler(self.pool),
+                            AOSKeepAliveHTTPSHandler(self.pool),
                             AOSErrorHandler(),
-                            AOSRedirectHandler()))
+                            AOSRedirectHandler())
+
+
+    def close(self):
+        self.pool.close()
 
 
     def endpoint(self):
@@ -245,7 +497,7 @@ class AOSConnection(object):
         request.get_method = lambda: 'DELETE'
         request = self.headers(request)
 
-        return urllib2.urlopen(request)
+        return self.opener.open(request)
 
 
     def put(self, domain, urn, data):
@@ -265,7 +517,7 @@ class AOSConnection(object):
         request.get_method = lambda: 'PUT'
         request = self.headers(request)
 
-        return urllib2.urlopen(request)
+        return self.opener.open(request)
 
 
     def post(self, domain, urn, data):
@@ -283,7 +535,7 @@ class AOSConnection(object):
                 {'User-Agent': self.USER_AGENT})
         request = self.headers(request)
 
-        return urllib2.urlopen(request)
+        return self.opener.open(request)
 
 
     def get(self, domain, urn = '', args = {}):
@@ -304,7 +556,7 @@ class AOSConnection(object):
         request.add_header('User-Agent', self.USER_AGENT)
         request = self.headers(request)
 
-        return urllib2.urlopen(request)
+        return self.opener.open(request)
 
 
 class AOSAPI(object):
@@ -324,8 +576,8 @@ class AOSAPI(object):
     def login(self):
         result = self.query('auth', '', {'username':self.connection.username, 'password':self.connection.password})
         # Bad result? Let me stop you right there...
-        if not self.success():
-            raise AOSException(result['result']['error'])
+        if not result.success():
+            raise AOSException(result.errors())
         """
         # This would have been the 'scrapy' way:
         result = self.connection.post('login', {
@@ -335,6 +587,7 @@ class AOSAPI(object):
         if data.find("Authentication failure") > -1:
             raise AOSException("Authentication failure.")
         """
+        return result
 
 
     def logout(self):
@@ -346,10 +599,45 @@ class AOSAPI(object):
 
 
     def query(self, domain, urn = '', args = {}):
+        return self._query(domain, urn, args)
+
+
+    def iter_table(self, table, columns, page_size=100, domain='mib'):
+        """
+        Yields (index, row) of the table, reading it page by page ('page_size' rows per
+        request, using startIndex/limit), so that a large table is never held in memory
+        at once and the rows can be used while the rest is still being read.
+        Raises AOSException if a page can not be read.
+        """
+        page_size = max(int(page_size), 2)
+        args = dict([('mibObject'+str(i), columns[i]) for i in range(0, len(columns))])
+        args['limit'] = str(page_size)
+        last_index = None
+        while True:
+            if last_index is not None:
+                args['startIndex'] = last_index
+            # rows must come in the switch's order to know where the next page starts
+            result = self._query(domain, table, args, True)
+            if not result.success():
+                raise AOSException("%s: %s" % (table, result.errors()), result.diag())
+            rows = result.data().get('rows')
+            if not isinstance(rows, dict):
+                return
+            page_start = last_index
+            for index, row in rows.items():
+                if index == page_start:
+                    continue # startIndex row, already given with the previous page
+                last_index = index
+                yield index, row
+            if len(rows) < page_size or last_index == page_start:
+                return
+
+
+    def _query(self, domain, urn = '', args = {}, ordered = False):
         result = self.connection.get(domain, urn, args)
         try: 
             obj = self.decode_type(
-                    result.info(), result.read())
+                    result.info(), result.read(), getattr(result, 'code', None) or 200, ordered)
         except ValueError, e:
             print "Error decoding [%s]" % result.read()
             raise
@@ -360,7 +648,7 @@ class AOSAPI(object):
         result = self.connection.post(domain, urn, args)
         try: 
             obj = self.decode_type(
-                    result.info(), result.read())
+                    result.info(), result.read(), getattr(result, 'code', None) or 200)
         except ValueError, e:
             print "Error decoding [%s]" % result.read()
             raise
@@ -371,7 +659,7 @@ class AOSAPI(object):
         result = self.connection.put(domain, urn, args)
         try: 
             obj = self.decode_type(
-                    result.info(), result.read())
+                    result.info(), result.read(), getattr(result, 'code', None) or 200)
         except ValueError, e:
             print "Error decoding [%s]" % result.read()
             raise
@@ -382,7 +670,7 @@ class AOSAPI(object):
         result = self.connection.delete(domain, urn, args)
         try: 
             obj = self.decode_type(
-                    result.info(), result.read())
+                    result.info(), result.read(), getattr(result, 'code', None) or 200)
         except ValueError, e:
             print "Error decoding [%s]" % result.read()
             raise
@@ -408,11 +696,10 @@ class AOSAPI(object):
         return self.ws_diag == 200
 
 
-    def decode_type(self, info, data):
+    def decode_type(self, info, data, http_code=200, ordered=False):
         if self.connection.debug:
             print('Raw Response: '),
             pprint(data)
-        clean_data = self.cruft.sub('', data)
         # Be strict when you write,
         # forgiving when you read:
         # If *someone* killed our content-type header,
@@ -421,14 +708,21 @@ class AOSAPI(object):
         if not enc_type in [AOSAPI.ENC_ALT, AOSAPI.ENC_DEFAULT]:
             enc_type = AOSAPI.ENC_DEFAULT
         if enc_type == AOSAPI.ENC_XML:
-            dom = parseString(clean_data)
-            decoded = AOSXMLDecoder(dom.getElementsByTagName("result")[0])
+            # the parser skips the comments itself
+            decoded = AOSXMLStreamDecoder(data, (dict, OrderedDict)[ordered])
         else:
-            decoded = json.loads(clean_data)
+            if '<!--' in data:
+                data = self.cruft.sub('', data)
+            if ordered:
+                decoded = json.loads(data, object_pairs_hook=OrderedDict)
+            else:
+                decoded = json.loads(data)
         #pprint(decoded)
+        obj = AOSResult(decoded, http_code)
+        # kept for the callers of diag()/success(), only meaningful when not shared by threads
         if decoded.get('result') is not None and decoded['result'].get('diag') is not None:
             self.store_ws_diag(decoded['result']['diag'])
-        return decoded
+        return obj
 
 
 class WSConsumer(object):
@@ -0,0 +1,186 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: omniswitch_cli_commands.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+
+class OmniSwitchCliCommands(object):
+
+    """
+    Name:        OmniSwitchCliCommands
+    Description: AOS CLI commands of the config primitives of the device drivers.
+
+    Details:     render(function_name, args) returns the list of CLI commands that performs the
+                 driver api 'function_name'(*args), eg, create_vlan, create_network, create_vpa.
+                 The syntax differs between AOS 6x and AOS 7x/8x, set by 'is6x'.
+    """
+
+    def __init__(self, is6x, vlan_name_prefix=''):
+        self.is6x = is6x
+        self.vlan_name_prefix = vlan_name_prefix
+
+    def render(self, function_name, args):
+        if function_name in ('create_vlan_locked', 'delete_vlan_locked'):
+            function_name = function_name.replace('_locked', '')
+        if not hasattr(self, function_name) or function_name == 'render':
+            raise ValueError("no CLI command for %s" % function_name)
+        return getattr(self, function_name)(*args)
+
+    def render_all(self, op_list):
+        """ op_list is a list of (function_name, args). returns all their commands in order """
+        commands = []
+        for function_name, args in op_list:
+            commands.extend(self.render(function_name, args))
+        return commands
+
+    def create_vlan(self, vlan_id, net_name=''):
+        return [str('vlan '+str(vlan_id)+' name '+self.vlan_name_prefix+'-'+net_name+'-'+str(vlan_id))]
+
+    def delete_vlan(self, vlan_id):
+        return ['no vlan '+str(vlan_id)]
+
+    def create_unp_vlan(self, vlan_id, args=None):
+        return ['unp name '+'OpenStack-UNP-'+str(vlan_id)+' vlan '+str(vlan_id)]
+
+    def delete_unp_vlan(self, vlan_id):
+        return ['no unp name '+'OpenStack-UNP-'+str(vlan_id)]
+
+    def create_unp_macrule(self, vlan_id, mac, args=None):
+        return ['unp classification mac-address '+str(mac)+' unp-name '+'OpenStack-UNP-'+str(vlan_id)]
+
+    def delete_unp_macrule(self, vlan_id, mac):
+        return ['no unp classification mac-address '+str(mac)]
+
+    def create_unp_vlanrule(self, vlan_id):
+        return ['unp classification vlan-tag '+str(vlan_id)+' unp-name '+'OpenStack-UNP-'+str(vlan_id)]
+
+    def delete_unp_vlanrule(self, vlan_id):
+        return ['no unp classification vlan-tag '+str(vlan_id)]
+
+    def create_network(self, vlan_id, net_name=''):
+        return self.create_vlan(vlan_id, net_name) + self.create_unp_vlan(vlan_id)
+
+    def delete_network(self, vlan_id):
+        return self.delete_unp_vlan(vlan_id) + self.delete_vlan(vlan_id)
+
+    def create_port(self, vlan_id, mac=None):
+        if mac :
+            return self.create_unp_macrule(vlan_id, mac)
+        else :
+            return self.create_unp_vlanrule(vlan_id)
+
+    def delete_port(self, vlan_id, mac=None):
+        if mac :
+            return self.delete_unp_macrule(vlan_id, mac)
+        else :
+            return self.delete_unp_vlanrule(vlan_id)
+
+    def create_vpa(self, vlan_id, slotport, args=None):
+        if self.is6x :
+            return ['vlan '+str(vlan_id)+' 802.1q '+str(slotport)]
+        elif len(slotport.split('/')) == 1:
+            return ['vlan '+str(vlan_id)+' members linkagg '+str(slotport)+' tagged']
+        else:
+            return ['vlan '+str(vlan_id)+' members port '+str(slotport)+' tagged']
+
+    def delete_vpa(self, vlan_id, slotport, args=None):
+        if self.is6x :
+            return ['no 802.1q '+str(slotport)]
+        elif len(slotport.split('/')) == 1:
+            return ['no vlan '+str(vlan_id)+' members linkagg '+str(slotport)]
+        else:
+            return ['no vlan '+str(vlan_id)+' members port '+str(slotport)]
+
+    def enable_stp_mode_flat(self):
+        if self.is6x :
+            return ['bridge mode flat']
+        else:
+            return ['spantree mode flat']
+
+    def disable_stp_mode_flat(self):
+        if self.is6x :
+            return ['bridge mode 1x1']
+        else:
+            return ['spantree mode per-vlan']
+
+    def enable_mvrp_global(self):
+        return ['mvrp enable']
+
+    def disable_mvrp_global(self):
+        return ['mvrp disable']
+
+    def enable_mvrp_if(self, slotport):
+        if len(slotport.split('/')) == 1:
+            return ['mvrp linkagg '+str(slotport)+' enable']
+        else:
+            return ['mvrp port '+str(slotport)+' enable']
+
+    def disable_mvrp_if(self, slotport):
+        if len(slotport.split('/')) == 1:
+            return ['mvrp linkagg '+str(slotport)+' disable']
+        else:
+            return ['mvrp port '+str(slotport)+' disable']
+
+    def enable_mvrp(self, slotport=None):
+        if slotport:
+            return self.enable_mvrp_if(slotport)
+        else:
+            return self.enable_stp_mode_flat() + self.enable_mvrp_global()
+
+    def disable_mvrp(self, slotport=None):
+        if slotport:
+            return self.disable_mvrp_if(slotport)
+        else:
+            return self.disable_mvrp_global() + self.disable_stp_mode_flat()
+
+    def enable_unp(self, slotport):
+        if len(slotport.split('/')) == 1:
+            return ['unp linkagg '+str(slotport), 'unp linkagg '+str(slotport)+' classification enable']
+        else:
+            return ['unp port '+str(slotport), 'unp port '+str(slotport)+' classification enable']
+
+    def disable_unp(self, slotport):
+        if len(slotport.split('/')) == 1:
+            return ['no unp linkagg '+str(slotport)]
+        else:
+            return ['no unp port '+str(slotport)]
+
+    def write_memory(self):
+        return ['write memory']
+
+    def write_memory_flash_synchro(self):
+        return ['write memory flash-synchro']
+
+    def copy_running_certified(self):
+        if self.is6x :
+            return ['copy working certified']
+        else:
+            return ['copy running certified']
+
+    def apply_config_file(self, file_name):
+        return ['configuration apply '+str(file_name)]
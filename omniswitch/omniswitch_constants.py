@@ -79,6 +79,7 @@ OMNI_CLI_PROMPT_TIMEOUT = 1
 OMNI_CLI_SMALL_TIMEOUT = 2
 OMNI_CLI_MEDIUM_TIMEOUT = 5
 OMNI_CLI_LONG_TIMEOUT = 10
+OMNI_CLI_SAVE_TIMEOUT = 120
 
 # Used by RESTful driver #
 
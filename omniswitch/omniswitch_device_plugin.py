@@ -35,14 +35,20 @@ import time
 from neutron.api.v2 import attributes
 from neutron.db import db_base_plugin_v2
 from neutron.openstack.common import context
+from neutron.context import get_admin_context
 #from neutron.openstack.common import cfg
 from oslo.config import cfg
 from neutron.openstack.common import importutils
 
 from neutron.plugins.omniswitch import omniswitch_constants as omni_const
-from neutron.plugins.omniswitch.omniswitch_restful_driver import OmniSwitchRestfulDriver
-from neutron.plugins.omniswitch.omniswitch_telnet_driver import OmniSwitchTelnetDriver
+from neutron.plugins.omniswitch.omniswitch_driver_factory import OmniSwitchDriverFactory
 from neutron.plugins.omniswitch.omniswitch_db_v2 import OmniDB
+from neutron.plugins.omniswitch.omniswitch_fanout import OmniSwitchFanOutResult
+from neutron.plugins.omniswitch.omniswitch_op_queue import OmniSwitchOpQueue, OmniSwitchOpWorkers
+from neutron.plugins.omniswitch.omniswitch_mvrp_manager import OmniSwitchMvrpManager
+from neutron.plugins.omniswitch.omniswitch_op_journal import OmniSwitchOpJournal
+from neutron.plugins.omniswitch.omniswitch_reconciler import OmniSwitchReconciler, OmniSwitchConfigState
+from neutron.plugins.omniswitch.omniswitch_health import OmniSwitchHealthMonitor
 
 
 LOG = logging.getLogger(__name__)
@@ -56,6 +62,19 @@ device_opts = [
     cfg.StrOpt('switch_access_method', default='REST',help=""),
     cfg.StrOpt('switch_vlan_name_prefix', default='OpenStack',help=""),
     cfg.IntOpt('switch_save_config_interval', default=1800,help=""),
+    cfg.IntOpt('switch_max_parallel', default=16,help=""),
+    cfg.IntOpt('mvrp_batch_window', default=2,help=""),
+    cfg.IntOpt('mvrp_max_latency', default=10,help=""),
+    cfg.BoolOpt('switch_resync_on_start', default=False,help=""),
+    cfg.IntOpt('switch_failure_threshold', default=2,help=""),
+    cfg.IntOpt('switch_probe_interval', default=30,help=""),
+    cfg.IntOpt('switch_session_idle_timeout', default=120,help=""),
+    cfg.IntOpt('switch_push_threshold', default=0,help=""),
+    cfg.IntOpt('switch_save_max_deferral', default=30,help=""),
+    cfg.IntOpt('switch_keepalive_interval', default=60,help=""),
+    cfg.ListOpt('switch_telnet_sessions', default=['OS6450:2', 'OS6850E:2', 'OS6855:2', 'OS9000:2',
+                                                   'OS6900:4', 'OS10K:4', 'OS6860:4'], help=""),
+    cfg.IntOpt('switch_telnet_engine_threads', default=0,help=""),
 ]
 
 
@@ -91,22 +110,61 @@ class OmniSwitchDevicePluginV2(db_base_plugin_v2.NeutronDbPluginV2):
     switch_access_method = '' # OS6900 and OS10K access method
     switch_vlan_name_prefix = '' # custom string to be used in vlan name
     switch_save_config_interval = 0 # interval(in secs) at which the config will be saved in the switches 
+    switch_max_parallel = 0 # max number of driver calls run at once, all the switches together
+    op_workers = None # thread pool running the ops of all the op queues
+    driver_factory = None # one device driver instance per switch, shared by all its roles
+    op_queues = {} # work queue feeding each of the device driver instances
+    mvrp_batch_window = 0 # secs the core mvrp is kept disabled after the last vlan change
+    mvrp_max_latency = 0 # max secs the core mvrp is kept disabled for a batch of vlan changes
+    mvrp_manager = None
+    switch_resync_on_start = False # bring the switches in line with the DB when the plugin starts
+    reconciler = None
+    resync_pending = False
+    resync_running = False
+    switch_failure_threshold = 0 # connection failures in a row after which a switch is marked down
+    switch_probe_interval = 0 # interval(in secs) at which the switches marked down are probed
+    health_monitor = None
+    switch_session_idle_timeout = 0 # secs after which an unused REST session is logged out
+    switch_push_threshold = 0 # REST change sets of at least this many ops are pushed as one config file
+    switch_save_max_deferral = 0 # secs a save may yield to the provisioning ops queued after it
+    switch_keepalive_interval = 0 # secs of idle after which an open telnet session is checked
+    switch_telnet_sessions = None # switch type -> max number of telnet sessions open at once to a switch
+    switch_telnet_engine_threads = 0 # threads running all the telnet sessions, 0 for a thread per session
 
     db_option = None
     init_config_applied = None
 
-    edge_config_changed = 0
-    core_config_changed = 0
+    dirty_switches = None # device driver instances with changes not saved yet
 
     def __init__(self):
         self._load_config()
+        self.op_workers = OmniSwitchOpWorkers(self.switch_max_parallel)
+        self.op_queues_lock = threading.Lock()
+        self.dirty_switches = set()
+        self.dirty_lock = threading.Lock()
+        self.resync_lock = threading.Lock()
+        self.health_monitor = OmniSwitchHealthMonitor(self.switch_failure_threshold, self.switch_probe_interval,
+                                                      self._switch_recovered)
+        self.driver_factory = OmniSwitchDriverFactory(self.switch_access_method,
+                                                      self.switch_vlan_name_prefix,
+                                                      self.switch_session_idle_timeout,
+                                                      self.switch_push_threshold,
+                                                      self.switch_keepalive_interval,
+                                                      self.switch_telnet_sessions,
+                                                      self.switch_telnet_engine_threads)
         self._load_edge_ddi()
         self._load_core_ddi()
         self._load_dhcp_if_inst()
+        if self.core_network_config == omni_const.OMNI_CFG_CORE_MVRP :
+            self.mvrp_manager = OmniSwitchMvrpManager(self._config_mvrp_core,
+                                                      self.mvrp_batch_window, self.mvrp_max_latency)
+        self.reconciler = OmniSwitchReconciler(self._get_desired_state, self._submit_driver_api)
         self._start_save_config_thread()
 
     def initialize(self, db_obj):
         self.omni_db_obj = db_obj
+        if self.switch_resync_on_start :
+            self._request_resync()
 
     def _load_config(self, conf_file=None):
         """
@@ -149,34 +207,58 @@ class OmniSwitchDevicePluginV2(db_base_plugin_v2.NeutronDbPluginV2):
         if self.switch_save_config_interval < 600 :
             self.switch_save_config_interval = 600
 
+        ### SWITCH_MAX_PARALLEL
+        self.switch_max_parallel = cfg.CONF.DEVICE.switch_max_parallel
+        if self.switch_max_parallel < 1 :
+            self.switch_max_parallel = 1
+
+        ### MVRP_BATCH_WINDOW, MVRP_MAX_LATENCY
+        self.mvrp_batch_window = cfg.CONF.DEVICE.mvrp_batch_window
+        self.mvrp_max_latency = cfg.CONF.DEVICE.mvrp_max_latency
+
+        ### SWITCH_RESYNC_ON_START
+        self.switch_resync_on_start = cfg.CONF.DEVICE.switch_resync_on_start
+
+        ### SWITCH_FAILURE_THRESHOLD, SWITCH_PROBE_INTERVAL
+        self.switch_failure_threshold = cfg.CONF.DEVICE.switch_failure_threshold
+        self.switch_probe_interval = cfg.CONF.DEVICE.switch_probe_interval
+
+        ### SWITCH_SESSION_IDLE_TIMEOUT
+        self.switch_session_idle_timeout = cfg.CONF.DEVICE.switch_session_idle_timeout
+
+        ### SWITCH_PUSH_THRESHOLD
+        self.switch_push_threshold = cfg.CONF.DEVICE.switch_push_threshold
+
+        ### SWITCH_SAVE_MAX_DEFERRAL
+        self.switch_save_max_deferral = cfg.CONF.DEVICE.switch_save_max_deferral
+
+        ### SWITCH_KEEPALIVE_INTERVAL
+        self.switch_keepalive_interval = cfg.CONF.DEVICE.switch_keepalive_interval
+
+        ### SWITCH_TELNET_SESSIONS
+        self.switch_telnet_sessions = {}
+        for entry in cfg.CONF.DEVICE.switch_telnet_sessions:
+            if len(entry.strip()) == 0 :
+                continue
+            try:
+                switch_type, sessions = entry.strip().split(':')
+                self.switch_telnet_sessions[switch_type.strip()] = max(int(sessions), 1)
+            except ValueError:
+                LOG.info("switch_telnet_sessions: invalid entry <%s>, must be <switch-type>:<sessions>", entry)
+
+        ### SWITCH_TELNET_ENGINE_THREADS
+        self.switch_telnet_engine_threads = cfg.CONF.DEVICE.switch_telnet_engine_threads
+        if self.switch_telnet_engine_threads < 0 :
+            self.switch_telnet_engine_threads = 0
+
         LOG.info("_load_config done!")
 
 
     def _load_edge_ddi(self):
         for device in self.edge_device_list:
-            drv_type = self._get_driver_type(device[omni_const.OMNI_CFG_DEV_TYPE])
-            if drv_type == omni_const.OMNISWITCH_7XX or drv_type == omni_const.OMNISWITCH_8XX :
-                if self.switch_access_method == omni_const.OMNI_CFG_SWITCH_ACCESS_REST :
-                    self.edge_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP], 
-                              OmniSwitchRestfulDriver(device[omni_const.OMNI_CFG_DEV_IP],
-                                                     device[omni_const.OMNI_CFG_DEV_LOGIN],
-                                                     device[omni_const.OMNI_CFG_DEV_PASSWORD]))
-                else :
-                    self.edge_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP],
-                              OmniSwitchTelnetDriver(device[omni_const.OMNI_CFG_DEV_IP], False, 
-                                                     device[omni_const.OMNI_CFG_DEV_LOGIN],
-                                                     device[omni_const.OMNI_CFG_DEV_PASSWORD]))
-
-            elif drv_type == omni_const.OMNISWITCH_6XX :
-                self.edge_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP],
-                              OmniSwitchTelnetDriver(device[omni_const.OMNI_CFG_DEV_IP], True,
-                                                     device[omni_const.OMNI_CFG_DEV_LOGIN],
-                                                     device[omni_const.OMNI_CFG_DEV_PASSWORD],
-                                                     device[omni_const.OMNI_CFG_DEV_PROMPT]))
-
-            if self.edge_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]]:
-                self.edge_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]].set_config(self.switch_vlan_name_prefix)
-
+            ddi_obj = self.driver_factory.get_driver(device)
+            if ddi_obj :
+                self.edge_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP], ddi_obj)
 
         LOG.info("_load_edge_ddi done!")
 
@@ -185,51 +267,18 @@ class OmniSwitchDevicePluginV2(db_base_plugin_v2.NeutronDbPluginV2):
             return
 
         for device in self.core_device_list:
-            drv_type = self._get_driver_type(device[omni_const.OMNI_CFG_DEV_TYPE])
-            if drv_type == omni_const.OMNISWITCH_7XX or drv_type == omni_const.OMNISWITCH_8XX :
-                if self.switch_access_method == omni_const.OMNI_CFG_SWITCH_ACCESS_REST :
-                    self.core_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP],
-                             OmniSwitchRestfulDriver(device[omni_const.OMNI_CFG_DEV_IP],
-                                                     device[omni_const.OMNI_CFG_DEV_LOGIN],
-                                                     device[omni_const.OMNI_CFG_DEV_PASSWORD]))
-                else:
-                    self.core_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP],
-                              OmniSwitchTelnetDriver(device[omni_const.OMNI_CFG_DEV_IP], False,
-                                                     device[omni_const.OMNI_CFG_DEV_LOGIN],
-                                                     device[omni_const.OMNI_CFG_DEV_PASSWORD]))
-            elif drv_type == omni_const.OMNISWITCH_6XX :
-                self.core_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP],
-                              OmniSwitchTelnetDriver(device[omni_const.OMNI_CFG_DEV_IP], True,
-                                                     device[omni_const.OMNI_CFG_DEV_LOGIN],
-                                                     device[omni_const.OMNI_CFG_DEV_PASSWORD],
-                                                     device[omni_const.OMNI_CFG_DEV_PROMPT]))
-
-            if self.core_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]]:
-                self.core_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]].set_config(self.switch_vlan_name_prefix)
-        
+            ddi_obj = self.driver_factory.get_driver(device)
+            if ddi_obj :
+                self.core_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP], ddi_obj)
+
         LOG.info("_load_core_ddi done!")
 
     def _load_dhcp_if_inst(self):
         if self.dhcp_service == None:
             return
-        drv_type = self._get_driver_type(self.dhcp_service[omni_const.OMNI_CFG_DEV_TYPE])
-        if drv_type == omni_const.OMNISWITCH_7XX or drv_type == omni_const.OMNISWITCH_8XX :
-            if self.switch_access_method == omni_const.OMNI_CFG_SWITCH_ACCESS_REST :
-                self.dhcp_if_inst = OmniSwitchRestfulDriver(self.dhcp_service[omni_const.OMNI_CFG_DEV_IP],
-                                                     self.dhcp_service[omni_const.OMNI_CFG_DEV_LOGIN],
-                                                     self.dhcp_service[omni_const.OMNI_CFG_DEV_PASSWORD])
-            else:
-                self.dhcp_if_inst = OmniSwitchTelnetDriver(self.dhcp_service[omni_const.OMNI_CFG_DEV_IP], False,
-                                                     self.dhcp_service[omni_const.OMNI_CFG_DEV_LOGIN],
-                                                     self.dhcp_service[omni_const.OMNI_CFG_DEV_PASSWORD])
-        elif drv_type == omni_const.OMNISWITCH_6XX :
-            self.dhcp_if_inst = OmniSwitchTelnetDriver(self.dhcp_service[omni_const.OMNI_CFG_DEV_IP], True,
-                                                     self.dhcp_service[omni_const.OMNI_CFG_DEV_LOGIN],
-                                                     self.dhcp_service[omni_const.OMNI_CFG_DEV_PASSWORD],
-                                                     self.dhcp_service[omni_const.OMNI_CFG_DEV_PROMPT])
 
-        if self.dhcp_if_inst :
-            self.dhcp_if_inst.set_config(self.switch_vlan_name_prefix)
+        # same instance as the edge/core driver if the dhcp switch is one of them
+        self.dhcp_if_inst = self.driver_factory.get_driver(self.dhcp_service)
 
         LOG.info("_load_dhcp_if_inst done!") 
         
@@ -255,14 +304,18 @@ class OmniSwitchDevicePluginV2(db_base_plugin_v2.NeutronDbPluginV2):
         LOG.info("_config_mvrp done!")
 
     def _config_mvrp_core(self, enable):
-        if_list = []
-        for device in self.core_device_list:
-            if enable == 1:
-                self.core_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]].enable_mvrp()
-                time.sleep(2)
-            elif enable == 0:
-                self.core_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]].disable_mvrp()
-                time.sleep(2)
+        if len(self.core_ddi_list) == 0:
+            return True
+
+        if enable == 1:
+            ret = self._invoke_driver_api_all(self.core_ddi_list, "enable_mvrp", [])
+        else:
+            ret = self._invoke_driver_api_all(self.core_ddi_list, "disable_mvrp", [])
+        time.sleep(2)
+
+        if not ret:
+            LOG.info("_config_mvrp_core(%s) failed in %s", enable, ret.failed())
+        return ret
 
     def _config_unp(self):
         for device in self.edge_device_list:
@@ -272,20 +325,21 @@ class OmniSwitchDevicePluginV2(db_base_plugin_v2.NeutronDbPluginV2):
                     self.edge_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]].enable_unp(port)
         LOG.info("_config_unp done!")
 
-    def _config_vpa(self, vlan_id, action, net_name=''):
+    def _config_vpa(self, vlan_id, action, net_name='', journal=None):
         if_list = []
         if self.core_network_config == omni_const.OMNI_CFG_CORE_VPA :
             for device in self.core_device_list:
                 if device[omni_const.OMNI_CFG_DEV_CORE_IF].strip() :
+                    ddi_obj = self.core_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]]
                     if action == omni_const.OMNI_CFG_CREATE :
-                        self.core_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]].create_vlan_locked(vlan_id, net_name)
+                        self._invoke_driver_api(ddi_obj, "create_vlan_locked", [vlan_id, net_name], journal)
                     elif action == omni_const.OMNI_CFG_DELETE :
-                        self.core_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]].delete_vlan_locked(vlan_id)
+                        self._invoke_driver_api(ddi_obj, "delete_vlan_locked", [vlan_id])
 
                     if_list = device[omni_const.OMNI_CFG_DEV_CORE_IF].split(' ')
                     for port in if_list:
                         if action == omni_const.OMNI_CFG_CREATE :
-                            self.core_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]].create_vpa(vlan_id, port)
+                            self._invoke_driver_api(ddi_obj, "create_vpa", [vlan_id, port], journal)
                         #elif action == omni_const.OMNI_CFG_DELETE :
                         #    #self.core_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]].delete_vpa(vlan_id, port)
 
@@ -294,7 +348,8 @@ class OmniSwitchDevicePluginV2(db_base_plugin_v2.NeutronDbPluginV2):
                     if_list = device[omni_const.OMNI_CFG_DEV_EDGE2CORE_IF].split(' ')
                     for port in if_list:
                         if action == omni_const.OMNI_CFG_CREATE :
-                            self.edge_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]].create_vpa(vlan_id, port)
+                            self._invoke_driver_api(self.edge_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]],
+                                                    "create_vpa", [vlan_id, port], journal)
                         #elif action == omni_const.OMNI_CFG_DELETE :
                         #    self.edge_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]].delete_vpa(vlan_id, port)
         return True  ### _config_vpa
@@ -304,45 +359,212 @@ class OmniSwitchDevicePluginV2(db_base_plugin_v2.NeutronDbPluginV2):
         if self.core_network_config == omni_const.OMNI_CFG_CORE_MVRP :
             self._config_mvrp()
         self._config_unp()
+        for ddi_obj in self.edge_ddi_list.values() + self.core_ddi_list.values():
+            self._mark_dirty(ddi_obj)
         self.save_config()
 
     def save_core_config(self, immediate=0):
         if immediate == 0:
-            self.core_config_changed = 1
-            return
+            return # modified core switches are already marked dirty, they are saved by SaveConfigThread
 
-        for device in self.core_device_list:
-            ddi_obj = self.core_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]]
-            ret = self._invoke_driver_api(ddi_obj, "save_config", [])
-            #self.core_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]].save_config()
-
-        self.core_config_changed = 0 
+        self._save_dirty_config(self.core_ddi_list.values())
         return
 
     def save_edge_config(self, immediate=0):
         if immediate == 0:
-            self.edge_config_changed = 1
-            return
-
-        for device in self.edge_device_list:
-            ddi_obj = self.edge_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]]
-            ret = self._invoke_driver_api(ddi_obj, "save_config", [])
-            #self.edge_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]].save_config()
+            return # modified edge switches are already marked dirty, they are saved by SaveConfigThread
 
-        self.edge_config_changed = 0
+        self._save_dirty_config(self.edge_ddi_list.values())
         return
     
     def save_config(self):
-        if self.core_config_changed == 1:
-            self.save_core_config(1)
-     
-        if self.edge_config_changed == 1:
-            self.save_edge_config(1)
+        self._save_dirty_config()
+
+    def _mark_dirty(self, ddi_obj):
+        self.dirty_lock.acquire(1)
+        self.dirty_switches.add(ddi_obj)
+        self.dirty_lock.release()
+
+    def _save_dirty_config(self, ddi_objs=None):
+        """ saves the config, concurrently, only in the switches that were modified.
+            if ddi_objs is given, only those of them which are dirty are saved """
+        self.dirty_lock.acquire(1)
+        if ddi_objs is None:
+            targets = list(self.dirty_switches)
+        else:
+            targets = [ddi_obj for ddi_obj in ddi_objs if ddi_obj in self.dirty_switches]
+        self.dirty_switches.difference_update(targets)
+        self.dirty_lock.release()
+
+        if len(targets) == 0:
+            return True
+
+        # queued behind the pending ops of each switch, so that they are saved as well, at low
+        # priority: the provisioning ops queued after it go first, up to switch_save_max_deferral.
+        # ops queued after this mark the switch dirty again for the next save.
+        ops = {}
+        for ddi_obj in targets:
+            ops[ddi_obj] = self._get_op_queue(ddi_obj).submit("save_config", [], True)
+        result = OmniSwitchFanOutResult.gather(ops)
+
+        for ddi_obj in result.failed():
+            LOG.info("save_config failed in %s, will be retried", ddi_obj.switch_ip)
+            self._mark_dirty(ddi_obj)
+        return result
+
+    def resync(self):
+        """ brings the OpenStack config of the switches in line with the DB. only the difference
+            between what is in the switch and what should be is pushed """
+        LOG.info("resync started!")
+        down = self.health_monitor.get_down_switches()
+        if len(down):
+            LOG.info("resync: %s unreachable, skipped until they are back", down)
+        plan = self.reconciler.plan()
+        mvrp = self.core_network_config == omni_const.OMNI_CFG_CORE_MVRP and \
+               self.reconciler.has_vlan_changes(plan)
+        if mvrp :
+            self.mvrp_manager.begin()
+        try:
+            ret = self.reconciler.apply(plan)
+        finally:
+            if mvrp :
+                self.mvrp_manager.end()
+
+        if not ret:
+            LOG.info("resync failed in %s", ret.failed())
+        self.save_config()
+        LOG.info("resync done!")
+        return ret
+
+    def _request_resync(self):
+        """ runs resync in the background; requests made while it runs are folded into one more run """
+        self.resync_lock.acquire(1)
+        self.resync_pending = True
+        if not self.resync_running:
+            self.resync_running = True
+            resync_thread = threading.Thread(target=self._resync_worker)
+            resync_thread.daemon = True
+            resync_thread.start()
+        self.resync_lock.release()
+
+    def _resync_worker(self):
+        while True:
+            self.resync_lock.acquire(1)
+            if not self.resync_pending:
+                self.resync_running = False
+                self.resync_lock.release()
+                return
+            self.resync_pending = False
+            self.resync_lock.release()
+
+            try:
+                self.resync()
+            except Exception, e:
+                LOG.info("resync failed! [%s]", e)
+
+    def _switch_recovered(self, ddi_obj):
+        # the switches which can be read back are repaired from the DB, in the others the
+        # deletions that failed while it was down are sent again
+        if not hasattr(ddi_obj, 'get_config_state'):
+            LOG.info("switch %s recovered, %d failed deletions sent again", ddi_obj.switch_ip,
+                     self._get_op_queue(ddi_obj).replay_failed())
+            return
+        LOG.info("switch %s recovered, resync requested", ddi_obj.switch_ip)
+        self._request_resync()
+
+    def _get_desired_state(self):
+        """ returns {ddi_obj: OmniSwitchConfigState} as per the networks and ports in the DB """
+        states = {}
+        for ddi_obj in self.edge_ddi_list.values() + self.core_ddi_list.values():
+            states.setdefault(ddi_obj, OmniSwitchConfigState())
+        if self.dhcp_if_inst :
+            states.setdefault(self.dhcp_if_inst, OmniSwitchConfigState())
+
+        admin_context = get_admin_context()
+        vlans = {} # network id -> vlan_id
+        for network in super(OmniSwitchDevicePluginV2, self).get_networks(admin_context):
+            binding = self.omni_db_obj.get_network_binding(admin_context.session, network['id'])
+            if binding is None or binding.segmentation_id is None:
+                continue
+            vlan_id = int(binding.segmentation_id)
+            vlans[network['id']] = vlan_id
+
+            for ddi_obj in self.edge_ddi_list.values():
+                states[ddi_obj].vlans[vlan_id] = network['name']
+                states[ddi_obj].unp_vlans.add(vlan_id)
+                if self.host_classification == omni_const.OMNI_CFG_HOST_CLASS_VTAG :
+                    states[ddi_obj].vlan_rules.add(vlan_id)
+
+            if self.core_network_config == omni_const.OMNI_CFG_CORE_VPA :
+                for device in self.core_device_list:
+                    if device[omni_const.OMNI_CFG_DEV_CORE_IF].strip() :
+                        state = states[self.core_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]]]
+                        state.vlans[vlan_id] = network['name']
+                        for port in device[omni_const.OMNI_CFG_DEV_CORE_IF].split(' '):
+                            state.add_vpa(vlan_id, port)
+                for device in self.edge_device_list:
+                    if device[omni_const.OMNI_CFG_DEV_EDGE2CORE_IF].strip() :
+                        state = states[self.edge_ddi_list[device[omni_const.OMNI_CFG_DEV_IP]]]
+                        for port in device[omni_const.OMNI_CFG_DEV_EDGE2CORE_IF].split(' '):
+                            state.add_vpa(vlan_id, port)
+
+            if self.dhcp_if_inst :
+                states[self.dhcp_if_inst].add_vpa(vlan_id, self.dhcp_service[omni_const.OMNI_CFG_DHCP_SERVER_IF])
+
+        if self.host_classification == omni_const.OMNI_CFG_HOST_CLASS_MAC :
+            for port in super(OmniSwitchDevicePluginV2, self).get_ports(admin_context):
+                if port['network_id'] not in vlans:
+                    continue
+                for ddi_obj in self.edge_ddi_list.values():
+                    states[ddi_obj].mac_rules.add((vlans[port['network_id']], str(port['mac_address']).lower()))
+        return states
 
     """ Neutron Core API 2.0 """
 
     def create_network_bulk(self, context, networks):
-        pass
+        """ creates all the networks with one session per switch. returns a list with the result
+            of each network in 'networks'; if any failed, none of them is left in the switches """
+        net_list = []
+        for network in networks:
+            binding = self.omni_db_obj.get_network_binding(context.session, network['id'])
+            net_list.append((binding.segmentation_id, network['network']['name']))
+        rets = [True] * len(net_list)
+        journals = [OmniSwitchOpJournal() for i in range(0, len(net_list))]
+
+        if self.core_network_config == omni_const.OMNI_CFG_CORE_MVRP :
+            self.mvrp_manager.begin() # disable mvrp in core before start creating networks
+        try:
+            self._invoke_driver_api_bulk(self.edge_ddi_list, "create_network_bulk", net_list, rets, journals)
+            if self.host_classification == omni_const.OMNI_CFG_HOST_CLASS_VTAG :
+                self._invoke_driver_api_bulk(self.edge_ddi_list, "create_port_bulk",
+                                             [(vlan_id, None) for vlan_id, net_name in net_list], rets, journals)
+        finally:
+            if self.core_network_config == omni_const.OMNI_CFG_CORE_MVRP :
+                self.mvrp_manager.end() # mvrp in core is enabled once the batching window is over
+
+        for i in range(0, len(net_list)):
+            vlan_id, network_name = net_list[i]
+            if rets[i] and self.core_network_config == omni_const.OMNI_CFG_CORE_VPA :
+                rets[i] = self._config_vpa(vlan_id, 1, network_name, journals[i])
+            if rets[i] and self.dhcp_if_inst :
+                rets[i] = self._invoke_driver_api(self.dhcp_if_inst, "create_vpa",
+                                                  [vlan_id, self.dhcp_service[omni_const.OMNI_CFG_DHCP_SERVER_IF]],
+                                                  journals[i])
+
+        # all or nothing: if any network failed, the whole bulk is rolled back in the switches
+        if False in rets:
+            rollback = OmniSwitchOpJournal()
+            for i in range(0, len(net_list)):
+                if not rets[i]:
+                    LOG.info("create_network_bulk: network %s failed!", networks[i]['id'])
+                rollback.extend(journals[i])
+            self._rollback(rollback)
+            rets = [False] * len(net_list)
+
+        if self.core_network_config == omni_const.OMNI_CFG_CORE_VPA :
+            self.save_core_config()
+        self.save_edge_config()
+        return rets
 
 
     def create_network(self, context, network):
@@ -350,42 +572,40 @@ class OmniSwitchDevicePluginV2(db_base_plugin_v2.NeutronDbPluginV2):
         binding = self.omni_db_obj.get_network_binding(context.session, network['id'])
         vlan_id = binding.segmentation_id
         network_name = network['network']['name']
+        journal = OmniSwitchOpJournal()
 
         if self.core_network_config == omni_const.OMNI_CFG_CORE_MVRP :
-            self._config_mvrp_core(0) # disable mvrp in core before start creating network
-
-        for ddi_key, ddi_obj in self.edge_ddi_list.items():
-            #if ddi_obj.create_network(vlan_id) :
-            if self._invoke_driver_api(ddi_obj, "create_network", [vlan_id, network_name]):
-                if self.host_classification == omni_const.OMNI_CFG_HOST_CLASS_VTAG :
-                    ret = self._invoke_driver_api(ddi_obj, "create_port", [binding.segmentation_id])
-                    #ret = ddi_obj.create_port(binding.segmentation_id)
-            else:
-                ret = False
-
-            if not ret:
-                # some error in create network, roll back network creation
-                self.delete_network(context, network['id']) #vad: optimize only for that switch
-                self.save_edge_config() 
-                return False
-
-        if self.core_network_config == omni_const.OMNI_CFG_CORE_MVRP :
-            self._config_mvrp_core(1) # enable mvrp in core after network creation
+            self.mvrp_manager.begin() # disable mvrp in core before start creating network
+        try:
+            ret = self._invoke_driver_api_all(self.edge_ddi_list, "create_network", [vlan_id, network_name], journal)
+            if ret and self.host_classification == omni_const.OMNI_CFG_HOST_CLASS_VTAG :
+                ret = self._invoke_driver_api_all(self.edge_ddi_list, "create_port", [binding.segmentation_id], journal)
+        finally:
+            if self.core_network_config == omni_const.OMNI_CFG_CORE_MVRP :
+                self.mvrp_manager.end() # mvrp in core is enabled once the batching window is over
+
+        if not ret:
+            # some error in create network, roll back network creation in the switches that got it
+            LOG.info("create_network failed in %s", ret.failed())
+            self._rollback(journal)
+            self.save_edge_config() 
+            return False
 
         if self.core_network_config == omni_const.OMNI_CFG_CORE_VPA :
-            if not self._config_vpa(vlan_id, 1, network_name):
+            if not self._config_vpa(vlan_id, 1, network_name, journal):
                 # some error in vpa creation, roll back network creation
-                self.delete_network(context, network['id'])
+                self._rollback(journal)
                 self.save_edge_config()
                 return False
             else:
                 self.save_core_config()
 
         if self.dhcp_if_inst :
-            if not self.dhcp_if_inst.create_vpa(vlan_id, self.dhcp_service[omni_const.OMNI_CFG_DHCP_SERVER_IF]):
+            if not self._invoke_driver_api(self.dhcp_if_inst, "create_vpa",
+                                           [vlan_id, self.dhcp_service[omni_const.OMNI_CFG_DHCP_SERVER_IF]], journal):
                 # some error in vpa creation for dhcp, roll back network creation
-                self.delete_network(context, network['id'])
-                self.save_edge_config() # vad: optimize only for that switch
+                self._rollback(journal)
+                self.save_edge_config()
                 return False
 
         self.save_edge_config()
@@ -417,12 +637,9 @@ class OmniSwitchDevicePluginV2(db_base_plugin_v2.NeutronDbPluginV2):
             else:
                 self.save_core_config()
 
-        for ddi_key, ddi_obj in self.edge_ddi_list.items():
-            if self.host_classification == omni_const.OMNI_CFG_HOST_CLASS_VTAG :
-                #ddi_obj.delete_port(vlan_id)
-                self._invoke_driver_api(ddi_obj, "delete_port", [vlan_id])
-            #ddi_obj.delete_network(vlan_id)
-            self._invoke_driver_api(ddi_obj, "delete_network", [vlan_id])
+        if self.host_classification == omni_const.OMNI_CFG_HOST_CLASS_VTAG :
+            self._invoke_driver_api_all(self.edge_ddi_list, "delete_port", [vlan_id])
+        self._invoke_driver_api_all(self.edge_ddi_list, "delete_network", [vlan_id])
 
         #if self.dhcp_if_inst :
         #    self.dhcp_if_inst.delete_vpa(vlan_id, self.dhcp_server_if)
@@ -482,18 +699,44 @@ class OmniSwitchDevicePluginV2(db_base_plugin_v2.NeutronDbPluginV2):
         pass
 
     def create_port_bulk(self, context, ports):
-        pass
+        """ creates all the ports with one session per switch. returns a list with the result
+            of each port in 'ports'; if any failed, none of them is left in the switches """
+        rets = [True] * len(ports)
+        if self.host_classification != omni_const.OMNI_CFG_HOST_CLASS_MAC :
+            return rets
+        journals = [OmniSwitchOpJournal() for i in range(0, len(ports))]
+
+        bindings = {}
+        port_list = []
+        for port in ports:
+            if port['network_id'] not in bindings:
+                bindings[port['network_id']] = self.omni_db_obj.get_network_binding(context.session,
+                                                                                    port['network_id'])
+            port_list.append((bindings[port['network_id']].segmentation_id, port['mac_address']))
+
+        self._invoke_driver_api_bulk(self.edge_ddi_list, "create_port_bulk", port_list, rets, journals)
+
+        # all or nothing: if any port failed, the mac-rules of the whole bulk are removed
+        if False in rets:
+            rollback = OmniSwitchOpJournal()
+            for i in range(0, len(port_list)):
+                if not rets[i]:
+                    LOG.info("create_port_bulk: port %s failed!", ports[i]['id'])
+                rollback.extend(journals[i])
+            self._rollback(rollback)
+            rets = [False] * len(port_list)
+
+        self.save_edge_config()
+        return rets
 
     def create_port(self, context, port):
         binding = self.omni_db_obj.get_network_binding(context.session, port['network_id'])
-        for ddi_key, ddi_obj in self.edge_ddi_list.items(): 
-            if self.host_classification == omni_const.OMNI_CFG_HOST_CLASS_MAC :
-                if not self._invoke_driver_api(ddi_obj, "create_port", [binding.segmentation_id, port['mac_address']]):
-                    return False
-                """
-                if not ddi_obj.create_port(binding.segmentation_id, port['mac_address']):
-                    return False
-                """
+        if self.host_classification == omni_const.OMNI_CFG_HOST_CLASS_MAC :
+            ret = self._invoke_driver_api_all(self.edge_ddi_list, "create_port",
+                                              [binding.segmentation_id, port['mac_address']])
+            if not ret:
+                LOG.info("create_port failed in %s", ret.failed())
+                return False
 
         self.save_edge_config()
         return True
@@ -511,9 +754,8 @@ class OmniSwitchDevicePluginV2(db_base_plugin_v2.NeutronDbPluginV2):
             return True
 
         binding = self.omni_db_obj.get_network_binding(context.session, openport['network_id'])
-        for ddi_key, ddi_obj in self.edge_ddi_list.items():
-            self._invoke_driver_api(ddi_obj, "delete_port", [binding.segmentation_id, openport['mac_address']])
-            #ddi_obj.delete_port(binding.segmentation_id, openport['mac_address'])
+        self._invoke_driver_api_all(self.edge_ddi_list, "delete_port",
+                                    [binding.segmentation_id, openport['mac_address']])
 
         self.save_edge_config()
         return True
@@ -528,21 +770,62 @@ class OmniSwitchDevicePluginV2(db_base_plugin_v2.NeutronDbPluginV2):
         pass
 
     # Utility routines
-    def _get_driver_type(self, switch_type):
-        if switch_type == omni_const.OMNISWITCH_OS6860:
-            return omni_const.OMNISWITCH_8XX
-        elif switch_type == omni_const.OMNISWITCH_OS6900 or \
-           switch_type == omni_const.OMNISWITCH_OS10K:
-            return omni_const.OMNISWITCH_7XX
-        elif switch_type == omni_const.OMNISWITCH_OS6850E or \
-             switch_type == omni_const.OMNISWITCH_OS6855 or \
-             switch_type == omni_const.OMNISWITCH_OS6450 or \
-             switch_type == omni_const.OMNISWITCH_OS9000:
-            return omni_const.OMNISWITCH_6XX
-
-    def _invoke_driver_api(self, drvobj, function_name, args):
-        #return thread.start_new_thread(getattr(drvobj, function_name), tuple(args))
-        return getattr(drvobj, function_name)(*args)
+    def _get_op_queue(self, drvobj):
+        self.op_queues_lock.acquire(1)
+        if drvobj not in self.op_queues:
+            self.op_queues[drvobj] = OmniSwitchOpQueue(drvobj.switch_ip, drvobj,
+                                                       self.health_monitor.get_health(drvobj),
+                                                       self.switch_save_max_deferral, self.op_workers)
+        op_queue = self.op_queues[drvobj]
+        self.op_queues_lock.release()
+        return op_queue
+
+    def _submit_driver_api(self, drvobj, function_name, args):
+        op = self._get_op_queue(drvobj).submit(function_name, args)
+        if not function_name.startswith('get_'):
+            # marked after queueing, so a save queued meanwhile can not miss this op
+            self._mark_dirty(drvobj)
+        return op
+
+    def _invoke_driver_api(self, drvobj, function_name, args, journal=None):
+        ret = self._submit_driver_api(drvobj, function_name, args).wait()
+        if journal is not None:
+            journal.record(drvobj, function_name, args, bool(ret))
+        return ret
+
+    def _invoke_driver_api_bulk(self, ddi_list, function_name, items, rets, journals=None):
+        """ dispatches the bulk driver api with the items that have not failed yet (rets[i] is True)
+            to all the switches in ddi_list. rets[i] is cleared if the item failed in any switch.
+            the outcome of the items in each switch is recorded in journals[i] as single ops """
+        index_list = [i for i in range(0, len(items)) if rets[i]]
+        if len(index_list) == 0:
+            return
+
+        result = self._invoke_driver_api_all(ddi_list, function_name, [[items[i] for i in index_list]])
+        for switch_ip, switch_rets in result.results.items():
+            if not isinstance(switch_rets, list):
+                switch_rets = [False] * len(index_list)
+            for j in range(0, len(index_list)):
+                if not switch_rets[j]:
+                    rets[index_list[j]] = False
+                if journals is not None:
+                    journals[index_list[j]].record(ddi_list[switch_ip], function_name.replace('_bulk', ''),
+                                                   items[index_list[j]], bool(switch_rets[j]))
+
+    def _invoke_driver_api_all(self, ddi_list, function_name, args, journal=None):
+        """ dispatches the driver api to all the switches in ddi_list concurrently.
+            returns OmniSwitchFanOutResult which is True only if all the switches succeeded """
+        ops = {}
+        for ddi_key, ddi_obj in ddi_list.items():
+            ops[ddi_key] = self._submit_driver_api(ddi_obj, function_name, args)
+        result = OmniSwitchFanOutResult.gather(ops)
+        if journal is not None:
+            journal.record_result(ddi_list, function_name, args, result)
+        return result
+
+    def _rollback(self, journal):
+        """ undoes the ops recorded in the journal, in parallel across the switches """
+        return journal.rollback(self._submit_driver_api)
 
 
 
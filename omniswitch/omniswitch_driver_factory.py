@@ -0,0 +1,156 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: omniswitch_driver_factory.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+import logging
+import threading
+
+from neutron.plugins.omniswitch import omniswitch_constants as omni_const
+from neutron.plugins.omniswitch.omniswitch_restful_driver import OmniSwitchRestfulDriver
+from neutron.plugins.omniswitch.omniswitch_telnet_driver import OmniSwitchTelnetDriver
+from neutron.plugins.omniswitch.omniswitch_telnet_engine import OmniSwitchTelnetEngine
+
+LOG = logging.getLogger(__name__)
+
+
+class OmniSwitchDriverFactory(object):
+
+    """
+    Name:        OmniSwitchDriverFactory
+    Description: Registry of the device driver instances (ddi), one per physical switch.
+
+    Details:     A switch may appear in the config more than once, for example as an edge switch
+                 and as the dhcp_server_interface switch. The driver for a switch is built the
+                 first time it is asked for, keyed by its management ip, and the same instance
+                 (along with its lock and session) is returned for every role of that switch.
+                 The first config entry of a switch decides its driver type and credentials.
+                 If 'switch_telnet_engine_threads' is set, the CLI sessions of the telnet drivers
+                 are run by that many OmniSwitchTelnetEngine, the switches spread among them.
+    """
+
+    switch_access_method = ''
+    switch_vlan_name_prefix = None
+    switch_session_idle_timeout = None
+    switch_push_threshold = None
+    switch_keepalive_interval = None
+    switch_telnet_sessions = None # switch type -> size of the session pool of its telnet driver
+    switch_telnet_engine_threads = 0
+
+    def __init__(self, switch_access_method, switch_vlan_name_prefix=None, switch_session_idle_timeout=None,
+                 switch_push_threshold=None, switch_keepalive_interval=None, switch_telnet_sessions=None,
+                 switch_telnet_engine_threads=0):
+        self.switch_access_method = switch_access_method
+        self.switch_vlan_name_prefix = switch_vlan_name_prefix
+        self.switch_session_idle_timeout = switch_session_idle_timeout
+        self.switch_push_threshold = switch_push_threshold
+        self.switch_keepalive_interval = switch_keepalive_interval
+        self.switch_telnet_sessions = switch_telnet_sessions
+        self.switch_telnet_engine_threads = switch_telnet_engine_threads
+        self.drivers = {} # switch ip -> ddi
+        self.telnet_engines = []
+        self.telnet_drivers = 0 # telnet drivers created so far, to spread them among the engines
+        self.lock = threading.Lock()
+
+    def get_driver(self, device):
+        """ device is a config entry, ie, <switch-ip>:<switch-type>:<user-name>:... split by ':' """
+        switch_ip = device[omni_const.OMNI_CFG_DEV_IP].strip()
+        self.lock.acquire(1)
+        try:
+            if switch_ip not in self.drivers:
+                ddi_obj = self._create_driver(device)
+                if ddi_obj is None:
+                    return None
+                self.drivers[switch_ip] = ddi_obj
+            return self.drivers[switch_ip]
+        finally:
+            self.lock.release()
+
+    def get_drivers(self):
+        self.lock.acquire(1)
+        drivers = self.drivers.values()
+        self.lock.release()
+        return drivers
+
+    def get_driver_type(self, switch_type):
+        switch_type = switch_type.strip()
+        if switch_type == omni_const.OMNISWITCH_OS6860:
+            return omni_const.OMNISWITCH_8XX
+        elif switch_type == omni_const.OMNISWITCH_OS6900 or \
+           switch_type == omni_const.OMNISWITCH_OS10K:
+            return omni_const.OMNISWITCH_7XX
+        elif switch_type == omni_const.OMNISWITCH_OS6850E or \
+             switch_type == omni_const.OMNISWITCH_OS6855 or \
+             switch_type == omni_const.OMNISWITCH_OS6450 or \
+             switch_type == omni_const.OMNISWITCH_OS9000:
+            return omni_const.OMNISWITCH_6XX
+
+
+    #####   Internal Utility functions #####
+
+    def _get_telnet_engine(self):
+        """ the engines are started as needed, up to switch_telnet_engine_threads """
+        index = self.telnet_drivers % self.switch_telnet_engine_threads
+        self.telnet_drivers += 1
+        if index == len(self.telnet_engines):
+            self.telnet_engines.append(OmniSwitchTelnetEngine())
+        return self.telnet_engines[index]
+
+    def _create_driver(self, device):
+        ddi_obj = None
+        drv_type = self.get_driver_type(device[omni_const.OMNI_CFG_DEV_TYPE])
+        if drv_type == omni_const.OMNISWITCH_7XX or drv_type == omni_const.OMNISWITCH_8XX :
+            if self.switch_access_method == omni_const.OMNI_CFG_SWITCH_ACCESS_REST :
+                ddi_obj = OmniSwitchRestfulDriver(device[omni_const.OMNI_CFG_DEV_IP],
+                                                  device[omni_const.OMNI_CFG_DEV_LOGIN],
+                                                  device[omni_const.OMNI_CFG_DEV_PASSWORD])
+                if self.switch_session_idle_timeout is not None:
+                    ddi_obj.set_session_idle_timeout(self.switch_session_idle_timeout)
+                if self.switch_push_threshold is not None:
+                    ddi_obj.set_push_threshold(self.switch_push_threshold)
+            else:
+                ddi_obj = OmniSwitchTelnetDriver(device[omni_const.OMNI_CFG_DEV_IP], False,
+                                                 device[omni_const.OMNI_CFG_DEV_LOGIN],
+                                                 device[omni_const.OMNI_CFG_DEV_PASSWORD])
+        elif drv_type == omni_const.OMNISWITCH_6XX :
+            ddi_obj = OmniSwitchTelnetDriver(device[omni_const.OMNI_CFG_DEV_IP], True,
+                                             device[omni_const.OMNI_CFG_DEV_LOGIN],
+                                             device[omni_const.OMNI_CFG_DEV_PASSWORD],
+                                             device[omni_const.OMNI_CFG_DEV_PROMPT])
+        else:
+            LOG.info("Unknown switch type %s for %s!", device[omni_const.OMNI_CFG_DEV_TYPE],
+                     device[omni_const.OMNI_CFG_DEV_IP])
+            return None
+
+        if isinstance(ddi_obj, OmniSwitchTelnetDriver):
+            if self.switch_telnet_engine_threads > 0:
+                ddi_obj.set_engine(self._get_telnet_engine())
+            if self.switch_keepalive_interval is not None:
+                ddi_obj.set_keepalive_interval(self.switch_keepalive_interval)
+            if self.switch_telnet_sessions:
+                ddi_obj.set_session_pool_size(self.switch_telnet_sessions.get(
+                                              device[omni_const.OMNI_CFG_DEV_TYPE].strip(), 1))
+        if self.switch_vlan_name_prefix is not None:
+            ddi_obj.set_config(self.switch_vlan_name_prefix)
+        return ddi_obj
@@ -0,0 +1,66 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: omniswitch_fanout.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+
+class OmniSwitchFanOutResult(object):
+
+    """
+    Name:        OmniSwitchFanOutResult
+    Description: Aggregate result of one driver call dispatched to several switches.
+
+    Details:     Holds the return value of the driver call for each switch (keyed by switch ip).
+                 It evaluates to True only if the call succeeded in every switch, so that the
+                 device plugin can use it just like the return value of a single driver call.
+                 The calls themselves run in the OmniSwitchOpQueue of each switch, gather()
+                 waits for them.
+    """
+
+    def __init__(self):
+        self.results = {} # switch ip -> return value of the driver call
+
+    def set_result(self, switch_ip, ret):
+        self.results[switch_ip] = ret
+
+    def succeeded(self):
+        return [switch_ip for switch_ip, ret in self.results.items() if ret]
+
+    def failed(self):
+        return [switch_ip for switch_ip, ret in self.results.items() if not ret]
+
+    def __nonzero__(self):
+        return len(self.failed()) == 0
+
+    @classmethod
+    def gather(cls, ops):
+        """ ops is {key: op}, op being anything with wait(). waits for all of them """
+        result = cls()
+        for key, op in ops.items():
+            result.set_result(key, op.wait())
+        return result
@@ -0,0 +1,151 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: omniswitch_health.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+import logging
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+
+class OmniSwitchHealth(object):
+
+    """
+    Name:        OmniSwitchHealth
+    Description: Circuit breaker for one switch.
+
+    Details:     CLOSED    - the switch is reachable, calls go through.
+                 OPEN      - 'failure_threshold' calls in a row could not reach the switch. Calls
+                             fail fast instead of waiting for the connect timeout.
+                 HALF_OPEN - a background probe is checking the switch; calls still fail fast.
+                             If the probe succeeds, the breaker is CLOSED and 'on_recover(ddi_obj)'
+                             is called, otherwise it is OPEN again.
+                 Only connection failures count, a command rejected by the switch does not.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, ddi_obj, failure_threshold, on_recover=None):
+        self.ddi_obj = ddi_obj
+        self.failure_threshold = max(failure_threshold, 1)
+        self.on_recover = on_recover
+        self.state = self.CLOSED
+        self.failures = 0 # consecutive connection failures
+        self.lock = threading.Lock()
+
+    def allow(self):
+        return self.state == self.CLOSED
+
+    def record_success(self):
+        self.lock.acquire(1)
+        recovered = self.state != self.CLOSED
+        self.state = self.CLOSED
+        self.failures = 0
+        self.lock.release()
+
+        if recovered:
+            LOG.info("switch %s is reachable again", self.ddi_obj.switch_ip)
+            if self.on_recover:
+                self.on_recover(self.ddi_obj)
+
+    def record_failure(self):
+        self.lock.acquire(1)
+        self.failures += 1
+        if self.state == self.CLOSED and self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            LOG.info("switch %s is unreachable, calls to it fail fast until it is back", self.ddi_obj.switch_ip)
+        self.lock.release()
+
+    def probe(self):
+        self.lock.acquire(1)
+        if self.state != self.OPEN:
+            self.lock.release()
+            return
+        self.state = self.HALF_OPEN
+        self.lock.release()
+
+        try:
+            ret = self.ddi_obj.probe()
+        except Exception, e:
+            LOG.info("probe of %s failed! [%s]", self.ddi_obj.switch_ip, e)
+            ret = False
+
+        if ret:
+            self.record_success()
+        else:
+            self.lock.acquire(1)
+            self.state = self.OPEN
+            self.lock.release()
+
+
+class OmniSwitchHealthMonitor(object):
+
+    """
+    Name:        OmniSwitchHealthMonitor
+    Description: Keeps the OmniSwitchHealth of every switch and probes the unreachable ones.
+
+    Details:     A background thread probes, every 'probe_interval' secs, the switches whose
+                 breaker is OPEN, using the probe() method of their driver.
+    """
+
+    def __init__(self, failure_threshold, probe_interval, on_recover=None):
+        self.failure_threshold = failure_threshold
+        self.probe_interval = max(probe_interval, 1)
+        self.on_recover = on_recover
+        self.health = {} # ddi_obj -> OmniSwitchHealth
+        self.lock = threading.Lock()
+
+        self.worker = threading.Thread(target=self._worker)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def get_health(self, ddi_obj):
+        self.lock.acquire(1)
+        if ddi_obj not in self.health:
+            self.health[ddi_obj] = OmniSwitchHealth(ddi_obj, self.failure_threshold, self.on_recover)
+        health = self.health[ddi_obj]
+        self.lock.release()
+        return health
+
+    def get_down_switches(self):
+        self.lock.acquire(1)
+        down = [ddi_obj.switch_ip for ddi_obj, health in self.health.items() if not health.allow()]
+        self.lock.release()
+        return down
+
+
+    #####   Internal Utility functions #####
+
+    def _worker(self):
+        while True:
+            time.sleep(self.probe_interval)
+            self.lock.acquire(1)
+            down = [health for health in self.health.values() if health.state == OmniSwitchHealth.OPEN]
+            self.lock.release()
+            for health in down:
+                health.probe()
@@ -0,0 +1,136 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: omniswitch_mib_batch.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+
+class OmniSwitchMibBatch(object):
+
+    """
+    Name:        OmniSwitchMibBatch
+    Description: Collects MIB row writes for one switch and sends them in one session.
+
+    Details:     Rows are added with add(method, table, objects, nkeys, after) where 'method' is
+                 put (create), post (modify) or delete, 'objects' the list of 'mibObject:value'
+                 and the first 'nkeys' objects identify the row. execute() sends them in order:
+                    - consecutive writes with the same method to the same row are merged into
+                      one request, their objects are sent together.
+                    - a row added with 'after' set to another row is skipped if that row failed,
+                      eg, the unp profile of a vlan that could not be created.
+                    - once a request gets no answer (diag 0, the connection failed), the rows
+                      left are skipped instead of each waiting for the connection to fail.
+                 The outcome of every row is kept, see succeeded() and errors().
+                 'request(method, domain, urn, args)' must send the request in the logged-in
+                 session of the switch and return an AOSResult.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.rows = [] # [method, table, objects, nkeys, after]
+        self.results = [] # AOSResult of each row, None if skipped
+        self.requests_sent = 0
+
+    def add(self, method, table, objects, nkeys=1, after=None):
+        """ returns the row number, to be used for 'after' and for the outcome of the row """
+        self.rows.append([method, table, list(objects), nkeys, after])
+        return len(self.rows) - 1
+
+    def execute(self):
+        """ sends the rows. returns True if all of them succeeded """
+        self.results = [None] * len(self.rows)
+        self.requests_sent = 0
+        i = 0
+        while i < len(self.rows):
+            if not self._runnable(i):
+                i += 1
+                continue
+
+            method, table, objects, nkeys, after = self.rows[i]
+            merged = [i]
+            objects = list(objects)
+            j = i + 1
+            while j < len(self.rows) and self._same_row(i, j) and self._runnable(j, merged):
+                objects = self._merge_objects(objects, self.rows[j][2], nkeys)
+                merged.append(j)
+                j += 1
+
+            args = {}
+            for k in range(0, len(objects)):
+                args['mibObject'+str(k)] = objects[k]
+            results = self.request(method, 'mib', table, args)
+            self.requests_sent += 1
+            for k in merged:
+                self.results[k] = results
+            if results.diag() == 0:
+                LOG.info("mib batch: connection lost, %d rows skipped", len(self.rows) - j)
+                break
+            i = j
+
+        LOG.info("mib batch: %d rows sent in %d requests, %d failed", len(self.rows),
+                 self.requests_sent, len(self.failed()))
+        return len(self.failed()) == 0
+
+    def succeeded(self, row):
+        return self.results[row] is not None and self.results[row].success()
+
+    def errors(self, row):
+        if self.results[row] is None:
+            return 'skipped'
+        return self.results[row].errors()
+
+    def failed(self):
+        return [i for i in range(0, len(self.results)) if not self.succeeded(i)]
+
+
+    #####   Internal Utility functions #####
+
+    def _runnable(self, row, sending=()):
+        """ a row runs unless the row it depends on failed. 'sending' are the rows merged in
+            the request being built, whose outcome is not known yet """
+        after = self.rows[row][4]
+        if after is None or after in sending:
+            return True
+        return self.succeeded(after)
+
+    def _same_row(self, i, j):
+        method_i, table_i, objects_i, nkeys_i = self.rows[i][:4]
+        method_j, table_j, objects_j, nkeys_j = self.rows[j][:4]
+        return method_i == method_j and table_i == table_j and nkeys_i == nkeys_j and \
+               objects_i[:nkeys_i] == objects_j[:nkeys_j]
+
+    def _merge_objects(self, objects, more, nkeys):
+        """ the values of 'more' replace those of the same mib objects """
+        names = [obj.split(':', 1)[0] for obj in objects]
+        for obj in more[nkeys:]:
+            name = obj.split(':', 1)[0]
+            if name in names:
+                objects[names.index(name)] = obj
+            else:
+                objects.append(obj)
+                names.append(name)
+        return objects
@@ -0,0 +1,152 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: omniswitch_mvrp_manager.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+import logging
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+
+class OmniSwitchMvrpManager(object):
+
+    """
+    Name:        OmniSwitchMvrpManager
+    Description: Batches the disabling/enabling of MVRP in the core switches around vlan changes.
+
+    Details:     MVRP has to be disabled in the core switches while vlans are created in the edge
+                 switches. Instead of toggling it for every network, the first vlan change
+                 (begin) disables MVRP and opens a batching window; all the vlan changes that
+                 come in meanwhile are applied with MVRP disabled. MVRP is enabled again, once,
+                 when no change is in progress and either...
+                    - 'window' secs have passed since the last change completed, or
+                    - MVRP has been disabled for 'max_latency' secs. New changes are held back
+                      (begin blocks) until it is enabled, then they open a new window.
+                 'set_core_mvrp' is called with 0 to disable and 1 to enable MVRP in the core, it
+                 returns True if that succeeded. It is called without holding the lock, so end()
+                 never waits for the switches; begin() waits while the core is being toggled.
+    """
+
+    def __init__(self, set_core_mvrp, window, max_latency):
+        self.set_core_mvrp = set_core_mvrp
+        self.window = max(window, 0)
+        self.max_latency = max(max_latency, self.window)
+
+        self.cond = threading.Condition(threading.Lock())
+        self.disabled = False # mvrp is disabled in the core by this manager
+        self.closing = False # max latency reached, waiting for changes in progress to finish
+        self.toggling = False # set_core_mvrp in progress
+        self.retry_at = 0 # when to enable mvrp again, after it failed
+        self.disabled_at = 0
+        self.last_change = 0
+        self.in_progress = 0
+
+        self.worker = threading.Thread(target=self._worker)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def begin(self):
+        """ to be called before applying a vlan change; disables mvrp in the core if needed """
+        self.cond.acquire()
+        try:
+            while self.closing or self.toggling:
+                self.cond.wait()
+            if not self.disabled:
+                self.toggling = True
+                self.cond.release()
+                try:
+                    ret = self.set_core_mvrp(0)
+                    if not ret:
+                        # some core switches may have it disabled already, enable it back in them
+                        self.set_core_mvrp(1)
+                finally:
+                    self.cond.acquire()
+                    self.toggling = False
+                if ret:
+                    self.disabled = True
+                    self.disabled_at = time.time()
+                    self.last_change = self.disabled_at
+                    LOG.info("mvrp disabled in core, batching window of %s secs opened", self.window)
+                else:
+                    LOG.info("disabling mvrp in core failed! the vlan change is applied with mvrp enabled")
+                self.cond.notify_all()
+            self.in_progress += 1
+        finally:
+            self.cond.release()
+
+    def end(self):
+        """ to be called once the vlan change is applied (or failed) """
+        self.cond.acquire()
+        self.in_progress -= 1
+        self.last_change = time.time()
+        self.cond.notify_all()
+        self.cond.release()
+
+
+    #####   Internal Utility functions #####
+
+    def _worker(self):
+        self.cond.acquire()
+        while True:
+            if not self.disabled or self.toggling:
+                self.cond.wait()
+                continue
+
+            now = time.time()
+            if now < self.retry_at:
+                self.cond.wait(self.retry_at - now)
+                continue
+            if now >= self.disabled_at + self.max_latency:
+                self.closing = True
+
+            if self.in_progress == 0 and (self.closing or now >= self.last_change + self.window):
+                self.toggling = True
+                self.cond.release()
+                try:
+                    ret = self.set_core_mvrp(1)
+                except Exception, e:
+                    LOG.info("enabling mvrp in core raised an exception: %s", e)
+                    ret = False
+                self.cond.acquire()
+                self.toggling = False
+                if ret:
+                    LOG.info("mvrp enabled in core after %.1f secs", time.time() - self.disabled_at)
+                    self.disabled = False
+                else:
+                    # still disabled, the changes go on meanwhile and it is tried again later
+                    LOG.info("enabling mvrp in core failed! retried in %s secs", max(self.window, 1))
+                    self.retry_at = time.time() + max(self.window, 1)
+                self.closing = False
+                self.cond.notify_all()
+                continue
+
+            if self.in_progress == 0:
+                self.cond.wait(self.last_change + self.window - now)
+            elif not self.closing:
+                self.cond.wait(self.disabled_at + self.max_latency - now)
+            else:
+                # the last change in progress wakes it up, see end()
+                self.cond.wait()
@@ -94,6 +94,10 @@ plugin_opts = [
 ]
 
 
+class OmniSwitchBulkCreateFailed(q_exc.NeutronException):
+    message = _("Bulk creation of %(resource)s failed in the OmniSwitches, none of them was created")
+
+
 class OmniRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
                       l3_rpc_base.L3RpcCallbackMixin,
                       sg_db_rpc.SecurityGroupServerRpcCallbackMixin):
@@ -384,6 +388,16 @@ class OmniSwitchNetworkPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         network[provider.PHYSICAL_NETWORK] = binding.physical_network
         network[provider.SEGMENTATION_ID] = binding.segmentation_id
 
+    def _create_network_db(self, context, network):
+        session = context.session
+        (physical_network, segmentation_id) = self.omni_db_obj.reserve_vlan(session)
+        opennet = super(OmniSwitchNetworkPluginV2, self).create_network(context, network)
+        self.omni_db_obj.add_network_binding(session, opennet['id'], 'vlan', physical_network, segmentation_id)
+        self._process_l3_create(context, opennet, network['network'])
+        self._extend_network_dict_provider(context, opennet)
+        self._extend_network_dict_l3(context, opennet)
+        return opennet
+
     def _semTake(self):
         while(self._semInUse == 1):
             continue
@@ -396,7 +410,31 @@ class OmniSwitchNetworkPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
     """ ************** Neutron Core API 2.0 ************** """
 
     def create_network_bulk(self, context, networks):
-        return self._invoke_device_plugin_api(self._func_name(), [context, networks])
+        opennets = []
+        session = context.session
+        with session.begin(subtransactions=True):
+            for network in networks['networks']:
+                if(self.ovs_plugin_obj):
+                    opennets.append(self.ovs_plugin_obj.create_network(context, network))
+                else:
+                    opennets.append(self._create_network_db(context, network))
+
+        for i in range(0, len(opennets)):
+            networks['networks'][i].setdefault('id', opennets[i]['id'])
+
+        # all or nothing: the device plugin has rolled back the switch config of the whole bulk
+        # if any network failed, the networks are deleted from the DB as well
+        try:
+            rets = self.omni_plugin_obj.create_network_bulk(context, networks['networks'])
+        except Exception:
+            self._delete_networks_db(context, opennets)
+            raise
+        if False in rets:
+            LOG.info("create_network_bulk failed in omniswitches! %s",
+                     [networks['networks'][i] for i in range(0, len(rets)) if not rets[i]])
+            self._delete_networks_db(context, opennets)
+            raise OmniSwitchBulkCreateFailed(resource='networks')
+        return opennets
 
     def create_network(self, context, network):
         if(self.ovs_plugin_obj):
@@ -404,12 +442,7 @@ class OmniSwitchNetworkPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         else:
             session = context.session
             with session.begin(subtransactions=True):
-                (physical_network, segmentation_id) = self.omni_db_obj.reserve_vlan(session)
-                opennet = super(OmniSwitchNetworkPluginV2, self).create_network(context, network)
-                self.omni_db_obj.add_network_binding(session, opennet['id'], 'vlan', physical_network, segmentation_id)
-                self._process_l3_create(context, opennet, network['network'])
-                self._extend_network_dict_provider(context, opennet)
-                self._extend_network_dict_l3(context, opennet)
+                opennet = self._create_network_db(context, network)
 
         network.setdefault('id',opennet['id']) 
         ret = self.omni_plugin_obj.create_network(context, network)
@@ -429,6 +462,9 @@ class OmniSwitchNetworkPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         if not ret:
            LOG.info("delete_network failed in omniswithces! %s", id)
 
+        return self._delete_network_db(context, id)
+
+    def _delete_network_db(self, context, id):
         if(self.ovs_plugin_obj):
             return self.ovs_plugin_obj.delete_network(context, id)
         else:
@@ -441,6 +477,12 @@ class OmniSwitchNetworkPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
                                            self.network_vlan_ranges)
         return True
 
+    def _delete_networks_db(self, context, opennets):
+        session = context.session
+        with session.begin(subtransactions=True):
+            for opennet in opennets:
+                self._delete_network_db(context, opennet['id'])
+
     def get_network(self, context, id, fields=None):
         return self._invoke_device_plugin_api(self._func_name(), [context, id, fields])
 
@@ -478,7 +520,31 @@ class OmniSwitchNetworkPluginV2(db_base_plugin_v2.NeutronDbPluginV2,
         return self._invoke_device_plugin_api(self._func_name(), [context, filters])
 
     def create_port_bulk(self, context, ports):
-        return self._invoke_device_plugin_api(self._func_name(), [context, ports])
+        openports = []
+        session = context.session
+        with session.begin(subtransactions=True):
+            for port in ports['ports']:
+                openports.append(self._invoke_device_plugin_api('create_port', [context, port]))
+
+        # all or nothing: the device plugin has rolled back the switch config of the whole bulk
+        # if any port failed, the ports are deleted from the DB as well
+        try:
+            rets = self.omni_plugin_obj.create_port_bulk(context, openports)
+        except Exception:
+            self._delete_ports_db(context, openports)
+            raise
+        if False in rets:
+            LOG.info("create_port_bulk failed in omniswitches! %s",
+                     [ports['ports'][i] for i in range(0, len(rets)) if not rets[i]])
+            self._delete_ports_db(context, openports)
+            raise OmniSwitchBulkCreateFailed(resource='ports')
+        return openports
+
+    def _delete_ports_db(self, context, openports):
+        session = context.session
+        with session.begin(subtransactions=True):
+            for openport in openports:
+                self._invoke_device_plugin_api('delete_port', [context, openport['id']])
 
     def create_port(self, context, port):
         openport = self._invoke_device_plugin_api(self._func_name(), [context, port])
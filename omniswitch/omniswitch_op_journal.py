@@ -0,0 +1,95 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: omniswitch_op_journal.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+import logging
+
+LOG = logging.getLogger(__name__)
+
+
+class OmniSwitchOpJournal(object):
+
+    """
+    Name:        OmniSwitchOpJournal
+    Description: In-memory journal of the driver ops applied during one API call.
+
+    Details:     The device plugin records every driver op that succeeded in a switch, and the
+                 compound ops that failed part way (see PARTIAL_UNDO_OPS). If the API call fails
+                 half way, rollback() undoes exactly what was applied; in reverse order within a
+                 switch and in parallel across the switches. Nothing is sent to the switches that
+                 never got the config and no DB query is needed.
+    """
+
+    # op -> (undo op, number of args of the op passed to the undo op)
+    # create_vpa has no undo; deleting the vlan removes its vpas and 'no 802.1q <port>'
+    # in AOS 6x would remove all the tagged vlans of the port.
+    UNDO_OPS = {
+        'create_network'     : ('delete_network', 1),
+        'create_vlan_locked' : ('delete_vlan_locked', 1),
+        'create_port'        : ('delete_port', 2),
+    }
+
+    # compound op -> undo op when the op failed part way. create_network creates the unp
+    # profile last, so when it failed only its vlan can be left in the switch; delete_network
+    # would fail on the missing profile and leave the vlan.
+    PARTIAL_UNDO_OPS = {
+        'create_network'     : ('delete_vlan_locked', 1),
+    }
+
+    def __init__(self):
+        self.entries = [] # (ddi_obj, function_name, args, succeeded) in the order they were applied
+
+    def record(self, ddi_obj, function_name, args, succeeded=True):
+        if succeeded or function_name in self.PARTIAL_UNDO_OPS:
+            self.entries.append((ddi_obj, function_name, list(args), succeeded))
+
+    def record_result(self, ddi_list, function_name, args, result):
+        """ records the op for every switch of the fan-out result, see record() """
+        for switch_ip, ret in result.results.items():
+            self.record(ddi_list[switch_ip], function_name, args, bool(ret))
+
+    def extend(self, journal):
+        self.entries.extend(journal.entries)
+
+    def rollback(self, submit):
+        """ undoes the recorded ops. 'submit(ddi_obj, function_name, args)' must queue the
+            driver api on the switch and return an object whose wait() gives the result """
+        ops = []
+        for ddi_obj, function_name, args, succeeded in reversed(self.entries):
+            undo_ops = self.UNDO_OPS
+            if not succeeded:
+                undo_ops = self.PARTIAL_UNDO_OPS
+            if function_name not in undo_ops:
+                continue
+            undo_name, nargs = undo_ops[function_name]
+            ops.append((ddi_obj, undo_name, args[:nargs], submit(ddi_obj, undo_name, args[:nargs])))
+
+        ret = True
+        for ddi_obj, undo_name, undo_args, op in ops:
+            if not op.wait():
+                LOG.info("rollback: %s%s in %s failed!", undo_name, tuple(undo_args), ddi_obj.switch_ip)
+                ret = False
+        self.entries = []
+        return ret
@@ -0,0 +1,490 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: omniswitch_op_queue.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+import httplib
+import logging
+import socket
+import threading
+import time
+import urllib2
+
+LOG = logging.getLogger(__name__)
+
+# the config keys each driver api works on, after its args. the ops on different keys may run at
+# the same time, the other driver apis work on the whole switch config
+LOCK_KEYS = {
+    'create_vlan': ('vlan',), 'create_vlan_locked': ('vlan',),
+    'delete_vlan': ('vlan',), 'delete_vlan_locked': ('vlan',),
+    'create_unp_vlan': ('vlan',), 'delete_unp_vlan': ('vlan',),
+    'create_unp_vlanrule': ('vlan',), 'delete_unp_vlanrule': ('vlan',),
+    'create_network': ('vlan',), 'delete_network': ('vlan',),
+    'create_unp_macrule': ('vlan', 'mac'), 'delete_unp_macrule': ('vlan', 'mac'),
+    'create_port': ('vlan', 'mac'), 'delete_port': ('vlan', 'mac'),
+    'create_vpa': ('vlan', 'port'), 'delete_vpa': ('vlan', 'port'),
+    'enable_unp': ('port',), 'disable_unp': ('port',),
+    'enable_mvrp_if': ('port',), 'disable_mvrp_if': ('port',),
+    'create_network_bulk': ('vlan',), 'create_port_bulk': ('vlan', 'mac'),
+}
+
+# the exceptions of a driver api that mean the switch could not be reached
+CONNECTION_ERRORS = (socket.error, urllib2.URLError, httplib.HTTPException, EOFError)
+
+
+class OmniSwitchOp(object):
+
+    """ one driver api call waiting in (or taken from) the OmniSwitchOpQueue """
+
+    def __init__(self, function_name, args, low_priority=False):
+        self.function_name = function_name
+        self.args = list(args)
+        self.low_priority = low_priority
+        self.submitted = time.time()
+        self.result = False
+        self.merged = [] # ops collapsed into this one, they get the same result
+        self.done = threading.Event()
+
+    def vlan_key(self):
+        if len(self.args) == 0:
+            return None
+        return str(self.args[0])
+
+    def vlan_keys(self):
+        # bulk ops take a list of (vlan_id, ...) items as the first arg
+        if len(self.args) and isinstance(self.args[0], list):
+            return set([str(item[0]) for item in self.args[0]])
+        return set([self.vlan_key()])
+
+    def port_key(self):
+        # create_port/delete_port(vlan_id, mac=None)
+        mac = None
+        if len(self.args) > 1 and self.args[1]:
+            mac = str(self.args[1]).lower()
+        return (self.vlan_key(), mac)
+
+    def lock_keys(self):
+        """ the set of config keys, eg 'vlan:10', 'mac:...' or 'port:1/2', the op works on;
+            None if it may change any of the switch config """
+        if self.function_name not in LOCK_KEYS or len(self.args) == 0:
+            return None
+        names = LOCK_KEYS[self.function_name]
+        # bulk ops take a list of (vlan_id, ...) items as the first arg
+        if self.function_name.endswith('_bulk'):
+            items = self.args[0]
+        else:
+            items = [self.args]
+        keys = set()
+        for item in items:
+            for i in range(0, min(len(names), len(item))):
+                if item[i] is not None and str(item[i]) != '':
+                    keys.add(names[i] + ':' + str(item[i]).lower())
+        return keys
+
+    def complete(self, ret):
+        self.result = ret
+        self.done.set()
+        for op in self.merged:
+            op.complete(ret)
+
+    def wait(self):
+        self.done.wait()
+        return self.result
+
+
+class OmniSwitchOpWorkers(object):
+
+    """
+    Name:        OmniSwitchOpWorkers
+    Description: Bounded pool of worker threads shared by the OmniSwitchOpQueue of the switches.
+
+    Details:     'size' threads run the ops of all the queues attached to the pool, so the number
+                 of threads does not grow with the number of switches nor with their sessions.
+                 The queues are served in turn, so a busy switch does not hold up the others. The
+                 queues share the condition of the pool, a worker waits on it until any of them
+                 has an op that can run.
+    """
+
+    def __init__(self, size):
+        self.size = max(size, 1)
+        self.queues = []
+        self.turn = 0 # queue served first by the next worker
+        self.cond = threading.Condition(threading.Lock())
+
+        self.workers = []
+        for i in range(0, self.size):
+            worker = threading.Thread(target=self._worker)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def attach(self, queue):
+        self.cond.acquire()
+        self.queues.append(queue)
+        self.cond.release()
+
+
+    #####   Internal Utility functions #####
+
+    def _worker(self):
+        while True:
+            self.cond.acquire()
+            while True:
+                queue, op = self._next()
+                if queue is not None:
+                    break
+                self.cond.wait(self._timeout())
+            self.cond.release()
+            queue._execute(op)
+
+    def _next(self):
+        """ returns (queue, op) to run next, (None, None) if none can run now. must be called
+            with cond held """
+        count = len(self.queues)
+        for i in range(0, count):
+            queue = self.queues[(self.turn + i) % count]
+            op = queue._take()
+            if op is not None:
+                self.turn = (self.turn + i + 1) % count
+                return queue, op
+        return None, None
+
+    def _timeout(self):
+        """ secs until the first due save check of the queues, None if none """
+        now = time.time()
+        timeout = None
+        for queue in self.queues:
+            due = queue._due(now)
+            if due is not None and (timeout is None or due < timeout):
+                timeout = due
+        return timeout
+
+
+class OmniSwitchOpQueue(object):
+
+    """
+    Name:        OmniSwitchOpQueue
+    Description: Ordered work queue feeding one switch driver.
+
+    Details:     All the driver api calls for a switch are queued here and executed by the
+                 workers of an OmniSwitchOpWorkers, shared with the other switches if given,
+                 otherwise of its own. At most one op per CLI session of the driver (its
+                 session_pool_size, 1 if it has none) runs at once. An op works on a set of config
+                 keys, the vlan, mac and port of its args (see lock_keys), or on the whole switch
+                 config. It starts only once all the ops
+                 submitted before it on any of its keys are done, so the ops on a vlan/mac/port run
+                 in the order they were submitted while those on other keys run in parallel. Before an op
+                 is queued, it is merged with the redundant ops still pending in the queue...
+                    - create_network for a vlan which is already pending creation collapses
+                      into the pending one.
+                    - delete_port for a vlan/mac whose create_port is still pending cancels
+                      both of them, nothing is sent to the switch.
+                 An op is never merged across another pending op on the same vlan, so the
+                 resulting switch config is the same as executing all of them in order.
+                 If 'health' (OmniSwitchHealth) is given, the connection failures are recorded in
+                 it and the ops fail fast while the switch is unreachable. If the driver can not
+                 read back its config (get_config_state), so that a resync can not repair it, the
+                 deletions that failed for the switch being unreachable are kept and queued again
+                 by replay_failed() once an op gets through or the switch is back. A kept deletion
+                 is dropped once another op on the same keys is queued, which decides the config
+                 of those keys. The creations are not kept, the API calls that made them failed
+                 and were rolled back.
+                 Low priority ops (save_config) let the ops queued after them run first, for at
+                 most 'max_deferral' secs; the ops queued before them still run before. If the
+                 driver can save in background (start_save_config/check_save_config), the ops
+                 run while the switch completes the save, between the checks of its status.
+                 If the driver can start a call without waiting for it (start_call, the telnet
+                 driver run by an OmniSwitchTelnetEngine), the worker only hands the op over and
+                 is free at once; the op is completed when the driver calls back. So the switches
+                 and their sessions do not hold a worker each while their commands are running.
+    """
+
+    switch_ip = None
+    ddi_obj = None
+    health = None
+    max_deferral = 0
+    saving = None # save_config op started in the switch, waiting for its completion
+    saving_check = 0 # when to check again whether the save is completed
+    save_checking = False # a worker is checking whether the save is completed
+    max_running = 1 # ops, save check included, run at once
+    CHECK_SAVE = 'check_save' # taken by a worker to check the save in progress
+
+    def __init__(self, switch_ip, ddi_obj, health=None, max_deferral=30, workers=None):
+        self.switch_ip = switch_ip
+        self.ddi_obj = ddi_obj
+        self.health = health
+        self.max_deferral = max_deferral
+        self.pending = []
+        self.running = [] # ops taken by the workers, not done yet
+        self.failed = [] # (function_name, args) of the deletions to send again, see replay_failed
+        self.max_running = max(getattr(ddi_obj, 'session_pool_size', 1), 1)
+
+        if workers is None:
+            workers = OmniSwitchOpWorkers(self.max_running)
+        self.workers = workers
+        self.cond = workers.cond
+        workers.attach(self)
+
+    def submit(self, function_name, args, low_priority=False):
+        """ queues the driver api and returns the op, use op.wait() to get its result """
+        op = OmniSwitchOp(function_name, args, low_priority)
+        if self.health and not self.health.allow():
+            self._fail_fast(op)
+            return op
+
+        self.cond.acquire()
+        try:
+            self._drop_failed(op)
+            if not self._coalesce(op):
+                self.pending.append(op)
+                self.cond.notify()
+        finally:
+            self.cond.release()
+        return op
+
+    def call(self, function_name, args):
+        return self.submit(function_name, args).wait()
+
+    def replay_failed(self):
+        """ queues again, ahead of the pending ops, the deletions that failed while the switch
+            was unreachable. returns the number of ops queued """
+        self.cond.acquire()
+        try:
+            replay = [OmniSwitchOp(function_name, args) for function_name, args in self.failed]
+            self.failed = []
+            for op in replay:
+                LOG.info("%s%s in %s failed while unreachable, sent again", op.function_name,
+                         tuple(op.args), self.switch_ip)
+            self.pending[0:0] = replay
+            self.cond.notify_all()
+        finally:
+            self.cond.release()
+        return len(replay)
+
+
+    #####   Internal Utility functions #####
+
+    def _coalesce(self, op):
+        """ merges op with the pending ops, if possible. must be called with cond held """
+        if op.low_priority:
+            for prev in self.pending:
+                if prev.low_priority and prev.function_name == op.function_name and prev.args == op.args:
+                    prev.merged.append(op) # not started yet, it covers this one as well
+                    return True
+
+        elif op.function_name == 'create_network':
+            prev = self._last_pending_on_vlan(op.vlan_key())
+            if prev and prev.function_name == 'create_network':
+                prev.merged.append(op)
+                LOG.info("create_network %s in %s merged with the pending one", op.vlan_key(), self.switch_ip)
+                return True
+
+        elif op.function_name == 'delete_port':
+            prev = self._last_pending_on_vlan(op.vlan_key())
+            if prev and prev.function_name == 'create_port' and prev.port_key() == op.port_key():
+                self.pending.remove(prev)
+                prev.complete(True)
+                op.complete(True)
+                LOG.info("create_port/delete_port %s in %s cancelled out", op.port_key(), self.switch_ip)
+                return True
+
+        return False
+
+    def _last_pending_on_vlan(self, vlan_key):
+        if vlan_key is None:
+            return None
+        for prev in reversed(self.pending):
+            if vlan_key in prev.vlan_keys():
+                return prev
+        return None
+
+    def _next_op(self):
+        """ pops the op to run next, None if none can run now. must be called with cond held """
+        now = time.time()
+        held = [op.lock_keys() for op in self.running]
+        for i in range(0, len(self.pending)):
+            op = self.pending[i]
+            keys = op.lock_keys()
+            if op.low_priority:
+                if self.saving and op.function_name == 'save_config':
+                    continue # it has to start after the save in progress, which may not cover its changes
+                later = [later_op for later_op in self.pending[i+1:] if not later_op.low_priority]
+                if len(later) and now - op.submitted < self.max_deferral:
+                    continue # the ops queued after it go first
+            if not self._conflicts(keys, held):
+                op = self.pending.pop(i)
+                self.running.append(op)
+                return op
+            held.append(keys) # the ops after it on the same keys wait for it
+        return None
+
+    def _conflicts(self, keys, held):
+        for other in held:
+            if keys is None or other is None or len(keys & other):
+                return True
+        return False
+
+    def _take(self):
+        """ returns the op to run next, CHECK_SAVE if the save in progress is to be checked,
+            None if nothing can run now. must be called with cond held """
+        busy = len(self.running)
+        if self.save_checking:
+            busy += 1
+        if busy >= self.max_running:
+            return None
+        if self.saving and not self.save_checking and time.time() >= self.saving_check:
+            self.save_checking = True
+            return self.CHECK_SAVE
+        return self._next_op()
+
+    def _due(self, now):
+        """ secs until the save in progress is to be checked, None if not waiting for it.
+            must be called with cond held """
+        if self.saving and not self.save_checking:
+            return max(self.saving_check - now, 0.01)
+        return None
+
+    def _execute(self, op):
+        """ runs the op taken by _take, in a worker """
+        if op is self.CHECK_SAVE:
+            self._check_save()
+            self._done(None)
+            return
+
+        if self.health and not self.health.allow():
+            self._done(op)
+            self._fail_fast(op)
+            return
+
+        if op.function_name == 'save_config' and hasattr(self.ddi_obj, 'start_save_config'):
+            if self._run(op, 'start_save_config'):
+                self.saving = op
+                self.saving_check = time.time() + self.ddi_obj.save_poll_interval
+                self._done(op)
+            else:
+                self._done(op)
+                op.complete(False)
+            return
+
+        if self._start(op):
+            return # completed by _finished, the worker is free meanwhile
+        ret = self._run(op, op.function_name)
+        self._done(op)
+        op.complete(ret)
+
+    def _start(self, op):
+        """ hands the op to the driver without waiting for it, if the driver can (start_call).
+            returns False if the op is to be run by the worker """
+        start_call = getattr(self.ddi_obj, 'start_call', None)
+        if start_call is None:
+            return False
+        def finished(ret, connect_error):
+            self._finished(op, ret, connect_error)
+        try:
+            return start_call(op.function_name, op.args, finished)
+        except Exception, e:
+            LOG.info("%s%s in %s could not be started! [%s]", op.function_name, tuple(op.args), self.switch_ip, e)
+            return False
+
+    def _finished(self, op, ret, connect_error):
+        """ outcome of the op started by _start, called by the driver from its own thread """
+        self._record(op, ret, connect_error is not None)
+        self._done(op)
+        op.complete(ret)
+
+    def _done(self, op):
+        """ releases the keys of op, or the save check if None, and wakes up the idle workers """
+        self.cond.acquire()
+        if op is None:
+            self.save_checking = False
+        else:
+            self.running.remove(op)
+        self.cond.notify_all()
+        self.cond.release()
+
+    def _check_save(self):
+        ret = self._run(self.saving, 'check_save_config')
+        if ret is None:
+            self.saving_check = time.time() + self.ddi_obj.save_poll_interval
+            return
+        op = self.saving
+        self.saving = None
+        op.complete(ret)
+
+    def _run(self, op, function_name):
+        """ calls the driver api with the args of op, records the outcome in health """
+        unreachable = False
+        self.ddi_obj.take_connect_error() # left by a call made outside the queue in this thread
+        try:
+            ret = getattr(self.ddi_obj, function_name)(*op.args)
+            # the outcome of this call only, the other workers make their own calls meanwhile
+            unreachable = self.ddi_obj.take_connect_error() is not None
+        except CONNECTION_ERRORS, e:
+            LOG.info("%s%s in %s failed! [%s]", function_name, tuple(op.args), self.switch_ip, e)
+            ret = False
+            unreachable = True
+        except Exception, e:
+            # a bug or a bad answer, the switch was reached: not a reason to mark it down
+            LOG.info("%s%s in %s failed! [%s]", function_name, tuple(op.args), self.switch_ip, e)
+            return False
+        self._record(op, ret, unreachable)
+        return ret
+
+    def _record(self, op, ret, unreachable):
+        """ records the outcome of the call made for op in health and in the failed deletions """
+        if unreachable and not ret:
+            self._keep_failed(op)
+        if self.health:
+            if unreachable:
+                self.health.record_failure()
+            else:
+                self.health.record_success()
+        if not unreachable and len(self.failed):
+            self.replay_failed()
+
+    def _fail_fast(self, op):
+        LOG.info("%s%s in %s failed! switch is unreachable", op.function_name, tuple(op.args), self.switch_ip)
+        self._keep_failed(op)
+        op.complete(False)
+
+    def _keep_failed(self, op):
+        """ keeps the deletion to be sent again by replay_failed """
+        if hasattr(self.ddi_obj, 'get_config_state') or not op.function_name.startswith('delete_'):
+            return # repaired by a resync, or rolled back by the API call
+        self.cond.acquire()
+        if (op.function_name, op.args) not in self.failed:
+            self.failed.append((op.function_name, list(op.args)))
+        self.cond.release()
+
+    def _drop_failed(self, op):
+        """ drops the kept deletions on the keys of op. must be called with cond held """
+        keys = op.lock_keys()
+        if keys is None or len(self.failed) == 0:
+            return
+        for function_name, args in list(self.failed):
+            failed_keys = OmniSwitchOp(function_name, args).lock_keys()
+            if failed_keys is None or len(failed_keys & keys):
+                LOG.info("%s%s in %s superseded by %s, not sent again", function_name, tuple(args),
+                         self.switch_ip, op.function_name)
+                self.failed.remove((function_name, args))
@@ -0,0 +1,197 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: omniswitch_reconciler.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+import logging
+
+from neutron.plugins.omniswitch.omniswitch_fanout import OmniSwitchFanOutResult
+
+LOG = logging.getLogger(__name__)
+
+
+class OmniSwitchConfigState(object):
+
+    """
+    Name:        OmniSwitchConfigState
+    Description: The OpenStack config of one switch.
+
+    Details:     Used both for the desired state, computed from the Neutron DB, and for the actual
+                 state, read from the switch. Only the config created by the plug-in is tracked:
+                 vlans named with the vlan name prefix, 'OpenStack-UNP-<vlan>' profiles and their
+                 classification rules, and the tagged vpas on the interfaces set in the config file.
+                 Vlan names are not compared.
+    """
+
+    def __init__(self):
+        self.vlans = {} # vlan_id -> network name
+        self.unp_vlans = set() # vlan_id of the unp profiles
+        self.vlan_rules = set() # vlan_id of the vlan-tag classification rules
+        self.mac_rules = set() # (vlan_id, mac) of the mac classification rules
+        self.vpas = set() # (vlan_id, slotport) of the tagged vpas
+        self.vpa_ports = set() # slotports whose vpas are managed by the plug-in
+
+    def add_vpa(self, vlan_id, slotport):
+        slotport = slotport.strip()
+        if len(slotport) == 0:
+            return
+        self.vpas.add((int(vlan_id), slotport))
+        self.vpa_ports.add(slotport)
+
+    def delta(self, actual):
+        """ returns the driver ops, as (function_name, args), that turn 'actual' into this state """
+        ops = []
+        # deletions first, the rules before the unp profiles and the profiles before the vlans
+        for vlan_id, mac in sorted(actual.mac_rules - self.mac_rules):
+            ops.append(('delete_unp_macrule', [vlan_id, mac]))
+        for vlan_id in sorted(actual.vlan_rules - self.vlan_rules):
+            ops.append(('delete_unp_vlanrule', [vlan_id]))
+        for vlan_id, slotport in sorted(actual.vpas - self.vpas):
+            if vlan_id in self.vlans: # otherwise it goes along with the vlan
+                ops.append(('delete_vpa', [vlan_id, slotport]))
+        for vlan_id in sorted(actual.unp_vlans - self.unp_vlans):
+            ops.append(('delete_unp_vlan', [vlan_id]))
+        for vlan_id in sorted(set(actual.vlans) - set(self.vlans)):
+            ops.append(('delete_vlan', [vlan_id]))
+
+        for vlan_id in sorted(set(self.vlans) - set(actual.vlans)):
+            ops.append(('create_vlan', [vlan_id, self.vlans[vlan_id]]))
+        for vlan_id in sorted(self.unp_vlans - actual.unp_vlans):
+            ops.append(('create_unp_vlan', [vlan_id]))
+        for vlan_id in sorted(self.vlan_rules - actual.vlan_rules):
+            ops.append(('create_unp_vlanrule', [vlan_id]))
+        for vlan_id, mac in sorted(self.mac_rules - actual.mac_rules):
+            ops.append(('create_unp_macrule', [vlan_id, mac]))
+        for vlan_id, slotport in sorted(self.vpas - actual.vpas):
+            ops.append(('create_vpa', [vlan_id, slotport]))
+        return ops
+
+    def wants(self, function_name, args):
+        """ returns whether the op of delta() still brings the switch towards this state """
+        vlan_id = args[0]
+        name = function_name.split('_', 1)[1]
+        if name == 'vlan':
+            present = vlan_id in self.vlans
+        elif name == 'unp_vlan':
+            present = vlan_id in self.unp_vlans
+        elif name == 'unp_vlanrule':
+            present = vlan_id in self.vlan_rules
+        elif name == 'unp_macrule':
+            present = (vlan_id, args[1]) in self.mac_rules
+        else:
+            present = (vlan_id, args[1]) in self.vpas
+        return present == function_name.startswith('create_')
+
+
+class OmniSwitchReconciler(object):
+
+    """
+    Name:        OmniSwitchReconciler
+    Description: Brings the config of the switches in line with the Neutron DB.
+
+    Details:     The desired state of every switch is compared with its actual state, read in bulk
+                 from the switch, and only the difference is pushed; so a resync costs in
+                 proportion to what changed, not to the size of the config. It is used to resync
+                 the switches when neutron-server starts and to repair them on demand. Switches
+                 whose driver can not read back its config (get_config_state) are skipped.
+                 The API calls keep running meanwhile, so the desired state is taken once the
+                 switches have been read (a network is created in the DB before the switches)
+                 and the DB is checked again just before the ops are pushed: an op that the DB
+                 no longer asks for, eg, the deletion of a vlan created during the resync, is
+                 dropped.
+                 'get_desired_state()' must return {ddi_obj: OmniSwitchConfigState}.
+                 'submit(ddi_obj, function_name, args)' must queue the driver api on the switch
+                 and return an object whose wait() gives the result.
+    """
+
+    def __init__(self, get_desired_state, submit):
+        self.get_desired_state = get_desired_state
+        self.submit = submit
+
+    def plan(self):
+        """ returns {ddi_obj: driver ops} for every switch whose actual state could be read """
+        reads = {}
+        for ddi_obj, state in self.get_desired_state().items():
+            if not hasattr(ddi_obj, 'get_config_state'):
+                LOG.info("reconcile: reading the config of %s is not supported, skipped", ddi_obj.switch_ip)
+                continue
+            reads[ddi_obj] = self.submit(ddi_obj, "get_config_state", [sorted(state.vpa_ports)])
+
+        actuals = {}
+        for ddi_obj, op in reads.items():
+            actual = op.wait()
+            if not actual:
+                LOG.info("reconcile: reading the config of %s failed, skipped", ddi_obj.switch_ip)
+                continue
+            actuals[ddi_obj] = actual
+
+        # taken after the reads: whatever the API calls put in the switches before they were
+        # read is already in the DB
+        desired = self.get_desired_state()
+        plan = {}
+        for ddi_obj, actual in actuals.items():
+            if ddi_obj in desired:
+                plan[ddi_obj] = desired[ddi_obj].delta(actual)
+        return plan
+
+    def apply(self, plan):
+        """ pushes the ops of the plan, one batch per switch, all the switches at once """
+        plan = self._recheck(plan)
+        result = OmniSwitchFanOutResult()
+        ops = {}
+        for ddi_obj, config_ops in plan.items():
+            if len(config_ops) == 0:
+                result.set_result(ddi_obj.switch_ip, True)
+                continue
+            LOG.info("reconcile: %d changes to push to %s", len(config_ops), ddi_obj.switch_ip)
+            ops[ddi_obj] = self.submit(ddi_obj, "apply_config_ops", [config_ops])
+
+        for ddi_obj, op in ops.items():
+            result.set_result(ddi_obj.switch_ip, op.wait())
+        return result
+
+    def has_vlan_changes(self, plan):
+        for config_ops in plan.values():
+            for function_name, args in config_ops:
+                if function_name in ('create_vlan', 'delete_vlan'):
+                    return True
+        return False
+
+
+    #####   Internal Utility functions #####
+
+    def _recheck(self, plan):
+        """ drops the ops of the plan that the DB no longer asks for """
+        desired = self.get_desired_state()
+        checked = {}
+        for ddi_obj, config_ops in plan.items():
+            state = desired.get(ddi_obj)
+            checked[ddi_obj] = []
+            for function_name, args in config_ops:
+                if state is not None and state.wants(function_name, args):
+                    checked[ddi_obj].append((function_name, args))
+                else:
+                    LOG.info("reconcile: %s%s in %s changed in the DB meanwhile, skipped",
+                             function_name, tuple(args), ddi_obj.switch_ip)
+        return checked
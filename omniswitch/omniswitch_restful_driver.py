@@ -31,12 +31,16 @@ import importlib
 import traceback
 import urllib
 import urllib2
+import socket
 import time
 
 import thread
 import threading
 
-from neutron.plugins.omniswitch.consumer import AOSAPI, AOSConnection
+from neutron.plugins.omniswitch.consumer import AOSAPI, AOSConnection, AOSException, AOSHeaders, AOSResult
+from neutron.plugins.omniswitch.omniswitch_cli_commands import OmniSwitchCliCommands
+from neutron.plugins.omniswitch.omniswitch_mib_batch import OmniSwitchMibBatch
+from neutron.plugins.omniswitch.omniswitch_reconciler import OmniSwitchConfigState
 #from neutron.plugins.omniswitch.omniswitch_driver_base import OmniSwitchDeviceDriverBase
 
 LOG = logging.getLogger(__name__)
@@ -58,10 +62,11 @@ class OmniSwitchRestfulDriver(object):
                         OS6860 : 811-R01--GA
 
                  It uses the "consumer.py" library provided as a reference implementation from the AOS/OmniSwitch
-                 point of view. No changes is made as part of OmniSwitch plug-in or driver development. For 
-                 latest version of consumer.py, refer "//depot/7.3.3.R01/sw/management/web/consumer/consumer.py".
-                 For any issues/bugs with the library, please contact AOS 7x WebService module owner
-                 (Chris Ravanscoft)
+                 point of view. The copy shipped with the plug-in is extended for it: a keep-alive connection
+                 pool per AOSConnection, the AOSResult returned by every request, JSON responses and the paged
+                 walk of the MIB tables (iter_table). For the reference version of consumer.py, refer
+                 "//depot/7.3.3.R01/sw/management/web/consumer/consumer.py". For any issues/bugs with the
+                 library, please contact AOS 7x WebService module owner (Chris Ravanscoft)
     """
     switch_ip = None
     switch_login = None
@@ -69,11 +74,26 @@ class OmniSwitchRestfulDriver(object):
     switch_prompt = None
     threadLock = None
     _init_done = False
+    calls = None # per thread: connect_error of the last call made by the thread, see take_connect_error
+    _logged_in = False # the session (cookie) is kept logged in across the calls
+    _last_used = 0
+    _idle_logout_running = False
 
     ### user configs
+    session_idle_timeout = 120 # secs after which an unused session is logged out, 0 to log out after every call
+    table_page_size = 500 # rows per request when a mib table is walked
+    push_threshold = 0 # change sets of at least this many ops are pushed as one config file, 0 never
+    push_file_name = 'openstack_provisioning.cfg'
+    save_poll_interval = 0.5 # secs between two reads of the certify/sync status while saving
+    save_timeout = 60 # secs to wait for the switch to report the config certified and synchronized
+    _primary_cmm = None # entPhysicalIndex of the primary CMM, read once from chasChassisTable
+    _save_started = 0
+    _save_skipped = False # the switch had nothing to save
     switch_vlan_name_prefix = ''
 
     def __init__(self, ip, login='admin', password='switch', prompt='->'):
+        self.calls = threading.local()
+        self.cli = OmniSwitchCliCommands(False, self.switch_vlan_name_prefix)
         self.switch_ip = ip.strip()
         if len(self.switch_ip) == 0 :
             LOG.info("Init Error! Must provide a valid IP address!!!")
@@ -91,6 +111,8 @@ class OmniSwitchRestfulDriver(object):
         if len(self.switch_prompt) == 0 :
             self.switch_prompt = '->'
 
+        # ask for json, much cheaper to decode than xml. the response is decoded as per
+        # its content-type, so a switch that only speaks xml still works
         self.aosapi = AOSAPI(AOSConnection(
                      self.switch_login,
                      self.switch_password,
@@ -99,7 +121,7 @@ class OmniSwitchRestfulDriver(object):
                      True,
                      True,
                      -1,
-                     None,
+                     AOSHeaders({AOSAPI.ENC_ALT: True, 'api': '1.0'}), # ENC_ALT is json
                      0,
                      False))
  
@@ -108,68 +130,101 @@ class OmniSwitchRestfulDriver(object):
 
     def set_config(self, vlan_name_prefix):
         self.switch_vlan_name_prefix = vlan_name_prefix
+        self.cli.vlan_name_prefix = vlan_name_prefix
+
+    def set_session_idle_timeout(self, session_idle_timeout):
+        self.session_idle_timeout = session_idle_timeout
+
+    def set_push_threshold(self, push_threshold):
+        self.push_threshold = push_threshold
+
+    def take_connect_error(self):
+        """ returns the connection error met by the last call made by the current thread, None
+            if the switch was reached or no call was made since the previous take """
+        connect_error = getattr(self.calls, 'connect_error', None)
+        self.calls.connect_error = None
+        return connect_error
 
     def connect(self):
         if self._init_done == False :
             LOG.info("Driver is not initialized!!!")
             return False
+
+        if self._logged_in :
+            self._last_used = time.time()
+            return True # session kept from the previous calls
         
         try:
             results = self.aosapi.login()
-            if not self.aosapi.success():
-                LOG.info("Login error %s: %s", self.switch_ip, results)
+            if not results.success():
+                LOG.info("Login error %s: %s", self.switch_ip, results.errors())
+                self.calls.connect_error = None # the switch answered, it is reachable
                 return False
             else:
+                self.calls.connect_error = None
+                self._logged_in = True
+                self._last_used = time.time()
+                self._start_idle_logout()
                 return True
         except urllib2.HTTPError, e :
             self.aosapi.logout()
             LOG.info("Connect Error %s: %s", self.switch_ip, e)
+            self.calls.connect_error = None # the switch answered, it is reachable
+            return False
+        except AOSException, e :
+            LOG.info("Connect Error %s: %s", self.switch_ip, e)
+            self.calls.connect_error = None
+            return False
+        except (urllib2.URLError, socket.error), e :
+            LOG.info("Connect Error %s: %s", self.switch_ip, e)
+            self.calls.connect_error = str(e)
             return False
         
 
     def disconnect(self):
-        self.aosapi.logout()
+        """ the session is kept for the next call, it is logged out once idle for session_idle_timeout """
+        self._last_used = time.time()
+        if self.session_idle_timeout <= 0 :
+            self.logout()
 
-    ###beware lock used!!!, dont call this func from another locked func
-    def create_vpa(self, vlan_id, slotport, args=None):
+    def logout(self):
+        if not self._logged_in :
+            return
+        self._logged_in = False
+        try:
+            self.aosapi.logout()
+        except (urllib2.URLError, socket.error, AOSException), e :
+            LOG.info("Logout Error %s: %s", self.switch_ip, e)
+        self.aosapi.connection.close() # the idle keep-alive connections go with the session
+
+    def begin_session(self):
+        return self.connect()
+
+    def end_session(self):
+        self.disconnect()
+
+    def probe(self):
+        """ checks whether the switch is reachable and accepts the login """
         self.threadLock.acquire(1)
-        ret = False
-        if self.connect() == False:
+        try:
+            ret = self.connect()
+            if ret == True:
+                self.disconnect()
+        finally:
             self.threadLock.release()
-            return False
+        return ret
 
-        ifindex = self._get_ifindex_from_slotport(slotport)
-        results = self.aosapi.put('mib', 'vpaTable',
-                        {'mibObject0':'vpaIfIndex:'+str(ifindex),
-                         'mibObject1':'vpaVlanNumber:'+str(vlan_id),
-                         'mibObject2':'vpaType:2'})['result']
-        if self.aosapi.success():
-            LOG.info("vpa %s --> %s created in %s successfully!", vlan_id, slotport, self.switch_ip)
-            ret = True
-        else:
-            LOG.info("vpa %s --> %s creation in %s failed! %s", vlan_id, slotport, self.switch_ip, results)
-        self.disconnect()
+    ###beware lock used!!!, dont call this func from another locked func
+    def create_vpa(self, vlan_id, slotport, args=None):
+        self.threadLock.acquire(1)
+        ret = self._create_vpa(vlan_id, slotport)
         self.threadLock.release()
         return ret
 
     ###beware lock used!!!, dont call this func from another locked func
     def delete_vpa(self, vlan_id, slotport, args=None): 
         self.threadLock.acquire(1)
-        ret = False
-        if self.connect() == False:
-            self.threadLock.release()
-            return False
-
-        ifindex = self._get_ifindex_from_slotport(slotport)
-        results = self.aosapi.delete('mib', 'vpaTable',
-                        {'mibObject0':'vpaIfIndex:'+str(ifindex),
-                         'mibObject1':'vpaVlanNumber:'+str(vlan_id)})['result']
-        if self.aosapi.success():
-            LOG.info("vpa %s --> %s deleted in %s successfully!", vlan_id, slotport, self.switch_ip)
-            ret = True
-        else:
-            LOG.info("vpa %s --> %s deletion in %s failed! %s", vlan_id, slotport, self.switch_ip, results)
-        self.disconnect()
+        ret = self._delete_vpa(vlan_id, slotport)
         self.threadLock.release()
         return ret
 
@@ -185,15 +240,15 @@ class OmniSwitchRestfulDriver(object):
             return False
 
         vlan_name = self.switch_vlan_name_prefix+'-'+net_name+'-'+str(vlan_id)
-        results = self.aosapi.put('mib', 'vlanTable', 
+        results = self._request('put', 'mib', 'vlanTable', 
                        {'mibObject0':'vlanNumber:'+str(vlan_id), 
-                        'mibObject1':'vlanDescription:'+vlan_name})['result']
+                        'mibObject1':'vlanDescription:'+vlan_name})
                         #'mibObject1':'vlanDescription:OpenStack-'+str(vlan_id)})['result']
-        if self.aosapi.success():
+        if results.success():
             LOG.info("vlan %s created in %s successfully!", vlan_id, self.switch_ip)
             ret = True
         else:
-            LOG.info("vlan %s creation in %s failed! %s", vlan_id, self.switch_ip, results)
+            LOG.info("vlan %s creation in %s failed! %s", vlan_id, self.switch_ip, results.errors())
         self.disconnect()
         return ret
 
@@ -208,12 +263,12 @@ class OmniSwitchRestfulDriver(object):
         if self.connect() == False:
             return False
 
-        results = self.aosapi.delete('mib', 'vlanTable', {'mibObject0':'vlanNumber:'+str(vlan_id)})['result']
-        if self.aosapi.success():
+        results = self._request('delete', 'mib', 'vlanTable', {'mibObject0':'vlanNumber:'+str(vlan_id)})
+        if results.success():
             LOG.info("vlan %s deleted in %s successfully!", vlan_id, self.switch_ip)
             ret = True
         else:
-            LOG.info("vlan %s deletion in %s failed! %s", vlan_id, self.switch_ip, results)
+            LOG.info("vlan %s deletion in %s failed! %s", vlan_id, self.switch_ip, results.errors())
         self.disconnect()
         return ret
 
@@ -222,14 +277,14 @@ class OmniSwitchRestfulDriver(object):
         if self.connect() == False:
             return False
 
-        results = self.aosapi.put('mib', 'alaDaUserNetProfileTable',
+        results = self._request('put', 'mib', 'alaDaUserNetProfileTable',
                   {'mibObject0':'alaDaUserNetProfileName:' +'OpenStack-UNP-'+str(vlan_id),
-                   'mibObject1':'alaDaUserNetProfileVlanID:'+str(vlan_id)})['result']
-        if self.aosapi.success():
+                   'mibObject1':'alaDaUserNetProfileVlanID:'+str(vlan_id)})
+        if results.success():
             LOG.info("unp_vlan %s creation in %s success!", vlan_id, self.switch_ip)
             ret = True
         else:
-            LOG.info("unp_vlan %s creation in %s failed! %s", vlan_id, self.switch_ip, results)
+            LOG.info("unp_vlan %s creation in %s failed! %s", vlan_id, self.switch_ip, results.errors())
         self.disconnect()
         return ret
 
@@ -238,33 +293,33 @@ class OmniSwitchRestfulDriver(object):
         if self.connect() == False:
             return False
 
-        results = self.aosapi.put('mib', 'alaDaUNPCustDomainMacRuleTable',
+        results = self._request('put', 'mib', 'alaDaUNPCustDomainMacRuleTable',
                   {'mibObject0':'alaDaUNPCustDomainMacRuleAddr:'+str(mac),
                    'mibObject1':'alaDaUNPCustDomainMacRuleDomainId:0',
                    'mibObject2':'alaDaUNPCustDomainMacRuleProfileName:'
-                                 +'OpenStack-UNP-'+str(vlan_id)}) ['result']
-        if self.aosapi.success():
+                                 +'OpenStack-UNP-'+str(vlan_id)})
+        if results.success():
             LOG.info("unp_macrule[%s %s] creation in %s success!", vlan_id, mac, self.switch_ip)
             ret = True
         else:
-            LOG.info("unp_macrule[%s %s] creation in %s failed! %s", vlan_id, mac, self.switch_ip, results)
+            LOG.info("unp_macrule[%s %s] creation in %s failed! %s", vlan_id, mac, self.switch_ip, results.errors())
         self.disconnect()
         return ret
 
     def get_unp_macrule(self, args=None):
+        """ returns the rows of the mac rule table as {column: value}; the table is read
+            table_page_size rows per request, never in one response """
         ret = None
         if self.connect() == False:
             return ret
 
-        results = self.aosapi.query('mib', 'alaDaUNPCustDomainMacRuleTable',
-                  {'mibObject0':'alaDaUNPCustDomainMacRuleAddr',
-                   'mibObject1':'alaDaUNPCustDomainMacRuleDomainId',
-                   'mibObject2':'alaDaUNPCustDomainMacRuleProfileName'})['result']
-
-        if self.aosapi.success():
-            ret = results
-        else:
-            LOG.info("get_unp_macrule failed in %s! [%s]", self.switch_ip, results)
+        try:
+            ret = list(self._iter_table('alaDaUNPCustDomainMacRuleTable',
+                                        ['alaDaUNPCustDomainMacRuleAddr',
+                                         'alaDaUNPCustDomainMacRuleDomainId',
+                                         'alaDaUNPCustDomainMacRuleProfileName']))
+        except AOSException, e :
+            LOG.info("get_unp_macrule failed in %s! [%s]", self.switch_ip, e)
         self.disconnect()
         return ret
 
@@ -273,16 +328,16 @@ class OmniSwitchRestfulDriver(object):
         if self.connect() == False:
             return False
 
-        results = self.aosapi.put('mib', 'alaDaUNPCustDomainVlanTagRuleTable',
+        results = self._request('put', 'mib', 'alaDaUNPCustDomainVlanTagRuleTable',
                   {'mibObject0':'alaDaUNPCustDomainVlanTagRuleVlan:'+str(vlan_id),
                    'mibObject1':'alaDaUNPCustDomainVlanTagRuleDomainId:0',
                    'mibObject2':'alaDaUNPCustDomainVlanTagRuleVlanProfileName:'
-                                 +'OpenStack-UNP-'+str(vlan_id)}) ['result']
-        if self.aosapi.diag() == 200:
+                                 +'OpenStack-UNP-'+str(vlan_id)})
+        if results.success():
             LOG.info("unp_vlanrule[%s] creation in %s success!", vlan_id, self.switch_ip)
             ret = True
         else:
-            LOG.info("unp_vlanrule[%s] creation in %s failed!", vlan_id, self.switch_ip, results)
+            LOG.info("unp_vlanrule[%s] creation in %s failed!", vlan_id, self.switch_ip, results.errors())
         self.disconnect()
         return ret
 
@@ -291,13 +346,13 @@ class OmniSwitchRestfulDriver(object):
         if self.connect() == False:
             return False
 
-        results = self.aosapi.delete('mib', 'alaDaUserNetProfileTable',
-                  {'mibObject0':'alaDaUserNetProfileName:'+'OpenStack-UNP-'+str(vlan_id)})['result']
-        if self.aosapi.success():
+        results = self._request('delete', 'mib', 'alaDaUserNetProfileTable',
+                  {'mibObject0':'alaDaUserNetProfileName:'+'OpenStack-UNP-'+str(vlan_id)})
+        if results.success():
             LOG.info("unp_vlan %s deletion in %s success!", vlan_id, self.switch_ip)
             ret = True
         else:
-            LOG.info("unp_vlan %s deletion in %s failed! %s", vlan_id, self.switch_ip, results)
+            LOG.info("unp_vlan %s deletion in %s failed! %s", vlan_id, self.switch_ip, results.errors())
         self.disconnect()
         return ret
 
@@ -306,14 +361,14 @@ class OmniSwitchRestfulDriver(object):
         if self.connect() == False:
             return False
 
-        results = self.aosapi.delete('mib', 'alaDaUNPCustDomainMacRuleTable',
+        results = self._request('delete', 'mib', 'alaDaUNPCustDomainMacRuleTable',
                   {'mibObject0':'alaDaUNPCustDomainMacRuleAddr:'+str(mac),
-                   'mibObject1':'alaDaUNPCustDomainMacRuleDomainId:0'})['result']
-        if self.aosapi.success():
+                   'mibObject1':'alaDaUNPCustDomainMacRuleDomainId:0'})
+        if results.success():
             LOG.info("unp_macrule[%s %s] deletion in %s suceess!", vlan_id, mac, self.switch_ip)
             ret = True
         else:
-            LOG.info("unp_macrule[%s %s] deletion in %s failed! %s", vlan_id, mac, self.switch_ip, results)
+            LOG.info("unp_macrule[%s %s] deletion in %s failed! %s", vlan_id, mac, self.switch_ip, results.errors())
             
         self.disconnect()
         return ret
@@ -323,14 +378,14 @@ class OmniSwitchRestfulDriver(object):
         if self.connect() == False:
             return False
 
-        results = self.aosapi.delete('mib', 'alaDaUNPCustDomainVlanTagRuleTable',
+        results = self._request('delete', 'mib', 'alaDaUNPCustDomainVlanTagRuleTable',
                   {'mibObject0':'alaDaUNPCustDomainVlanTagRuleVlan:'+str(vlan_id),
-                   'mibObject1':'alaDaUNPCustDomainVlanTagRuleDomainId:0'})['result']
-        if self.aosapi.success():
+                   'mibObject1':'alaDaUNPCustDomainVlanTagRuleDomainId:0'})
+        if results.success():
             LOG.info("unp_vlanrule[%s] deletion in %s success!", vlan_id, self.switch_ip)
             ret = True
         else:
-            LOG.info("unp_vlanrule[%s] deletion in %s failed!", vlan_id, self.switch_ip, results)
+            LOG.info("unp_vlanrule[%s] deletion in %s failed!", vlan_id, self.switch_ip, results.errors())
         self.disconnect()
         return ret
 
@@ -339,13 +394,13 @@ class OmniSwitchRestfulDriver(object):
         if self.connect() == False:
             return False
 
-        results = self.aosapi.post('mib', 'vStpBridge',
-                       {'mibObject0':'vStpBridgeMode:'+str(1)})['result']
-        if self.aosapi.success():
+        results = self._request('post', 'mib', 'vStpBridge',
+                       {'mibObject0':'vStpBridgeMode:'+str(1)})
+        if results.success():
             LOG.info("stp mode flat in %s success!", self.switch_ip)
             ret = True
         else:
-            LOG.info("stp mode flat in %s failed! %s", self.switch_ip, results)
+            LOG.info("stp mode flat in %s failed! %s", self.switch_ip, results.errors())
         self.disconnect()
         return ret
 
@@ -354,13 +409,13 @@ class OmniSwitchRestfulDriver(object):
         if self.connect() == False:
             return False
 
-        results = self.aosapi.post('mib', 'vStpBridge',
-                       {'mibObject0':'vStpBridgeMode:'+str(2)})['result']
-        if self.aosapi.success():
+        results = self._request('post', 'mib', 'vStpBridge',
+                       {'mibObject0':'vStpBridgeMode:'+str(2)})
+        if results.success():
             LOG.info("stp mode 1X1 in %s success!", self.switch_ip)
             ret = True
         else:
-            LOG.info("stp mode 1X1 in %s failed! %s", self.switch_ip, results)
+            LOG.info("stp mode 1X1 in %s failed! %s", self.switch_ip, results.errors())
         self.disconnect()
         return ret
 
@@ -369,13 +424,13 @@ class OmniSwitchRestfulDriver(object):
         if self.connect() == False:
             return False
 
-        results = self.aosapi.post('mib', 'alcatelIND1MVRPMIBObjects',
-                  {'mibObject0':'alaMvrpGlobalStatus:'+str(1)}) ['result']
-        if self.aosapi.success():
+        results = self._request('post', 'mib', 'alcatelIND1MVRPMIBObjects',
+                  {'mibObject0':'alaMvrpGlobalStatus:'+str(1)})
+        if results.success():
             LOG.info("mvrp enable global in %s success!", self.switch_ip)
             ret = True
         else:
-            LOG.info("mvrp enable global in %s failed! %s", self.switch_ip, results)
+            LOG.info("mvrp enable global in %s failed! %s", self.switch_ip, results.errors())
         self.disconnect()
         return ret
 
@@ -384,13 +439,13 @@ class OmniSwitchRestfulDriver(object):
         if self.connect() == False:
             return False
 
-        results = self.aosapi.post('mib', 'alcatelIND1MVRPMIBObjects',
-                  {'mibObject0':'alaMvrpGlobalStatus:'+str(2)}) ['result']
-        if self.aosapi.success():
+        results = self._request('post', 'mib', 'alcatelIND1MVRPMIBObjects',
+                  {'mibObject0':'alaMvrpGlobalStatus:'+str(2)})
+        if results.success():
             LOG.info("mvrp disable global in %s success!", self.switch_ip)
             ret = True
         else:
-            LOG.info("mvrp disable global in %s failed! %s", self.switch_ip, results)
+            LOG.info("mvrp disable global in %s failed! %s", self.switch_ip, results.errors())
             #print results
         self.disconnect()
         return ret
@@ -401,14 +456,14 @@ class OmniSwitchRestfulDriver(object):
             return False
 
         ifindex = self._get_ifindex_from_slotport(slotport)
-        results = self.aosapi.post('mib', 'alaMvrpPortConfigTable',
+        results = self._request('post', 'mib', 'alaMvrpPortConfigTable',
                         {'mibObject0':'alaMvrpPortConfigIfIndex:'+str(ifindex),
-                         'mibObject1':'alaMvrpPortStatus:'+str(1)})['result']
-        if self.aosapi.success():
+                         'mibObject1':'alaMvrpPortStatus:'+str(1)})
+        if results.success():
            LOG.info("mvrp enable on %s %s success!", slotport, self.switch_ip)
            ret = True
         else:
-           LOG.info("mvrp enable on %s %s failed! %s", slotport, self.switch_ip, results)
+           LOG.info("mvrp enable on %s %s failed! %s", slotport, self.switch_ip, results.errors())
         self.disconnect()
         return ret
 
@@ -418,35 +473,54 @@ class OmniSwitchRestfulDriver(object):
             return False
 
         ifindex = self._get_ifindex_from_slotport(slotport)
-        results = self.aosapi.post('mib', 'alaMvrpPortConfigTable',
+        results = self._request('post', 'mib', 'alaMvrpPortConfigTable',
                         {'mibObject0':'alaMvrpPortConfigIfIndex:'+str(ifindex),
-                         'mibObject1':'alaMvrpPortStatus:'+str(2)})['result']
-        if self.aosapi.success():
+                         'mibObject1':'alaMvrpPortStatus:'+str(2)})
+        if results.success():
            LOG.info("mvrp disable on %s %s success!", slotport, self.switch_ip)
            ret = True
         else:
-           LOG.info("mvrp disable on %s %s failed! %s", slotport, self.switch_ip, results)
+           LOG.info("mvrp disable on %s %s failed! %s", slotport, self.switch_ip, results.errors())
            #print results
         self.disconnect()
         return ret
 
+    ###beware lock used!!!, dont call this func from another locked func
     def enable_mvrp(self, slotport=None):
-        if slotport:
-            return self.enable_mvrp_if(slotport)
-        else:
-            if self.enable_stp_mode_flat() == True:
+        self.threadLock.acquire(1)
+        try:
+            if slotport:
+                return self.enable_mvrp_if(slotport)
+            elif self.enable_stp_mode_flat() == True:
                 return self.enable_mvrp_global()
             else:
                 return False
+        finally:
+            self.threadLock.release()
 
+    ###beware lock used!!!, dont call this func from another locked func
     def disable_mvrp(self, slotport=None):
-        if slotport:
-            return self.disable_mvrp_if(slotport)
-        else:
-            if self.disable_mvrp_global() == True:
+        self.threadLock.acquire(1)
+        try:
+            if slotport:
+                return self.disable_mvrp_if(slotport)
+            elif self.disable_mvrp_global() == True:
                 return self.disable_stp_mode_flat()
             else:
                 return False
+        finally:
+            self.threadLock.release()
+
+    ###beware lock used!!!, dont call this func from another locked func
+    def send_cli_batch(self, commands, stop_on_error=True):
+        """ sends the CLI commands, in order, in one session through the cli domain. if a command
+            fails and stop_on_error is set, the rest are not sent. returns (success, output or
+            error) of each command """
+        self.threadLock.acquire(1)
+        try:
+            return self._send_cli_batch(commands, stop_on_error)
+        finally:
+            self.threadLock.release()
 
 
     def enable_unp(self, slotport):
@@ -454,14 +528,14 @@ class OmniSwitchRestfulDriver(object):
         if self.connect() == False:
             return False
         ifindex = self._get_ifindex_from_slotport(slotport)
-        results = self.aosapi.put('mib', 'alaDaUNPPortTable',
+        results = self._request('put', 'mib', 'alaDaUNPPortTable',
                         {'mibObject0':'alaDaUNPPortIfIndex:'+str(ifindex),
-                         'mibObject1':'alaDaUNPPortClassificationFlag:'+str(1)})['result']
-        if self.aosapi.success():
+                         'mibObject1':'alaDaUNPPortClassificationFlag:'+str(1)})
+        if results.success():
             LOG.info("unp enable on %s %s success!", slotport, self.switch_ip)
             ret = True
         else:
-            LOG.info("unp enable on %s %s failed! [%s]", slotport, self.switch_ip, results)
+            LOG.info("unp enable on %s %s failed! [%s]", slotport, self.switch_ip, results.errors())
         self.disconnect()
         return ret
 
@@ -471,14 +545,14 @@ class OmniSwitchRestfulDriver(object):
             return False
 
         ifindex = self._get_ifindex_from_slotport(slotport)
-        results = self.aosapi.delete('mib', 'alaDaUNPPortTable',
+        results = self._request('delete', 'mib', 'alaDaUNPPortTable',
                         {'mibObject0':'alaDaUNPPortIfIndex:'+str(ifindex),
-                         'mibObject1':'alaDaUNPPortClassificationFlag:'+str(1)})['result']
-        if self.aosapi.success():
+                         'mibObject1':'alaDaUNPPortClassificationFlag:'+str(1)})
+        if results.success():
             LOG.info("unp disable on %s %s success!", slotport, self.switch_ip)
             ret = True
         else:
-            LOG.info("unp disable on %s %s failed! [%s]", slotport, self.switch_ip, results)
+            LOG.info("unp disable on %s %s failed! [%s]", slotport, self.switch_ip, results.errors())
             #print results
         self.disconnect()
         return ret
@@ -488,13 +562,13 @@ class OmniSwitchRestfulDriver(object):
         if self.connect() == False:
             return False
 
-        results = self.aosapi.post('mib', 'configManager',
-                        {'mibObject0':'configWriteMemory:'+str(1)})['result']
-        if self.aosapi.success():
+        results = self._request('post', 'mib', 'configManager',
+                        {'mibObject0':'configWriteMemory:'+str(1)})
+        if results.success():
             LOG.info("write memory success on %s", self.switch_ip)
             ret = True
         else:
-            LOG.info("write memory failed on %s [%s]", self.switch_ip, results)
+            LOG.info("write memory failed on %s [%s]", self.switch_ip, results.errors())
 
         self.disconnect()
         return ret
@@ -505,21 +579,22 @@ class OmniSwitchRestfulDriver(object):
         if self.connect() == False:
             return False
 
-        results = self.aosapi.post('mib', 'chasControlModuleTable',
-                        {'mibObject0':'entPhysicalIndex:'+str(65),
-                         'mibObject1':'chasControlVersionMngt:'+str(2)})['result']
-        if self.aosapi.success():
+        cmm = self._get_primary_cmm()
+        results = self._copy_running_certified(cmm)
+        if not results.success():
+            # the primary may have changed since it was read (takeover) or could not be read
+            self._primary_cmm = None
+            other = self._get_primary_cmm()
+            if other == cmm:
+                other = ('65', '66')[cmm == '65']
+            results = self._copy_running_certified(other)
+            if results.success():
+                self._primary_cmm = other
+        if results.success():
             LOG.info("copy running certified success on %s", self.switch_ip)
             ret = True
         else:
-            results = self.aosapi.post('mib', 'chasControlModuleTable',
-                        {'mibObject0':'entPhysicalIndex:'+str(66),
-                         'mibObject1':'chasControlVersionMngt:'+str(2)})['result']
-            if self.aosapi.success():
-                LOG.info("copy running certified success on %s", self.switch_ip)
-                ret = True
-            else:
-                LOG.info("copy running certified failed on %s [%s]", self.switch_ip, results)
+            LOG.info("copy running certified failed on %s [%s]", self.switch_ip, results.errors())
 
         self.disconnect()
         return ret
@@ -528,9 +603,13 @@ class OmniSwitchRestfulDriver(object):
     #####  OneTouch functions for OpenStack APIs #####
     def create_network(self, vlan_id, net_name=''):
         self.threadLock.acquire(1)
-        ret = 0
-        if self.create_vlan(vlan_id, net_name) == True :
-            ret = self.create_unp_vlan(vlan_id)
+        ret = False
+        if self.begin_session() == True :
+            batch = self.new_mib_batch()
+            row = self._add_mib_op(batch, 'create_network', [vlan_id, net_name])
+            self._execute_mib_batch(batch)
+            ret = batch.succeeded(row)
+            self.end_session()
         self.threadLock.release()
         return ret
 
@@ -560,23 +639,495 @@ class OmniSwitchRestfulDriver(object):
         self.threadLock.release()
         return ret
 
-    def save_config(self):
+    def create_network_bulk(self, net_list):
+        """ net_list is a list of (vlan_id, net_name). returns the result of each item """
+        return self._apply_mib_bulk('create_network', net_list)
+
+    def create_port_bulk(self, port_list):
+        """ port_list is a list of (vlan_id, mac). returns the result of each item """
+        return self._apply_mib_bulk('create_port', port_list)
+
+    def get_config_state(self, ports=[]):
+        """ reads the OpenStack config of the switch in one session. 'ports' are the slotports
+            whose vpas are to be read. returns an OmniSwitchConfigState, None if failed """
         self.threadLock.acquire(1)
-        ret = 0
-        if self.write_memory():
-            time.sleep(1)
-            ret = self.copy_running_certified()
-            time.sleep(2)
+        state = None
+        try:
+            if self.begin_session() == True :
+                try:
+                    state = self._read_config_state(ports)
+                finally:
+                    self.end_session()
+        finally:
             self.threadLock.release()
-            return ret
-        else:
-            ret = False
+        return state
+
+    def apply_config_ops(self, op_list):
+        """ op_list is a list of (function_name, args) of the config primitives, applied in
+            order in one session. returns True if all of them succeeded """
+        self.threadLock.acquire(1)
+        ret = False
+        if self.begin_session() == True :
+            if self._use_push(op_list):
+                ret = False not in self._push_config_ops(op_list)
+            else:
+                batch = self.new_mib_batch()
+                for function_name, args in op_list:
+                    self._add_mib_op(batch, function_name, args)
+                ret = self._execute_mib_batch(batch)
+            self.end_session()
+        self.threadLock.release()
+        return ret
+
+    def save_config(self):
+        """ write memory and copy running certified, then waits until the switch reports the
+            config certified and synchronized to the other CMM, if any. the lock is not held
+            while waiting """
+        if not self.start_save_config():
+            return False
+        while True:
+            ret = self.check_save_config()
+            if ret is not None:
+                return ret
+            time.sleep(self.save_poll_interval)
+
+    def start_save_config(self):
+        """ write memory and copy running certified; the switch completes the save in background,
+            see check_save_config """
+        self.threadLock.acquire(1)
+        ret = False
+        self._save_started = time.time()
+        self._save_skipped = False
+        if self.begin_session() == True :
+            if self._config_saved():
+                LOG.info("config of %s already saved and certified, nothing to save", self.switch_ip)
+                self._save_skipped = True
+                ret = True
+            else:
+                ret = self.write_memory() and self.copy_running_certified()
+            self.end_session()
+        self.threadLock.release()
+        return ret
+
+    def check_save_config(self):
+        """ True once the switch reports the config certified and synchronized, None while in
+            progress, False if not done within save_timeout """
+        if self._save_skipped:
+            return True
+        self.threadLock.acquire(1)
+        ret = False
+        if self.begin_session() == True :
+            ret = self._save_completed()
+            self.end_session()
         self.threadLock.release()
+        if ret:
+            LOG.info("config of %s saved in %.1f secs", self.switch_ip, time.time() - self._save_started)
+        elif ret is None and time.time() >= self._save_started + self.save_timeout:
+            LOG.info("save in %s not completed after %s secs!", self.switch_ip, self.save_timeout)
+            ret = False
         return ret
 
 
+    def new_mib_batch(self):
+        """ returns an OmniSwitchMibBatch that sends its rows in the session of this switch.
+            to be executed with the lock held, between begin_session and end_session """
+        return OmniSwitchMibBatch(self._request)
+
+
     #####   Internal Utility functions #####
     
+    def _apply_mib_bulk(self, function_name, item_list):
+        """ adds 'function_name'(*item) of every item to one batch. returns the result of each item """
+        self.threadLock.acquire(1)
+        rets = [False] * len(item_list)
+        if self.begin_session() == True :
+            op_list = [(function_name, list(item)) for item in item_list]
+            if self._use_push(op_list):
+                rets = self._push_config_ops(op_list)
+            else:
+                batch = self.new_mib_batch()
+                rows = [self._add_mib_op(batch, function_name, args) for function_name, args in op_list]
+                self._execute_mib_batch(batch)
+                rets = [batch.succeeded(row) for row in rows]
+            self.end_session()
+        self.threadLock.release()
+        return rets
+
+    def _get_primary_cmm(self):
+        """ entPhysicalIndex of the primary CMM; 65 (CMM A) if chasChassisTable can not be read """
+        if self._primary_cmm is None:
+            results = self._request('query', 'mib', 'chasChassisTable',
+                                    {'mibObject0':'chasPrimaryPhysicalIndex'})
+            rows = results.data().get('rows')
+            if results.success() and isinstance(rows, dict) and len(rows):
+                self._primary_cmm = str(rows.values()[0]['chasPrimaryPhysicalIndex'])
+            else:
+                LOG.info("primary CMM of %s unknown, using 65 [%s]", self.switch_ip, results.errors())
+                return '65'
+        return self._primary_cmm
+
+    def _copy_running_certified(self, cmm):
+        return self._request('post', 'mib', 'chasControlModuleTable',
+                             {'mibObject0':'entPhysicalIndex:'+str(cmm),
+                              'mibObject1':'chasControlVersionMngt:'+str(2)})
+
+    def _get_certify_status(self):
+        """ returns (chasControlCertifyStatus, chasControlSynchronizationStatus) of the primary
+            CMM, None if they can not be read """
+        cmm = self._get_primary_cmm()
+        results = self._request('query', 'mib', 'chasControlModuleTable',
+                                {'mibObject0':'chasControlCertifyStatus',
+                                 'mibObject1':'chasControlSynchronizationStatus',
+                                 'startIndex':cmm, 'limit':'1'})
+        rows = results.data().get('rows')
+        if not results.success() or not isinstance(rows, dict) or not isinstance(rows.get(cmm), dict):
+            return None
+        try:
+            return (int(rows[cmm]['chasControlCertifyStatus']),
+                    int(rows[cmm]['chasControlSynchronizationStatus']))
+        except (KeyError, ValueError):
+            return None
+
+    def _config_saved(self):
+        """ True only if the switch reports that the running config is identical to the saved
+            one (configChangeStatus) and that it is certified and synchronized. if any of them
+            can not be read or has any other value, the config is taken as not saved """
+        results = self._request('query', 'mib', 'configManager', {'mibObject0':'configChangeStatus'})
+        if not results.success():
+            return False
+        data = results.data()
+        rows = data.get('rows')
+        if isinstance(rows, dict) and len(rows):
+            data = rows.values()[0]
+        # ALCATEL-IND1-CONFIG-MGR-MIB: identical(1), different(2)
+        if str(data.get('configChangeStatus')) != '1':
+            return False
+
+        status = self._get_certify_status()
+        return status is not None and status[0] == 3 and status[1] in (2, 4)
+
+    def _save_completed(self):
+        """ True if the config is certified (3) and either synchronized (4) or there is no other
+            CMM (2), None if not yet or unknown """
+        status = self._get_certify_status()
+        if status is None:
+            LOG.info("certify status of %s can not be read, polled again", self.switch_ip)
+            return None
+        certify, sync = status
+        if certify == 3 and sync in (2, 4):
+            return True
+        return None
+
+    def _use_push(self, op_list):
+        return self.push_threshold > 0 and len(op_list) >= self.push_threshold
+
+    def _push_config_ops(self, op_list):
+        """ renders the ops into CLI config, pushes it in one request, applies it with one more
+            and checks the outcome of each op with one read of the config. the ops found not
+            applied are sent again as mib writes. returns the result of each op """
+        rets = [False] * len(op_list)
+        payload = '\n'.join(self.cli.render_all(op_list)) + '\n'
+        results = self._request('post', 'push', self.push_file_name, {'payload': payload})
+        if results.success():
+            # the push only stores the file, the switch runs it as a CLI script on apply. the file
+            # may be partly applied if this fails, so the config is read back in any case
+            command = self.cli.apply_config_file(self.push_file_name)[0]
+            results = self._request('query', 'cli', 'aos', {'cmd': command})
+            if not results.success():
+                LOG.info("cli <%s> in %s failed! %s", command, self.switch_ip, results.errors())
+            ports = set()
+            for function_name, args in op_list:
+                if function_name in ('create_vpa', 'delete_vpa'):
+                    ports.add(args[1].strip())
+            state = self._read_config_state(sorted(ports))
+            if state is not None:
+                rets = [self._op_applied(state, function_name, args) for function_name, args in op_list]
+        else:
+            LOG.info("push of %d ops to %s failed! %s", len(op_list), self.switch_ip, results.errors())
+
+        pending = [i for i in range(0, len(op_list)) if not rets[i]]
+        LOG.info("push of %d ops to %s: %d applied", len(op_list), self.switch_ip, len(op_list) - len(pending))
+        if len(pending):
+            batch = self.new_mib_batch()
+            rows = [self._add_mib_op(batch, op_list[i][0], op_list[i][1]) for i in pending]
+            self._execute_mib_batch(batch)
+            for i in range(0, len(pending)):
+                rets[pending[i]] = batch.succeeded(rows[i])
+        return rets
+
+    def _op_applied(self, state, function_name, args):
+        """ whether the config read from the switch shows the effect of the op """
+        function_name = function_name.replace('_locked', '')
+        vlan_id = int(args[0])
+        if function_name in ('create_port', 'delete_port'):
+            if len(args) > 1 and args[1]:
+                function_name = function_name.replace('port', 'unp_macrule')
+            else:
+                function_name = function_name.replace('port', 'unp_vlanrule')
+
+        if function_name == 'create_vlan':
+            return vlan_id in state.vlans
+        elif function_name == 'delete_vlan':
+            return vlan_id not in state.vlans
+        elif function_name == 'create_unp_vlan':
+            return vlan_id in state.unp_vlans
+        elif function_name == 'delete_unp_vlan':
+            return vlan_id not in state.unp_vlans
+        elif function_name == 'create_network':
+            return vlan_id in state.vlans and vlan_id in state.unp_vlans
+        elif function_name == 'delete_network':
+            return vlan_id not in state.vlans and vlan_id not in state.unp_vlans
+        elif function_name == 'create_unp_macrule':
+            return (vlan_id, str(args[1]).lower()) in state.mac_rules
+        elif function_name == 'delete_unp_macrule':
+            return (vlan_id, str(args[1]).lower()) not in state.mac_rules
+        elif function_name == 'create_unp_vlanrule':
+            return vlan_id in state.vlan_rules
+        elif function_name == 'delete_unp_vlanrule':
+            return vlan_id not in state.vlan_rules
+        elif function_name == 'create_vpa':
+            return (vlan_id, args[1].strip()) in state.vpas
+        elif function_name == 'delete_vpa':
+            return (vlan_id, args[1].strip()) not in state.vpas
+        return False
+
+    def _execute_mib_batch(self, batch):
+        ret = batch.execute()
+        for row in batch.failed():
+            method, table, objects = batch.rows[row][:3]
+            LOG.info("%s %s %s in %s failed! %s", method, table, objects, self.switch_ip, batch.errors(row))
+        return ret
+
+    def _add_mib_op(self, batch, function_name, args):
+        """ adds the rows of the config primitive (create_vlan, create_network, create_vpa...)
+            to the batch. returns the row whose outcome is that of the primitive """
+        unp_name = 'alaDaUserNetProfileName:OpenStack-UNP-'+str(args[0])
+        if function_name == 'create_network':
+            row = self._add_mib_op(batch, 'create_vlan', args)
+            return batch.add('put', 'alaDaUserNetProfileTable',
+                             [unp_name, 'alaDaUserNetProfileVlanID:'+str(args[0])], 1, row)
+        elif function_name == 'delete_network':
+            row = batch.add('delete', 'alaDaUserNetProfileTable', [unp_name])
+            return batch.add('delete', 'vlanTable', ['vlanNumber:'+str(args[0])], 1, row)
+        elif function_name in ('create_port', 'delete_port'):
+            if len(args) > 1 and args[1]:
+                function_name = function_name.replace('port', 'unp_macrule')
+            else:
+                function_name = function_name.replace('port', 'unp_vlanrule')
+                args = args[:1]
+        elif function_name in ('create_vlan_locked', 'delete_vlan_locked'):
+            function_name = function_name.replace('_locked', '')
+
+        if function_name == 'create_vlan':
+            net_name = ''
+            if len(args) > 1:
+                net_name = args[1]
+            return batch.add('put', 'vlanTable',
+                             ['vlanNumber:'+str(args[0]),
+                              'vlanDescription:'+self.switch_vlan_name_prefix+'-'+net_name+'-'+str(args[0])])
+        elif function_name == 'delete_vlan':
+            return batch.add('delete', 'vlanTable', ['vlanNumber:'+str(args[0])])
+        elif function_name == 'create_unp_vlan':
+            return batch.add('put', 'alaDaUserNetProfileTable',
+                             [unp_name, 'alaDaUserNetProfileVlanID:'+str(args[0])])
+        elif function_name == 'delete_unp_vlan':
+            return batch.add('delete', 'alaDaUserNetProfileTable', [unp_name])
+        elif function_name == 'create_unp_macrule':
+            return batch.add('put', 'alaDaUNPCustDomainMacRuleTable',
+                             ['alaDaUNPCustDomainMacRuleAddr:'+str(args[1]),
+                              'alaDaUNPCustDomainMacRuleDomainId:0',
+                              'alaDaUNPCustDomainMacRuleProfileName:OpenStack-UNP-'+str(args[0])], 2)
+        elif function_name == 'delete_unp_macrule':
+            return batch.add('delete', 'alaDaUNPCustDomainMacRuleTable',
+                             ['alaDaUNPCustDomainMacRuleAddr:'+str(args[1]),
+                              'alaDaUNPCustDomainMacRuleDomainId:0'], 2)
+        elif function_name == 'create_unp_vlanrule':
+            return batch.add('put', 'alaDaUNPCustDomainVlanTagRuleTable',
+                             ['alaDaUNPCustDomainVlanTagRuleVlan:'+str(args[0]),
+                              'alaDaUNPCustDomainVlanTagRuleDomainId:0',
+                              'alaDaUNPCustDomainVlanTagRuleVlanProfileName:OpenStack-UNP-'+str(args[0])], 2)
+        elif function_name == 'delete_unp_vlanrule':
+            return batch.add('delete', 'alaDaUNPCustDomainVlanTagRuleTable',
+                             ['alaDaUNPCustDomainVlanTagRuleVlan:'+str(args[0]),
+                              'alaDaUNPCustDomainVlanTagRuleDomainId:0'], 2)
+        elif function_name in ('create_vpa', 'delete_vpa'):
+            objects = ['vpaIfIndex:'+str(self._get_ifindex_from_slotport(args[1])),
+                       'vpaVlanNumber:'+str(args[0])]
+            if function_name == 'create_vpa':
+                return batch.add('put', 'vpaTable', objects + ['vpaType:2'], 2)
+            return batch.add('delete', 'vpaTable', objects, 2)
+        raise ValueError("%s can not be batched" % function_name)
+
+    def _request(self, method, domain, urn='', args={}):
+        """ aosapi.<method>(domain, urn, args) in the logged-in session. if the switch has expired
+            the session, it logs in again and retries once. a connection error is returned as a
+            failed result, so that the callers release their lock """
+        results = self._send(method, domain, urn, args)
+        if results.diag() == 401 :
+            LOG.info("session to %s expired, logging in again", self.switch_ip)
+            self._logged_in = False
+            if self.connect() == True :
+                results = self._send(method, domain, urn, args)
+        return results
+
+    def _send(self, method, domain, urn, args):
+        try:
+            results = getattr(self.aosapi, method)(domain, urn, args)
+            self.calls.connect_error = None
+            return results
+        except urllib2.HTTPError, e :
+            self.calls.connect_error = None # the switch answered, it is reachable
+            return AOSResult({'result': {'diag': e.code, 'error': str(e)}})
+        except (urllib2.URLError, socket.error), e :
+            LOG.info("Request to %s failed! [%s]", self.switch_ip, e)
+            self.calls.connect_error = str(e)
+            self._logged_in = False
+            return AOSResult({'result': {'diag': 0, 'error': str(e)}})
+
+    def _start_idle_logout(self):
+        if self.session_idle_timeout <= 0 or self._idle_logout_running :
+            return
+        self._idle_logout_running = True
+        idle_thread = threading.Thread(target=self._idle_logout_worker)
+        idle_thread.daemon = True
+        idle_thread.start()
+
+    def _idle_logout_worker(self):
+        while True:
+            time.sleep(max(self._last_used + self.session_idle_timeout - time.time(), 1))
+            self.threadLock.acquire(1)
+            try:
+                if not self._logged_in :
+                    self._idle_logout_running = False
+                    return
+                if time.time() - self._last_used >= self.session_idle_timeout :
+                    LOG.info("session to %s idle for %s secs, logging out", self.switch_ip, self.session_idle_timeout)
+                    self.logout()
+                    self._idle_logout_running = False
+                    return
+            finally:
+                self.threadLock.release()
+
+    def _send_cli_batch(self, commands, stop_on_error):
+        rets = [(False, 'not sent')] * len(commands)
+        if self.connect() == False:
+            return rets
+
+        for i in range(0, len(commands)):
+            results = self._request('query', 'cli', 'aos', {'cmd': commands[i]})
+            output = (results.get('result') or {}).get('output') or ''
+            if results.success():
+                LOG.info("cli <%s> in %s success!", commands[i], self.switch_ip)
+                rets[i] = (True, output)
+            else:
+                LOG.info("cli <%s> in %s failed! %s %s", commands[i], self.switch_ip, results.errors(), output)
+                rets[i] = (False, results.errors() or output)
+                if stop_on_error:
+                    break
+        self.disconnect()
+        return rets
+
+    def _create_vpa(self, vlan_id, slotport):
+        ret = False
+        if self.connect() == False:
+            return False
+
+        ifindex = self._get_ifindex_from_slotport(slotport)
+        results = self._request('put', 'mib', 'vpaTable',
+                        {'mibObject0':'vpaIfIndex:'+str(ifindex),
+                         'mibObject1':'vpaVlanNumber:'+str(vlan_id),
+                         'mibObject2':'vpaType:2'})
+        if results.success():
+            LOG.info("vpa %s --> %s created in %s successfully!", vlan_id, slotport, self.switch_ip)
+            ret = True
+        else:
+            LOG.info("vpa %s --> %s creation in %s failed! %s", vlan_id, slotport, self.switch_ip, results.errors())
+        self.disconnect()
+        return ret
+
+    def _delete_vpa(self, vlan_id, slotport):
+        ret = False
+        if self.connect() == False:
+            return False
+
+        ifindex = self._get_ifindex_from_slotport(slotport)
+        results = self._request('delete', 'mib', 'vpaTable',
+                        {'mibObject0':'vpaIfIndex:'+str(ifindex),
+                         'mibObject1':'vpaVlanNumber:'+str(vlan_id)})
+        if results.success():
+            LOG.info("vpa %s --> %s deleted in %s successfully!", vlan_id, slotport, self.switch_ip)
+            ret = True
+        else:
+            LOG.info("vpa %s --> %s deletion in %s failed! %s", vlan_id, slotport, self.switch_ip, results.errors())
+        self.disconnect()
+        return ret
+
+    def _iter_table(self, table, columns):
+        """ yields the rows of the mib table as {column: value}, reading it page by page in the
+            logged-in session. raises AOSException if the table can not be read """
+        try:
+            for index, row in self.aosapi.iter_table(table, columns, self.table_page_size):
+                if isinstance(row, dict):
+                    yield row
+        except AOSException, e :
+            if e.diag == 401 :
+                self._logged_in = False # log in again on the next call
+            raise
+        except urllib2.HTTPError, e :
+            raise AOSException("%s: %s" % (table, e), e.code)
+        except (urllib2.URLError, socket.error), e :
+            self.calls.connect_error = str(e)
+            self._logged_in = False
+            raise AOSException("%s: %s" % (table, e))
+
+    def _read_config_state(self, ports):
+        try:
+            return self._walk_config_state(ports)
+        except AOSException, e :
+            LOG.info("reading the config of %s failed! [%s]", self.switch_ip, e)
+            return None
+
+    def _walk_config_state(self, ports):
+        unp_prefix = 'OpenStack-UNP-'
+        state = OmniSwitchConfigState()
+
+        for row in self._iter_table('vlanTable', ['vlanNumber', 'vlanDescription']):
+            if row.get('vlanDescription', '').startswith(self.switch_vlan_name_prefix+'-'):
+                state.vlans[int(row['vlanNumber'])] = row['vlanDescription']
+
+        for row in self._iter_table('alaDaUserNetProfileTable',
+                                    ['alaDaUserNetProfileName', 'alaDaUserNetProfileVlanID']):
+            if row.get('alaDaUserNetProfileName', '').startswith(unp_prefix):
+                state.unp_vlans.add(int(row['alaDaUserNetProfileVlanID']))
+
+        for row in self._iter_table('alaDaUNPCustDomainMacRuleTable',
+                                    ['alaDaUNPCustDomainMacRuleAddr',
+                                     'alaDaUNPCustDomainMacRuleDomainId',
+                                     'alaDaUNPCustDomainMacRuleProfileName']):
+            profile = row.get('alaDaUNPCustDomainMacRuleProfileName', '')
+            if profile.startswith(unp_prefix):
+                state.mac_rules.add((int(profile[len(unp_prefix):]),
+                                     str(row['alaDaUNPCustDomainMacRuleAddr']).lower()))
+
+        for row in self._iter_table('alaDaUNPCustDomainVlanTagRuleTable',
+                                    ['alaDaUNPCustDomainVlanTagRuleVlan',
+                                     'alaDaUNPCustDomainVlanTagRuleDomainId',
+                                     'alaDaUNPCustDomainVlanTagRuleVlanProfileName']):
+            if row.get('alaDaUNPCustDomainVlanTagRuleVlanProfileName', '').startswith(unp_prefix):
+                state.vlan_rules.add(int(row['alaDaUNPCustDomainVlanTagRuleVlan']))
+
+        if len(ports):
+            port_map = {} # ifindex -> slotport, of the ports whose vpas are managed
+            for slotport in ports:
+                port_map[str(self._get_ifindex_from_slotport(slotport))] = slotport
+            for row in self._iter_table('vpaTable', ['vpaIfIndex', 'vpaVlanNumber', 'vpaType']):
+                vlan_id = int(row['vpaVlanNumber'])
+                if str(row.get('vpaType')) == '2' and str(row['vpaIfIndex']) in port_map and \
+                   vlan_id in state.vlans:
+                    state.add_vpa(vlan_id, port_map[str(row['vpaIfIndex'])])
+        state.vpa_ports = set(ports)
+        return state
+
     def _get_ifindex_from_slotport(self, slotport):
         """ convert slot/port = '1/2' to ifIndex = 1002 """
         """ convert chassis/slot/port = '1/2/3' to ifIndex = 102003 """
@@ -605,13 +1156,22 @@ class OmniSwitchRestfulDriver(object):
 
     # dont use lock in this API as it uses one-touch api which already has lock
     def clear_config(self, vlan_ids):
-        # delete mac_rules
-        results = self.get_unp_macrule()
-        if len(results['data']):
-            for i in vlan_ids:
-                for key, value in  results['data']['rows'].items():
-                    if 'OpenStack-UNP-'+str(i) == value['alaDaUNPCustDomainMacRuleProfileName'] :
-                        self.delete_port(i, value['alaDaUNPCustDomainMacRuleAddr'])
+        # delete mac_rules; the table is walked page by page, only the matching rules are kept
+        profiles = dict([('OpenStack-UNP-'+str(i), i) for i in vlan_ids])
+        mac_rules = []
+        if self.connect() == True:
+            try:
+                for row in self._iter_table('alaDaUNPCustDomainMacRuleTable',
+                                            ['alaDaUNPCustDomainMacRuleAddr',
+                                             'alaDaUNPCustDomainMacRuleProfileName']):
+                    profile = row.get('alaDaUNPCustDomainMacRuleProfileName', '')
+                    if profile in profiles:
+                        mac_rules.append((profiles[profile], row['alaDaUNPCustDomainMacRuleAddr']))
+            except AOSException, e :
+                LOG.info("reading the mac rules of %s failed! [%s]", self.switch_ip, e)
+            self.disconnect()
+        for vlan_id, mac in mac_rules:
+            self.delete_port(vlan_id, mac)
 
         # delete vlan_rules and vlans
         for i in vlan_ids:
@@ -31,14 +31,248 @@ import traceback
 import telnetlib
 import time
 import re
+import socket
 
 import thread
 import threading
+import Queue
 
 from neutron.plugins.omniswitch import omniswitch_constants as omni_const
+from neutron.plugins.omniswitch.omniswitch_cli_commands import OmniSwitchCliCommands
 
 LOG = logging.getLogger(__name__)
 
+# the driver apis that only send the CLI commands of OmniSwitchCliCommands, in order, stopping at
+# the first that fails; with an engine, start_call() runs them without holding the calling thread
+BATCH_APIS = set([
+    'create_vlan', 'create_vlan_locked', 'delete_vlan', 'delete_vlan_locked',
+    'create_unp_vlan', 'delete_unp_vlan', 'create_unp_macrule', 'delete_unp_macrule',
+    'create_unp_vlanrule', 'delete_unp_vlanrule', 'create_network', 'delete_network',
+    'create_port', 'delete_port', 'create_vpa', 'delete_vpa', 'enable_unp', 'disable_unp',
+    'enable_mvrp_if', 'disable_mvrp_if',
+])
+
+class OmniSwitchTelnetSession(object):
+
+    """
+    Name:        OmniSwitchTelnetSession
+    Description: One CLI session of an OmniSwitchTelnetDriver to its switch.
+
+    Details:     The session is opened by its first command and kept open across the calls. Once idle
+                 for the keepalive_interval of the driver it is checked, a dead session is closed and
+                 the next command opens a new one. A command batch holds the lock of the session, so
+                 only one runs in it at a time. The switch ip, credentials and prompt are those of
+                 the driver. connect_error is the connection error met by the last call made in
+                 the session, None if the switch was reached.
+    """
+
+    driver = None
+    telnetObj = None
+    threadLock = None
+    connect_error = None
+    _last_used = 0
+    _keepalive_running = False
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.threadLock = threading.Lock()
+
+    def connect(self):
+        drv = self.driver
+        try:
+            self.telnetObj = telnetlib.Telnet(drv.switch_ip, 23, 10)
+            #self.telnetObj.set_debuglevel(10)
+
+            self.telnetObj.read_until("login :", omni_const.OMNI_CLI_SMALL_TIMEOUT)
+            self.telnetObj.write(drv.switch_login + "\n")
+            self.telnetObj.read_until("assword : ", omni_const.OMNI_CLI_SMALL_TIMEOUT)
+            self.telnetObj.write(drv.switch_password + "\n")
+            if drv.switch_prompt not in self.telnetObj.read_until(drv.switch_prompt, omni_const.OMNI_CLI_SMALL_TIMEOUT):
+                LOG.info("Connection to %s failed! login refused", drv.switch_ip)
+                self.connect_error = None # the switch answered, it is reachable
+                self.disconnect()
+                return False
+        except (socket.error, EOFError), e:
+            LOG.info("Connection to %s failed! [%s]", drv.switch_ip, e)
+            self.connect_error = str(e)
+            self.disconnect()
+            return False
+
+        # the session is kept open across the calls, see _keepalive_worker
+        self.connect_error = None
+        self._last_used = time.time()
+        self._start_keepalive()
+        return True
+
+    def disconnect(self):
+        if self.telnetObj :
+            self.telnetObj.close()
+        self.telnetObj = None
+
+    def isConnected(self):
+        if(self.telnetObj == None):
+            return False
+
+        try:
+            self.telnetObj.write("\n")
+            if self.driver.switch_prompt in self.telnetObj.read_until(self.driver.switch_prompt,
+                                                                      omni_const.OMNI_CLI_PROMPT_TIMEOUT):
+                return True
+        except (socket.error, EOFError), e:
+            pass
+        # session dropped by the switch, a new one is needed
+        self.disconnect()
+        return False
+
+    def probe(self):
+        self.threadLock.acquire(1)
+        self.connect_error = None
+        try:
+            return self.isConnected() or self.connect()
+        finally:
+            self.threadLock.release()
+
+    def is_open(self):
+        return self.telnetObj is not None
+
+    def close(self):
+        self.threadLock.acquire(1)
+        try:
+            self.disconnect()
+        finally:
+            self.threadLock.release()
+
+    def send_batch(self, commands, stop_on_error=False):
+        """ see OmniSwitchTelnetDriver.send_batch """
+        rets = [(False, 'not sent')] * len(commands)
+        self.connect_error = None
+        if len(commands) == 0:
+            return rets
+        self.threadLock.acquire(1)
+        try:
+            for attempt in range(0, 2):
+                if self.telnetObj is None and self.connect() == False:
+                    LOG.info("sendCommand: <%s> failed! could not connect to %s", commands[0], self.driver.switch_ip)
+                    return rets
+                if self._run_batch(commands, stop_on_error, rets):
+                    return rets
+                self.disconnect()
+            LOG.info("sendCommand: <%s> failed! in %s, no answer", commands[0], self.driver.switch_ip)
+            return rets
+        finally:
+            self._last_used = time.time()
+            self.threadLock.release()
+
+    def read_output(self, command):
+        """ sends the show command and returns its output, None if failed """
+        switch_ip = self.driver.switch_ip
+        switch_prompt = self.driver.switch_prompt
+        self.threadLock.acquire(1)
+        self.connect_error = None
+        try:
+            if self.telnetObj is None and self.connect() == False:
+                return None
+            self.telnetObj.write(command + "\n")
+            output = self.telnetObj.read_until(switch_prompt, omni_const.OMNI_CLI_MEDIUM_TIMEOUT)
+            if switch_prompt not in output:
+                LOG.info("<%s> failed! in %s, no answer", command, switch_ip)
+                self.disconnect()
+                return None
+        except (socket.error, EOFError), e:
+            LOG.info("<%s> failed! in %s, session lost [%s]", command, switch_ip, e)
+            self.connect_error = str(e)
+            self.disconnect()
+            return None
+        finally:
+            self._last_used = time.time()
+            self.threadLock.release()
+        if re.search('ERROR', output):
+            LOG.info("<%s> failed! in %s [%s]", command, switch_ip, output.strip())
+            return None
+        return output
+
+
+    #####   Internal Utility functions #####
+
+    def _run_batch(self, commands, stop_on_error, rets):
+        """ fills rets with the answer of each command. returns False if the session was found
+            dead (closed or broken) before any answer came, so that the commands can be sent again """
+        i = 0
+        try:
+            # output left after the last prompt is not the answer of these commands. on a session
+            # closed by the switch meanwhile, this gets the EOF before anything is sent
+            self.telnetObj.read_very_eager()
+            if not stop_on_error:
+                self.telnetObj.write(''.join([command + "\n" for command in commands]))
+            for i in range(0, len(commands)):
+                if stop_on_error:
+                    self.telnetObj.write(commands[i] + "\n")
+                ret, output = self._read_answer(commands[i])
+                if ret is None:
+                    # not sent again, the switch may still run the commands. the answers are out
+                    # of step with the commands, the session has to go
+                    LOG.info("sendCommand: <%s> to %s, no prompt after [%s]", commands[i], self.driver.switch_ip, output.strip())
+                    rets[i] = (False, output)
+                    self.disconnect()
+                    return True
+                rets[i] = (ret, output)
+                if not ret and stop_on_error:
+                    break
+        except (socket.error, EOFError), e:
+            LOG.info("sendCommand: <%s> to %s, session lost [%s]", commands[i], self.driver.switch_ip, e)
+            self.connect_error = str(e)
+            if i == 0:
+                return False
+            self.disconnect()
+        return True
+
+    def _read_answer(self, command):
+        """ returns (True/False as per the answer of the switch, output) as soon as the prompt
+            ending the answer shows up; (None, output) if it did not come back. the answer is
+            the output upto the first prompt, so that pipelined answers are split correctly """
+        start = time.time()
+        timeout = omni_const.OMNI_CLI_MEDIUM_TIMEOUT
+        if command.startswith('write memory') or command.startswith('copy '):
+            timeout = omni_const.OMNI_CLI_SAVE_TIMEOUT
+        index, match, output = self.telnetObj.expect([self.driver.prompt_pattern], timeout)
+        if index == -1:
+            return (None, output)
+        error = self.driver.error_pattern.search(output)
+        if error is None:
+            LOG.info("sendCommand: <%s> to %s success! (%.3f secs)", command, self.driver.switch_ip, time.time() - start)
+            return (True, output)
+        LOG.info("sendCommand: <%s> failed! in %s, ret = %s (%.3f secs)", command, self.driver.switch_ip,
+                 output[error.start():].split('\n')[0].strip(), time.time() - start)
+        return (False, output)
+
+    def _start_keepalive(self):
+        if self.driver.keepalive_interval <= 0 or self._keepalive_running :
+            return
+        self._keepalive_running = True
+        keepalive_thread = threading.Thread(target=self._keepalive_worker)
+        keepalive_thread.daemon = True
+        keepalive_thread.start()
+
+    def _keepalive_worker(self):
+        """ checks the open session once idle for keepalive_interval, which also keeps the switch
+            from closing it. a dead session is closed, the next command opens a new one """
+        while True:
+            time.sleep(max(self._last_used + self.driver.keepalive_interval - time.time(), 1))
+            self.threadLock.acquire(1)
+            try:
+                if self.telnetObj is None :
+                    self._keepalive_running = False
+                    return
+                if time.time() - self._last_used >= self.driver.keepalive_interval :
+                    if not self.isConnected():
+                        LOG.info("session to %s lost, closed", self.driver.switch_ip)
+                        self._keepalive_running = False
+                        return
+                    self._last_used = time.time()
+            finally:
+                self.threadLock.release()
+
+
 class OmniSwitchTelnetDriver(object):
 
     """ 
@@ -49,23 +283,36 @@ class OmniSwitchTelnetDriver(object):
     Details:     It is used by OmniSwitchDevicePluginV2 to perform the necessary configuration on the physical 
                  switches as response to OpenStack networking APIs. This driver is used only for above mentioned 
                  AOS 6x devices. 
+                 The commands run in a pool of up to 'session_pool_size' CLI sessions to the switch,
+                 so that independent calls made at the same time do not wait for each other. The
+                 caller keeps the order of the dependent calls, see OmniSwitchOpQueue.
+                 With set_engine(), the sessions are run by an OmniSwitchTelnetEngine shared with
+                 other switches instead of a thread each, the api stays the same.
     """
 
-    telnetObj = None
     switch_ip = None
     switch_login = None
     switch_password = None
     switch_prompt = None
     is6x = True
-    threadLock = None
     _init_done = False
+    calls = None # per thread: connect_error of the last call made by the thread, see take_connect_error
+    sessions = None # OmniSwitchTelnetSession of the pool
+    idle_sessions = None # sessions of the pool not in use, the last used on top
+    engine = None # OmniSwitchTelnetEngine running the sessions, None for OmniSwitchTelnetSession
+    prompt_pattern = None # ends the answer of a command
+    error_pattern = None # in the answer of a command that failed
 
     ### user configs
+    keepalive_interval = 60 # secs of idle after which the open session is checked, 0 to disable
+    session_pool_size = 1 # max number of CLI sessions open at once to the switch
     switch_vlan_name_prefix = ''
 
 
     def __init__(self, ip, bool6x, login='admin', password='switch', prompt='->'):
+        self.calls = threading.local()
         self.is6x = bool6x
+        self.cli = OmniSwitchCliCommands(bool6x, self.switch_vlan_name_prefix)
         self.switch_ip = ip.strip()
         if len(self.switch_ip) == 0 :
             LOG.info("Init Error! Must provide a valid IP address!!!")
@@ -82,236 +329,184 @@ class OmniSwitchTelnetDriver(object):
         self.switch_prompt = prompt.strip()
         if len(self.switch_prompt) == 0 :
             self.switch_prompt = '->'
+        self.prompt_pattern = re.compile(re.escape(self.switch_prompt))
+        self.error_pattern = re.compile('ERROR')
 
-        self.threadLock = threading.Lock()
+        self.set_session_pool_size(self.session_pool_size)
         self._init_done = True
 
     def set_config(self, vlan_name_prefix):
         self.switch_vlan_name_prefix = vlan_name_prefix
+        self.cli.vlan_name_prefix = vlan_name_prefix
+
+    def set_keepalive_interval(self, keepalive_interval):
+        self.keepalive_interval = keepalive_interval
+
+    def set_session_pool_size(self, session_pool_size):
+        if self.sessions :
+            self.disconnect()
+            if self.engine :
+                for session in self.sessions:
+                    self.engine.remove_session(session)
+        self.session_pool_size = max(session_pool_size, 1)
+        self.sessions = [self._new_session() for i in range(0, self.session_pool_size)]
+        self.idle_sessions = Queue.LifoQueue()
+        for session in self.sessions:
+            self.idle_sessions.put(session)
+
+    def set_engine(self, engine):
+        self.engine = engine
+        self.set_session_pool_size(self.session_pool_size)
 
     def connect(self):
-        if self._init_done == False :
-            LOG.info("Driver is not initialized!!!")
-            return False
-       
-        self.telnetObj = telnetlib.Telnet(self.switch_ip, 23, 10)
-        #self.telnetObj.set_debuglevel(10)
-
-        self.telnetObj.read_until("login :", omni_const.OMNI_CLI_SMALL_TIMEOUT)
-        self.telnetObj.write(self.switch_login + "\n")
-        self.telnetObj.read_until("assword : ", omni_const.OMNI_CLI_SMALL_TIMEOUT)
-        self.telnetObj.write(self.switch_password + "\n")
-        if(self.telnetObj.read_until(self.switch_prompt, omni_const.OMNI_CLI_PROMPT_TIMEOUT) == None):
-            LOG.info("Connection to %s failed!", self.switch_ip)
-            return False
-
-        return True
- 
+        """ opens a session of the pool, unless one is open already """
+        return self.probe()
 
     def disconnect(self):
-        if self.telnetObj :
-            self.telnetObj.close()
-        self.telnetObj = None
+        """ closes all the sessions of the pool, once their commands are done """
+        for session in self.sessions or []:
+            session.close()
 
     def isConnected(self):
-        if(self.telnetObj == None):
-            return False
+        return True in [session.is_open() for session in self.sessions or []]
 
-        self.telnetObj.write("\n\n")
-        if(self.telnetObj.read_until(self.switch_prompt, omni_const.OMNI_CLI_PROMPT_TIMEOUT) == None):
+    def probe(self):
+        """ checks whether the switch is reachable and accepts the login """
+        session = self._get_session()
+        if session is None :
             return False
-        else:
-            return True
+        try:
+            return session.probe()
+        finally:
+            self._put_session(session)
 
     def sendCommand(self, command):
-        #LOG.info("sendCommand: <%s> to %s entry!", command, self.switch_ip)
-        self.threadLock.acquire(1)
-        #LOG.info("sendCommand: <%s> to %s lock acquired!", command, self.switch_ip)
+        return self.send_batch([command], True)[0][0]
+
+    def send_batch(self, commands, stop_on_error=False):
+        """ sends the commands in a session of the pool, returns (success, output) of each of them.
+            without stop_on_error they are pipelined: all are written back to back and the
+            interleaved answers are split at the prompts. with stop_on_error a command is written
+            only once the previous one succeeded, so nothing runs after a failure. if the session
+            turns out to be dead before any answer came, it connects again and sends them once more """
+        session = self._get_session()
+        if session is None :
+            return [(False, 'not sent')] * len(commands)
+        try:
+            return session.send_batch(commands, stop_on_error)
+        finally:
+            self._put_session(session)
+
+    def start_call(self, function_name, args, callback):
+        """ starts the driver api in an idle session of the engine and returns at once; once it is
+            done, callback(ret, connect_error) is called in the engine thread, so it must not block.
+            returns False, callback not called, if the api can not be run that way now: no engine,
+            not in BATCH_APIS or all the sessions in use. the caller then makes the call itself """
+        if self.engine is None or self._init_done == False or function_name not in BATCH_APIS:
+            return False
+        try:
+            commands = self.cli.render(function_name, args)
+        except (TypeError, ValueError):
+            return False # bad args, the call itself reports it
+        try:
+            session = self.idle_sessions.get_nowait()
+        except Queue.Empty:
+            return False
 
-        if(self.isConnected() == False):
-            if(self.connect() == False):
-                self.threadLock.release()
-                #LOG.info("sendCommand: <%s> to %s lock released!", command, self.switch_ip) 
-                #LOG.info("sendCommand: <%s> to %s exit!", command, self.switch_ip)
-                return False
+        def done(job):
+            self.idle_sessions.put(session)
+            callback(False not in [ret for ret, output in job.rets], job.connect_error)
+        session.start_batch(commands, True, done)
+        return True
 
-        #if(self.isConnected() == True):
-        if self.telnetObj :
-            self.telnetObj.write(command)
-            self.telnetObj.write("\n")
-            ret = self.telnetObj.read_until("ERROR", 1) #omni_const.OMNI_CLI_SMALL_TIMEOUT)
-            #LOG.info("VAD: sendCommand: <%s> to %s, RETURNED = <%s>", command, self.switch_ip, ret)
-            if re.search('ERROR', ret) == None :
-                # this additional read makes command execute is completed
-                self.telnetObj.read_until(self.switch_prompt, omni_const.OMNI_CLI_SMALL_TIMEOUT)
-                LOG.info("sendCommand: <%s> to %s success!", command, self.switch_ip)
-                self.threadLock.release()
-                #LOG.info("sendCommand: <%s> to %s lock released!", command, self.switch_ip)
-                #LOG.info("sendCommand: <%s> to %s exit!", command, self.switch_ip)
-                return True
-            else:
-                ret = self.telnetObj.read_until('\n', omni_const.OMNI_CLI_SMALL_TIMEOUT)
-                LOG.info("sendCommand: <%s> failed! in %s, ret = ERROR%s", command, self.switch_ip, ret)
-                self.threadLock.release()
-                #LOG.info("sendCommand: <%s> to %s lock released!", command, self.switch_ip)
-                #LOG.info("sendCommand: <%s> to %s exit!", command, self.switch_ip)
-                return False
-        else:
-            LOG.info("Could not connect to %s", self.switch_ip)
-            LOG.info("sendCommand: <%s> failed!", command)
-            self.threadLock.release()
-            #LOG.info("sendCommand: <%s> to %s lock released!", command, self.switch_ip)
-            #LOG.info("sendCommand: <%s> to %s exit!", command, self.switch_ip)
-            return False
+    def take_connect_error(self):
+        """ returns the connection error met by the last call made by the current thread, None
+            if the switch was reached or no call was made since the previous take """
+        connect_error = getattr(self.calls, 'connect_error', None)
+        self.calls.connect_error = None
+        return connect_error
 
     def create_vpa(self, vlan_id, slotport, args=None):
-        if self.is6x :
-            return self.sendCommand('vlan '+str(vlan_id)+' 802.1q '+str(slotport))
-        else:
-            if len(slotport.split('/')) == 1:
-                return self.sendCommand('vlan '+str(vlan_id)+' members linkagg '+str(slotport)+' tagged')
-            else:
-                return self.sendCommand('vlan '+str(vlan_id)+' members port '+str(slotport)+' tagged')
+        return self._send_commands(self.cli.create_vpa(vlan_id, slotport))
             
     def delete_vpa(self, vlan_id, slotport, args=None):
-        if self.is6x :
-            return self.sendCommand('no 802.1q '+str(slotport))
-        else:
-            if len(slotport.split('/')) == 1:
-                return self.sendCommand('no vlan '+str(vlan_id)+' members linkagg '+str(slotport))
-            else:
-                return self.sendCommand('no vlan '+str(vlan_id)+' members port '+str(slotport))
+        return self._send_commands(self.cli.delete_vpa(vlan_id, slotport))
 
     def create_vlan_locked(self, vlan_id, net_name=''):
         return self.create_vlan(vlan_id, net_name)
 
     def create_vlan(self, vlan_id, net_name=''):
-        vlan_name = str(self.switch_vlan_name_prefix+'-'+net_name+'-'+str(vlan_id))
-        #return self.sendCommand('vlan '+str(vlan_id)+' name '+'OpenStack-'+str(vlan_id))
-        return self.sendCommand(str('vlan '+str(vlan_id)+' name '+vlan_name))
+        return self._send_commands(self.cli.create_vlan(vlan_id, net_name))
 
     def delete_vlan_locked(self, vlan_id):
         return self.delete_vlan(vlan_id)
 
     def delete_vlan(self, vlan_id):
-        return self.sendCommand('no vlan '+str(vlan_id))
+        return self._send_commands(self.cli.delete_vlan(vlan_id))
 
     def create_unp_vlan(self, vlan_id, args=None):
-        return self.sendCommand('unp name '+'OpenStack-UNP-'+str(vlan_id)+' vlan '+str(vlan_id))
+        return self._send_commands(self.cli.create_unp_vlan(vlan_id))
 
     def create_unp_macrule(self, vlan_id, mac, args=None):
-        return self.sendCommand('unp classification mac-address '+str(mac)+' unp-name '+'OpenStack-UNP-'+str(vlan_id))
+        return self._send_commands(self.cli.create_unp_macrule(vlan_id, mac))
 
     def get_unp_macrule(self, args=None):
-        command = 'show unp classification mac-rule'
-        if(self.isConnected() == False):
-            if(self.connect() == False):
-                return False
-
-        if(self.isConnected() == True):
-            self.telnetObj.write(command)
-            self.telnetObj.write("\n")
-            ret = self.telnetObj.read_until("ERROR", omni_const.OMNI_CLI_SMALL_TIMEOUT)
-            if re.search('ERROR', ret) == None :
-                mac_pattern = re.compile('\w\w:\w\w:\w\w:\w\w:\w\w:\w\w')
-                return mac_pattern.findall(ret)
-            else:
-                ret = self.telnetObj.read_until('\n', omni_const.OMNI_CLI_SMALL_TIMEOUT)
-                LOG.info("sendCommand: <%s> failed!, ret = ERROR%s", command, ret)
-                return False
-        else:
-            LOG.info("Could not connect to %s", self.switch_ip)
-            LOG.info("sendCommand: <%s> failed!", command)
+        output = self._read_output('show unp classification mac-rule')
+        if output is None:
             return False
-
-        pass
+        mac_pattern = re.compile('\w\w:\w\w:\w\w:\w\w:\w\w:\w\w')
+        return mac_pattern.findall(output)
 
     def create_unp_vlanrule(self, vlan_id):
-        return self.sendCommand('unp classification vlan-tag '+str(vlan_id)+' unp-name '+'OpenStack-UNP-'+str(vlan_id))
+        return self._send_commands(self.cli.create_unp_vlanrule(vlan_id))
 
     def delete_unp_vlan(self, vlan_id):
-        return self.sendCommand('no unp name '+'OpenStack-UNP-'+str(vlan_id))
+        return self._send_commands(self.cli.delete_unp_vlan(vlan_id))
 
     def delete_unp_macrule(self, vlan_id, mac):
-        return self.sendCommand('no unp classification mac-address '+str(mac))
+        return self._send_commands(self.cli.delete_unp_macrule(vlan_id, mac))
 
     def delete_unp_vlanrule(self, vlan_id):
-        return self.sendCommand('no unp classification vlan-tag '+str(vlan_id))
+        return self._send_commands(self.cli.delete_unp_vlanrule(vlan_id))
 
     def enable_stp_mode_flat(self):
-        if self.is6x :
-            return self.sendCommand('bridge mode flat')
-        else:
-            return self.sendCommand('spantree mode flat')
+        return self._send_commands(self.cli.enable_stp_mode_flat())
 
     def disable_stp_mode_flat(self):
-        if self.is6x :
-            return self.sendCommand('bridge mode 1x1')
-        else:
-            return self.sendCommand('spantree mode per-vlan')
+        return self._send_commands(self.cli.disable_stp_mode_flat())
 
     def enable_mvrp_global(self):
-        return self.sendCommand('mvrp enable')
+        return self._send_commands(self.cli.enable_mvrp_global())
 
     def disable_mvrp_global(self):
-        return self.sendCommand('mvrp disable')
+        return self._send_commands(self.cli.disable_mvrp_global())
 
     def enable_mvrp_if(self, slotport):
-        if len(slotport.split('/')) == 1:
-            return self.sendCommand('mvrp linkagg '+str(slotport)+' enable')
-        else:
-            return self.sendCommand('mvrp port '+str(slotport)+' enable')
+        return self._send_commands(self.cli.enable_mvrp_if(slotport))
 
     def disable_mvrp_if(self, slotport):
-        if len(slotport.split('/')) == 1:
-            return self.sendCommand('mvrp linkagg '+str(slotport)+' disable')
-        else:
-            return self.sendCommand('mvrp port '+str(slotport)+' disable')
+        return self._send_commands(self.cli.disable_mvrp_if(slotport))
 
     def enable_mvrp(self, slotport=None):
-        if slotport:
-            return self.enable_mvrp_if(slotport)
-        else:
-            if self.enable_stp_mode_flat() == True:
-                return self.enable_mvrp_global()
-            else:
-                return False
+        return self._send_commands(self.cli.enable_mvrp(slotport))
        
     def disable_mvrp(self, slotport=None):
-        if slotport:
-            return self.disable_mvrp_if(slotport)
-        else:
-            if self.disable_mvrp_global() == True:
-                return self.disable_stp_mode_flat()
-            else:
-                return False
+        return self._send_commands(self.cli.disable_mvrp(slotport))
 
     def enable_unp(self, slotport):
-        if len(slotport.split('/')) == 1:
-            if self.sendCommand('unp linkagg '+str(slotport)):
-                return self.sendCommand('unp linkagg '+str(slotport)+' classification enable')
-        else:
-            if self.sendCommand('unp port '+str(slotport)):
-                return self.sendCommand('unp port '+str(slotport)+' classification enable')
-        return False
+        return self._send_commands(self.cli.enable_unp(slotport))
 
     def disable_unp(self, slotport):
-        if len(slotport.split('/')) == 1:
-            return self.sendCommand('no unp linkagg '+str(slotport))
-        else:
-            return self.sendCommand('no unp port '+str(slotport))
+        return self._send_commands(self.cli.disable_unp(slotport))
 
     def write_memory_flash_synchro(self):
-        return self.sendCommand('write memory flash-synchro')
+        return self._send_commands(self.cli.write_memory_flash_synchro())
 
     def write_memory(self):
-        return self.sendCommand('write memory')
+        return self._send_commands(self.cli.write_memory())
 
     def copy_running_certified(self):
-        if self.is6x :
-            return self.sendCommand('copy working certified')
-        else:
-            return self.sendCommand('copy running certified')
+        return self._send_commands(self.cli.copy_running_certified())
 
     #####  OneTouch functions for OpenStack APIs #####
     def create_network(self, vlan_id, net_name=''):
@@ -338,23 +533,84 @@ class OmniSwitchTelnetDriver(object):
         else :
             return self.delete_unp_vlanrule(vlan_id)
 
+    def create_network_bulk(self, net_list):
+        """ net_list is a list of (vlan_id, net_name). returns the result of each item.
+            the vlans are pipelined, then the unp profiles of the vlans created """
+        vlan_rets = self.send_batch([self.cli.create_vlan(vlan_id, net_name)[0] for vlan_id, net_name in net_list])
+        rets = [False] * len(net_list)
+        created = [i for i in range(0, len(net_list)) if vlan_rets[i][0]]
+        unp_rets = self.send_batch([self.cli.create_unp_vlan(net_list[i][0])[0] for i in created])
+        for j in range(0, len(created)):
+            rets[created[j]] = unp_rets[j][0]
+        return rets
+
+    def create_port_bulk(self, port_list):
+        """ port_list is a list of (vlan_id, mac). returns the result of each item """
+        commands = [self.cli.create_port(vlan_id, mac)[0] for vlan_id, mac in port_list]
+        return [ret for ret, output in self.send_batch(commands)]
+
     def save_config(self):
+        if self.is_config_saved():
+            LOG.info("config of %s already saved and certified, nothing to save", self.switch_ip)
+            return True
         return self.write_memory_flash_synchro()
 
+    def is_config_saved(self):
+        """ True only if the switch reports the running config identical to the saved one,
+            certified and synchronized; False if that can not be read """
+        status = self._read_output('show configuration status')
+        if status is None or not re.search('identical', status, re.IGNORECASE):
+            return False
+        directory = self._read_output('show running-directory')
+        if directory is None or re.search('CERTIFY NEEDED|NOT SYNCHRONIZED', directory, re.IGNORECASE):
+            return False
+        return True
+
     def clear_config(self, vlan_ids):
-        # delete mac_rules
+        # delete mac_rules, vlan_rules and vlans, pipelined
+        commands = []
         results = self.get_unp_macrule()
         if results and len(results):
-            for i in vlan_ids:
-                for mac in results:
-                    self.delete_unp_macrule(0, mac)
+            for mac in results:
+                commands.extend(self.cli.delete_unp_macrule(0, mac))
 
-        # delete vlan_rules and vlans
         for i in vlan_ids:
-            self.delete_unp_vlanrule(i)
-            self.delete_unp_vlan(i)
-            self.delete_vlan(i)
+            commands.extend(self.cli.delete_unp_vlanrule(i))
+            commands.extend(self.cli.delete_unp_vlan(i))
+            commands.extend(self.cli.delete_vlan(i))
+        self.send_batch(commands)
 
 
     #####   Internal Utility functions #####
-    # <define here>
+
+    def _new_session(self):
+        if self.engine :
+            return self.engine.new_session(self)
+        return OmniSwitchTelnetSession(self)
+
+    def _get_session(self):
+        """ takes a session out of the pool, waits if all of them are in use. the last used one is
+            taken first, so the other sessions are opened only when calls really run at once """
+        if self._init_done == False :
+            LOG.info("Driver is not initialized!!!")
+            return None
+        return self.idle_sessions.get()
+
+    def _put_session(self, session):
+        # the outcome of the call just made in the session, before another thread can take it
+        self.calls.connect_error = session.connect_error
+        self.idle_sessions.put(session)
+
+    def _read_output(self, command):
+        """ sends the show command and returns its output, None if failed """
+        session = self._get_session()
+        if session is None :
+            return None
+        try:
+            return session.read_output(command)
+        finally:
+            self._put_session(session)
+
+    def _send_commands(self, commands):
+        """ sends the commands in order, stops at the first that fails """
+        return False not in [ret for ret, output in self.send_batch(commands, True)]
@@ -0,0 +1,612 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: omniswitch_telnet_engine.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+import errno
+import logging
+import os
+import select
+import socket
+import threading
+import time
+import traceback
+
+from telnetlib import IAC, DO, DONT, WILL, WONT, SB, SE
+
+from neutron.plugins.omniswitch import omniswitch_constants as omni_const
+
+LOG = logging.getLogger(__name__)
+
+
+class OmniSwitchTelnetJob(object):
+
+    """ one call made on an OmniSwitchTelnetEngineSession, carried out by the engine thread """
+
+    def __init__(self, kind, commands=(), stop_on_error=False):
+        self.kind = kind # 'batch', 'probe' or 'close'
+        self.commands = list(commands)
+        self.stop_on_error = stop_on_error
+        self.rets = [(False, 'not sent')] * len(self.commands)
+        self.index = 0 # command whose answer is awaited
+        self.retried = False
+        self.result = False
+        self.connect_error = None # connection error met by the job, None if the switch was reached
+        self.callback = None # called with the job once done, in the engine thread
+        self.done = threading.Event()
+
+
+class OmniSwitchTelnetEngineSession(object):
+
+    """
+    Name:        OmniSwitchTelnetEngineSession
+    Description: CLI session of an OmniSwitchTelnetDriver run by an OmniSwitchTelnetEngine.
+
+    Details:     Same calls and outcomes as OmniSwitchTelnetSession, but the session holds no
+                 thread of its own: the caller hands the job to the engine and sleeps until it is
+                 done, or with start_batch() gets called back. In the engine thread the session is a state machine over a non-blocking
+                 socket...
+                    CONNECTING - the tcp connect is in progress.
+                    LOGIN, PASSWORD, PROMPT - the login, until the prompt shows up.
+                    READY      - logged in, idle.
+                    ANSWER     - the commands of the job are sent, waiting for their answers.
+                    CHECK      - waiting for the prompt after an empty line (keepalive, probe).
+                 The telnet options asked by the switch are all refused, as telnetlib does.
+    """
+
+    CLOSED = 'closed'
+    CONNECTING = 'connecting'
+    LOGIN = 'login'
+    PASSWORD = 'password'
+    PROMPT = 'prompt'
+    READY = 'ready'
+    ANSWER = 'answer'
+    CHECK = 'check'
+
+    driver = None
+    engine = None
+    sock = None
+    state = CLOSED
+    deadline = None # when the step in progress times out
+    job = None # job in progress
+    connect_error = None # of the last call, as OmniSwitchTelnetSession
+    _last_used = 0
+
+    def __init__(self, driver, engine):
+        self.driver = driver
+        self.engine = engine
+        self.rawbuf = '' # telnet command cut at the end of the data received
+        self.buf = '' # data received, not consumed yet
+        self.outbuf = '' # data to send
+        self.jobs = [] # jobs waiting for the one in progress
+        self.answer_start = 0
+
+    def probe(self):
+        return self._call(OmniSwitchTelnetJob('probe')).result
+
+    def close(self):
+        self._call(OmniSwitchTelnetJob('close'))
+
+    def is_open(self):
+        return self.sock is not None
+
+    def send_batch(self, commands, stop_on_error=False):
+        """ see OmniSwitchTelnetDriver.send_batch """
+        if len(commands) == 0:
+            self.connect_error = None
+            return []
+        return self._call(OmniSwitchTelnetJob('batch', commands, stop_on_error)).rets
+
+    def start_batch(self, commands, stop_on_error, callback):
+        """ as send_batch, without waiting: callback(job) is called in the engine thread once
+            the job is done, job.rets and job.connect_error are its outcome """
+        job = OmniSwitchTelnetJob('batch', commands, stop_on_error)
+        job.callback = callback
+        self.engine.submit(self, job)
+
+    def read_output(self, command):
+        """ sends the show command and returns its output, None if failed """
+        ret, output = self.send_batch([command], True)[0]
+        if not ret:
+            return None
+        return output
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def wants_write(self):
+        return self.state == self.CONNECTING or len(self.outbuf) > 0
+
+    def next_timer(self):
+        """ when on_timer has something to do next, None if nothing """
+        if self.deadline is not None:
+            return self.deadline
+        if self.state == self.READY and self.job is None and self.driver.keepalive_interval > 0:
+            return self._last_used + self.driver.keepalive_interval
+        return None
+
+    def on_timer(self, now):
+        if self.deadline is not None and now >= self.deadline:
+            self.deadline = None
+            self._timed_out()
+        elif self.state == self.READY and self.job is None and self.driver.keepalive_interval > 0 and \
+             now - self._last_used >= self.driver.keepalive_interval:
+            # checks the idle session, which also keeps the switch from closing it
+            self._check()
+
+    def on_writable(self):
+        if self.state == self.CONNECTING:
+            error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                self._login_failed(os.strerror(error))
+                return
+            self._set_state(self.LOGIN, omni_const.OMNI_CLI_SMALL_TIMEOUT)
+        self._flush()
+
+    def on_readable(self):
+        if self.state == self.CONNECTING:
+            return # the outcome of the connect comes with on_writable
+        try:
+            data = self.sock.recv(4096)
+        except socket.error, e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            self._lost(str(e))
+            return
+        if len(data) == 0:
+            self._lost("connection closed by the switch")
+            return
+        self._feed(data)
+        self._received()
+
+    def start_job(self, job):
+        self.jobs.append(job)
+        self._next()
+
+    def abort(self, reason):
+        """ the engine failed to handle the session, it is closed and its job fails """
+        self._set_connect_error(reason)
+        self._disconnect()
+        self._finish()
+
+
+    #####   Internal Utility functions #####
+
+    def _call(self, job):
+        self.engine.submit(self, job)
+        job.done.wait()
+        self.connect_error = job.connect_error
+        return job
+
+    def _set_connect_error(self, reason):
+        """ records the outcome of the connection in the job in progress, if any """
+        if self.job:
+            self.job.connect_error = reason
+
+    def _next(self):
+        """ moves the job on, as far as it goes without waiting for the switch """
+        if self.job is None:
+            if len(self.jobs) == 0:
+                return
+            self.job = self.jobs.pop(0)
+        job = self.job
+        if self.state not in (self.CLOSED, self.READY):
+            return # resumed once the login or the check in progress is over
+
+        if job.kind == 'close':
+            self._disconnect()
+            job.result = True
+            self._finish()
+        elif self.state == self.CLOSED:
+            self._connect()
+        elif job.kind == 'probe':
+            self._check()
+        else:
+            # output received while idle is not the answer of these commands
+            self.buf = ''
+            job.index = 0
+            if job.stop_on_error:
+                self._write(job.commands[0] + "\n")
+            else:
+                self._write(''.join([command + "\n" for command in job.commands]))
+            self._await_answer()
+
+    def _connect(self):
+        self.rawbuf = self.buf = self.outbuf = ''
+        try:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setblocking(0)
+            error = self.sock.connect_ex((self.driver.switch_ip, 23))
+        except socket.error, e:
+            self._login_failed(str(e))
+            return
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            self._login_failed(os.strerror(error))
+            return
+        self._set_state(self.CONNECTING, 10)
+        self.engine.register(self)
+
+    def _disconnect(self):
+        if self.sock is not None:
+            self.engine.unregister(self)
+            self.sock.close()
+        self.sock = None
+        self._set_state(self.CLOSED)
+
+    def _check(self):
+        self._write("\n")
+        self._set_state(self.CHECK, omni_const.OMNI_CLI_PROMPT_TIMEOUT)
+
+    def _await_answer(self):
+        command = self.job.commands[self.job.index]
+        timeout = omni_const.OMNI_CLI_MEDIUM_TIMEOUT
+        if command.startswith('write memory') or command.startswith('copy '):
+            timeout = omni_const.OMNI_CLI_SAVE_TIMEOUT
+        self.answer_start = time.time()
+        self._set_state(self.ANSWER, timeout)
+
+    def _received(self):
+        drv = self.driver
+        if self.state == self.LOGIN and "login :" in self.buf:
+            self.buf = self.buf[self.buf.index("login :") + len("login :"):]
+            self._timed_out()
+            self._received()
+        elif self.state == self.PASSWORD and "assword : " in self.buf:
+            self.buf = self.buf[self.buf.index("assword : ") + len("assword : "):]
+            self._timed_out()
+            self._received()
+        elif self.state == self.PROMPT and drv.switch_prompt in self.buf:
+            # the session is kept open across the calls, see on_timer
+            self.buf = ''
+            self._set_connect_error(None)
+            self._last_used = time.time()
+            self._set_state(self.READY)
+            if self.job and self.job.kind == 'probe':
+                self.job.result = True
+                self._finish()
+            else:
+                self._next()
+        elif self.state == self.CHECK and drv.switch_prompt in self.buf:
+            self.buf = ''
+            self._last_used = time.time()
+            self._set_state(self.READY)
+            if self.job and self.job.kind == 'probe':
+                self.job.result = True
+                self._finish()
+            else:
+                self._next()
+        elif self.state == self.ANSWER:
+            self._split_answers()
+
+    def _split_answers(self):
+        """ the answer of a command is the output upto the first prompt, so that pipelined
+            answers are split correctly """
+        job = self.job
+        drv = self.driver
+        while job.index < len(job.commands):
+            match = drv.prompt_pattern.search(self.buf)
+            if match is None:
+                return
+            command = job.commands[job.index]
+            output = self.buf[:match.end()]
+            self.buf = self.buf[match.end():]
+            error = drv.error_pattern.search(output)
+            if error is None:
+                LOG.info("sendCommand: <%s> to %s success! (%.3f secs)", command, drv.switch_ip,
+                         time.time() - self.answer_start)
+                job.rets[job.index] = (True, output)
+            else:
+                LOG.info("sendCommand: <%s> failed! in %s, ret = %s (%.3f secs)", command, drv.switch_ip,
+                         output[error.start():].split('\n')[0].strip(), time.time() - self.answer_start)
+                job.rets[job.index] = (False, output)
+            job.index += 1
+            if error is not None and job.stop_on_error:
+                break
+            if job.index < len(job.commands):
+                if job.stop_on_error:
+                    self._write(job.commands[job.index] + "\n")
+                self._await_answer()
+
+        self._set_state(self.READY)
+        self._finish()
+
+    def _timed_out(self):
+        """ the step in progress timed out, or its awaited output came in """
+        drv = self.driver
+        if self.state == self.CONNECTING:
+            self._login_failed("timed out")
+        elif self.state == self.LOGIN:
+            self._write(drv.switch_login + "\n")
+            self._set_state(self.PASSWORD, omni_const.OMNI_CLI_SMALL_TIMEOUT)
+        elif self.state == self.PASSWORD:
+            self._write(drv.switch_password + "\n")
+            self._set_state(self.PROMPT, omni_const.OMNI_CLI_SMALL_TIMEOUT)
+        elif self.state == self.PROMPT:
+            self._login_failed("login failed", True)
+        elif self.state == self.CHECK:
+            # session dropped by the switch, a new one is needed
+            LOG.info("session to %s lost, closed", drv.switch_ip)
+            self._disconnect()
+            self._next()
+        elif self.state == self.ANSWER:
+            job = self.job
+            # not sent again, the switch may still run the commands. the answers are out of
+            # step with the commands, the session has to go
+            LOG.info("sendCommand: <%s> to %s, no prompt after [%s]", job.commands[job.index], drv.switch_ip,
+                     self.buf.strip())
+            job.rets[job.index] = (False, self.buf)
+            self._disconnect()
+            self._finish()
+
+    def _lost(self, reason):
+        drv = self.driver
+        if self.state in (self.LOGIN, self.PASSWORD, self.PROMPT):
+            self._login_failed(reason)
+            return
+        if self.state == self.ANSWER:
+            LOG.info("sendCommand: <%s> to %s, session lost [%s]", self.job.commands[self.job.index],
+                     drv.switch_ip, reason)
+            self._set_connect_error(reason)
+            if self.job.index == 0 and len(self.buf) == 0:
+                self._retry("no answer")
+                return
+            self._disconnect()
+            self._finish()
+            return
+        LOG.info("session to %s lost, closed [%s]", drv.switch_ip, reason)
+        self._disconnect()
+        self._next()
+
+    def _retry(self, reason):
+        """ the session was found dead before any answer came: connects again and sends the job
+            once more """
+        job = self.job
+        self._disconnect()
+        if job.retried:
+            LOG.info("sendCommand: <%s> failed! in %s, %s", job.commands[0], self.driver.switch_ip, reason)
+            self._finish()
+            return
+        job.retried = True
+        self._next()
+
+    def _login_failed(self, reason, reachable=False):
+        """ 'reachable' if the switch answered but refused the login """
+        drv = self.driver
+        LOG.info("Connection to %s failed! [%s]", drv.switch_ip, reason)
+        self._set_connect_error(None)
+        if not reachable:
+            self._set_connect_error(reason)
+        self._disconnect()
+        if self.job and self.job.kind == 'batch':
+            LOG.info("sendCommand: <%s> failed! could not connect to %s", self.job.commands[0], drv.switch_ip)
+        self._finish()
+
+    def _finish(self):
+        """ the job is over, the next one starts """
+        job = self.job
+        self.job = None
+        self._last_used = time.time()
+        if job:
+            job.done.set()
+            if job.callback:
+                try:
+                    job.callback(job)
+                except Exception, e:
+                    LOG.info("telnet engine: callback of %s failed! [%s]", self.driver.switch_ip,
+                             traceback.format_exc())
+        self._next()
+
+    def _set_state(self, state, timeout=None):
+        self.state = state
+        self.deadline = None
+        if timeout is not None:
+            self.deadline = time.time() + timeout
+
+    def _write(self, data):
+        self.outbuf += data
+        if self.state != self.CONNECTING:
+            self._flush()
+
+    def _flush(self):
+        try:
+            while len(self.outbuf):
+                sent = self.sock.send(self.outbuf)
+                self.outbuf = self.outbuf[sent:]
+        except socket.error, e:
+            if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                # the socket is broken, on_readable gets the error and handles it
+                self.outbuf = ''
+
+    def _feed(self, data):
+        """ adds the data to buf, less the telnet commands. the options asked are refused """
+        data = self.rawbuf + data
+        self.rawbuf = ''
+        text = []
+        i = 0
+        while i < len(data):
+            if data[i] != IAC:
+                if data[i] != '\0':
+                    text.append(data[i])
+                i += 1
+                continue
+            if i + 1 >= len(data):
+                self.rawbuf = data[i:]
+                break
+            cmd = data[i+1]
+            if cmd == IAC:
+                text.append(IAC)
+                i += 2
+            elif cmd in (DO, DONT, WILL, WONT):
+                if i + 2 >= len(data):
+                    self.rawbuf = data[i:]
+                    break
+                if cmd == DO:
+                    self.outbuf += IAC + WONT + data[i+2]
+                elif cmd == WILL:
+                    self.outbuf += IAC + DONT + data[i+2]
+                i += 3
+            elif cmd == SB:
+                end = data.find(IAC + SE, i + 2)
+                if end < 0:
+                    self.rawbuf = data[i:]
+                    break
+                i = end + 2
+            else:
+                i += 2
+        self.buf += ''.join(text)
+        if len(self.outbuf):
+            self._flush()
+
+
+class OmniSwitchTelnetEngine(object):
+
+    """
+    Name:        OmniSwitchTelnetEngine
+    Description: Runs the CLI sessions of many telnet switches from a single thread.
+
+    Details:     The sessions created by new_session() are driven by one event loop over their
+                 non-blocking sockets, using poll (or select where poll is missing). Instead of a
+                 thread per session blocked in telnetlib, the engine thread only wakes up when a
+                 switch sends data, a timeout or keepalive is due, or a call is handed over to it
+                 through submit(). The timeouts are the same as those of OmniSwitchTelnetSession.
+    """
+
+    def __init__(self):
+        self.sessions = []
+        self.open_sessions = set() # sessions with a socket
+        self.jobs = [] # (session, job) handed over to the engine thread
+        self.lock = threading.Lock()
+        self.wakeup_r, self.wakeup_w = os.pipe()
+
+        self.worker = threading.Thread(target=self._worker)
+        self.worker.daemon = True
+        self.worker.start()
+
+    def new_session(self, driver):
+        session = OmniSwitchTelnetEngineSession(driver, self)
+        self.lock.acquire(1)
+        self.sessions.append(session)
+        self.lock.release()
+        return session
+
+    def remove_session(self, session):
+        """ the session, closed, is not used any more """
+        self.lock.acquire(1)
+        if session in self.sessions:
+            self.sessions.remove(session)
+        self.lock.release()
+
+    def submit(self, session, job):
+        """ starts the job of the session in the engine thread """
+        self.lock.acquire(1)
+        self.jobs.append((session, job))
+        self.lock.release()
+        os.write(self.wakeup_w, 'x')
+
+    def register(self, session):
+        self.open_sessions.add(session)
+
+    def unregister(self, session):
+        self.open_sessions.discard(session)
+
+
+    #####   Internal Utility functions #####
+
+    def _worker(self):
+        while True:
+            try:
+                self._run_once()
+            except Exception, e:
+                LOG.info("telnet engine error! [%s]", traceback.format_exc())
+                time.sleep(1)
+
+    def _run_once(self):
+        self.lock.acquire(1)
+        jobs = self.jobs
+        self.jobs = []
+        sessions = list(self.sessions)
+        self.lock.release()
+
+        for session, job in jobs:
+            self._handle(session, session.start_job, job)
+
+        now = time.time()
+        timeout = None
+        for session in sessions:
+            self._handle(session, session.on_timer, now)
+            next_timer = session.next_timer()
+            if next_timer is not None and (timeout is None or next_timer - now < timeout):
+                timeout = max(next_timer - now, 0)
+
+        readers = list(self.open_sessions)
+        writers = [session for session in readers if session.wants_write()]
+        readable, writable = self._wait(readers, writers, timeout)
+        if self.wakeup_r in readable:
+            os.read(self.wakeup_r, 4096)
+        for session in writable:
+            if session.sock is not None:
+                self._handle(session, session.on_writable)
+        for session in readable:
+            if session != self.wakeup_r and session.sock is not None:
+                self._handle(session, session.on_readable)
+
+    def _handle(self, session, function, *args):
+        try:
+            function(*args)
+        except Exception, e:
+            LOG.info("telnet engine: session to %s failed! [%s]", session.driver.switch_ip,
+                     traceback.format_exc())
+            session.abort(str(e))
+
+    def _wait(self, readers, writers, timeout):
+        """ returns the readable and writable ones among the sessions, the wakeup pipe with them """
+        try:
+            if not hasattr(select, 'poll'):
+                readable, writable, x = select.select([self.wakeup_r] + readers, writers, [], timeout)
+                return readable, writable
+
+            poller = select.poll()
+            fds = {self.wakeup_r: self.wakeup_r}
+            poller.register(self.wakeup_r, select.POLLIN)
+            for session in readers:
+                fds[session.fileno()] = session
+                if session in writers:
+                    poller.register(session.fileno(), select.POLLIN | select.POLLOUT)
+                else:
+                    poller.register(session.fileno(), select.POLLIN)
+            if timeout is not None:
+                timeout = timeout * 1000
+            readable = []
+            writable = []
+            for fd, event in poller.poll(timeout):
+                if event & select.POLLOUT or (event & (select.POLLERR | select.POLLHUP) and fds[fd] in writers):
+                    writable.append(fds[fd])
+                if event & (select.POLLIN | select.POLLERR | select.POLLHUP):
+                    readable.append(fds[fd])
+            return readable, writable
+        except (select.error, socket.error), e:
+            if e.args[0] != errno.EINTR:
+                LOG.info("telnet engine: poll failed! [%s]", e)
+                time.sleep(0.1)
+            return [], []
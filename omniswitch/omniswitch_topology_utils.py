@@ -32,8 +32,7 @@ from oslo.config import cfg
 
 
 from neutron.plugins.omniswitch import omniswitch_constants as omni_const
-from neutron.plugins.omniswitch.omniswitch_restful_driver import OmniSwitchRestfulDriver
-from neutron.plugins.omniswitch.omniswitch_telnet_driver import OmniSwitchTelnetDriver
+from neutron.plugins.omniswitch.omniswitch_driver_factory import OmniSwitchDriverFactory
 
 OMNI_PLUGIN_CONFIG_FILE = "/etc/neutron/plugins/omniswitch/omniswitch_network_plugin.ini"
 
@@ -68,6 +67,7 @@ class OmniSwitchTopologyUtils(object):
     core_network_config = '' # core network config mechanism
 
     switch_access_method = '' # OS6900 and OS10K access method
+    driver_factory = None # one device driver instance per switch, shared by edge and core
 
     sections = {}
     configFile = None
@@ -75,6 +75,8 @@ class OmniSwitchTopologyUtils(object):
     def __init__(self, confFile):
         self.configFile = confFile
         self._load_config()
+        # short lived, do not leave REST sessions behind in the switches
+        self.driver_factory = OmniSwitchDriverFactory(self.switch_access_method, None, 0)
         self._load_edge_ddi()
         self._load_core_ddi()
       
@@ -145,49 +147,16 @@ class OmniSwitchTopologyUtils(object):
 
 
     def _load_edge_ddi(self):
-        #for device in self.edge_device_list:
-        #    for i in range(0,len(device)):
-        #        LOG.info("VAD: OMNI_DEV: device tems: <%s>, len = %d", device[i], len(device[i].strip()))
         for device in self.edge_device_list:
-            drv_type = self._get_driver_type(device[omni_const.OMNI_CFG_DEV_TYPE])
-            if drv_type == omni_const.OMNISWITCH_7XX or drv_type == omni_const.OMNISWITCH_8XX :
-                if self.switch_access_method == omni_const.OMNI_CFG_SWITCH_ACCESS_REST :
-                    self.edge_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP],
-                              OmniSwitchRestfulDriver(device[omni_const.OMNI_CFG_DEV_IP],
-                                                     device[omni_const.OMNI_CFG_DEV_LOGIN],
-                                                     device[omni_const.OMNI_CFG_DEV_PASSWORD]))
-                else:
-                    self.edge_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP],
-                              OmniSwitchTelnetDriver(device[omni_const.OMNI_CFG_DEV_IP], False, 
-                                                     device[omni_const.OMNI_CFG_DEV_LOGIN],
-                                                     device[omni_const.OMNI_CFG_DEV_PASSWORD]))
-            elif drv_type == omni_const.OMNISWITCH_6XX :
-                self.edge_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP],
-                              OmniSwitchTelnetDriver(device[omni_const.OMNI_CFG_DEV_IP], True,
-                                                     device[omni_const.OMNI_CFG_DEV_LOGIN],
-                                                     device[omni_const.OMNI_CFG_DEV_PASSWORD],
-                                                     device[omni_const.OMNI_CFG_DEV_PROMPT]))
+            ddi_obj = self.driver_factory.get_driver(device)
+            if ddi_obj :
+                self.edge_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP], ddi_obj)
 
     def _load_core_ddi(self):
         for device in self.core_device_list:
-            drv_type = self._get_driver_type(device[omni_const.OMNI_CFG_DEV_TYPE])
-            if drv_type == omni_const.OMNISWITCH_7XX or drv_type == omni_const.OMNISWITCH_8XX :
-                if self.switch_access_method == omni_const.OMNI_CFG_SWITCH_ACCESS_REST :
-                    self.core_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP],
-                              OmniSwitchRestfulDriver(device[omni_const.OMNI_CFG_DEV_IP],
-                                                     device[omni_const.OMNI_CFG_DEV_LOGIN],
-                                                     device[omni_const.OMNI_CFG_DEV_PASSWORD]))
-                else: 
-                    self.core_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP],
-                              OmniSwitchTelnetDriver(device[omni_const.OMNI_CFG_DEV_IP], False, 
-                                                     device[omni_const.OMNI_CFG_DEV_LOGIN],
-                                                     device[omni_const.OMNI_CFG_DEV_PASSWORD]))
-            elif drv_type == omni_const.OMNISWITCH_6XX :
-                self.core_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP],
-                              OmniSwitchTelnetDriver(device[omni_const.OMNI_CFG_DEV_IP], True,
-                                                     device[omni_const.OMNI_CFG_DEV_LOGIN],
-                                                     device[omni_const.OMNI_CFG_DEV_PASSWORD],
-                                                     device[omni_const.OMNI_CFG_DEV_PROMPT]))
+            ddi_obj = self.driver_factory.get_driver(device)
+            if ddi_obj :
+                self.core_ddi_list.setdefault(device[omni_const.OMNI_CFG_DEV_IP], ddi_obj)
 
     def initial_config(self):
         config = True # True means it applies the config
@@ -280,18 +249,6 @@ class OmniSwitchTopologyUtils(object):
                         print "UNP disabled on %s of %s" %(port, device[omni_const.OMNI_CFG_DEV_IP])
 
     # Utility routines
-    def _get_driver_type(self, switch_type):
-        if switch_type == omni_const.OMNISWITCH_OS6860 :
-            return omni_const.OMNISWITCH_8XX
-        if switch_type == omni_const.OMNISWITCH_OS6900 or \
-           switch_type == omni_const.OMNISWITCH_OS10K:
-            return omni_const.OMNISWITCH_7XX
-        elif switch_type == omni_const.OMNISWITCH_OS6850E or \
-             switch_type == omni_const.OMNISWITCH_OS6855 or \
-             switch_type == omni_const.OMNISWITCH_OS6450 or \
-             switch_type == omni_const.OMNISWITCH_OS9000:
-            return omni_const.OMNISWITCH_6XX
-
     def _parse_network_vlan_ranges(self):
         self.network_vlan_ranges = {}
         for entry in self._get_config("PLUGIN", "network_vlan_ranges"):
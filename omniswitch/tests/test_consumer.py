@@ -0,0 +1,319 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: test_consumer.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+
+import copy
+import httplib
+import socket
+import unittest
+import urllib
+import urllib2
+from StringIO import StringIO
+from collections import OrderedDict
+from xml.dom.minidom import parseString
+
+from neutron.plugins.omniswitch.consumer import AOSAPI, AOSConnection, AOSConnectionPool, AOSHeaders
+from neutron.plugins.omniswitch.consumer import AOSResult, AOSXMLDecoder, AOSXMLStreamDecoder
+
+
+class AOSResultTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.decoded = {'result': {'diag': '200', 'error': '',
+                                   'data': {'rows': {'1': {'vlanNumber': '10'}}}}}
+
+    def test_success(self):
+        result = AOSResult(self.decoded)
+        self.assertTrue(result.success())
+        self.assertEqual(result.diag(), 200)
+        self.assertEqual(result.data(), {'rows': {'1': {'vlanNumber': '10'}}})
+        self.assertEqual(result['result']['diag'], '200')
+
+    def test_errors(self):
+        result = AOSResult({'result': {'diag': 400, 'error': 'no such vlan'}})
+        self.assertFalse(result.success())
+        self.assertEqual(result.diag(), 400)
+        self.assertEqual(result.errors(), 'no such vlan')
+        self.assertEqual(result.data(), {})
+
+    def test_diag_from_http_code(self):
+        result = AOSResult({'html': 'Service Unavailable'}, 503)
+        self.assertFalse(result.success())
+        self.assertEqual(result.diag(), 503)
+        self.assertEqual(result.errors(), None)
+
+    def test_read_only(self):
+        result = AOSResult(self.decoded)
+        self.assertRaises(TypeError, result.__setitem__, 'result', {})
+        self.assertRaises(TypeError, result.__delitem__, 'result')
+        self.assertRaises(TypeError, result.update, {'result': {}})
+        self.assertRaises(TypeError, result.pop, 'result')
+        self.assertRaises(TypeError, setattr, result, '_diag', 400)
+        self.assertTrue(result.success())
+
+    def test_copy(self):
+        result = AOSResult({'result': {'diag': 400, 'error': 'busy'}})
+        for other in (copy.copy(result), copy.deepcopy(result)):
+            self.assertTrue(isinstance(other, AOSResult))
+            self.assertEqual(other, result)
+            self.assertEqual(other.diag(), 400)
+            self.assertEqual(other.errors(), 'busy')
+        self.assertFalse(copy.deepcopy(result)['result'] is result['result'])
+        mutable = dict(result)
+        mutable['result'] = {}
+        self.assertEqual(result.errors(), 'busy')
+
+
+class FakeHTTPResponse(object):
+
+    def __init__(self, body, will_close=False, headers=''):
+        self.body = body
+        self.will_close = will_close
+        self.msg = httplib.HTTPMessage(StringIO(headers + '\r\n'))
+        self.status = 200
+        self.reason = 'OK'
+
+    def read(self):
+        return self.body
+
+
+class FakeHTTPConnection(object):
+
+    """ http connection to the fake switch, over one end of a socket pair whose other end
+        is the switch side; closing it makes the connection look dropped while idle """
+
+    opened = [] # every connection made, in order
+
+    def __init__(self, host, timeout=None):
+        self.host = host
+        self.sock, self.peer = socket.socketpair()
+        self.requests = [] # (method, selector)
+        self.fail_write = False
+        self.fail_read = False
+        self.will_close = False
+        self.closed = False
+        FakeHTTPConnection.opened.append(self)
+
+    def request(self, method, selector, data, headers):
+        if self.fail_write:
+            raise socket.error('broken pipe')
+        self.requests.append((method, selector))
+
+    def getresponse(self):
+        if self.fail_read:
+            raise httplib.BadStatusLine('')
+        return FakeHTTPResponse('ok %d' % len(self.requests), self.will_close)
+
+    def close(self):
+        self.closed = True
+
+
+class AOSConnectionPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        FakeHTTPConnection.opened = []
+        self.pool = AOSConnectionPool(max_idle=2)
+
+    def _open(self, url='http://10.0.0.1/mib/vlanTable'):
+        req = urllib2.Request(url)
+        req.timeout = 5 # set by the opener
+        return self.pool.open(FakeHTTPConnection, req)
+
+    def test_connection_returned_and_reused(self):
+        self.assertEqual(self._open().read(), 'ok 1')
+        self.assertEqual(self._open().read(), 'ok 2')
+        self.assertEqual(len(FakeHTTPConnection.opened), 1)
+        self.assertEqual(len(self.pool.idle.values()[0]), 1)
+
+    def test_connections_kept_per_host(self):
+        self._open('http://10.0.0.1/mib/vlanTable')
+        self._open('http://10.0.0.2/mib/vlanTable')
+        self._open('http://10.0.0.1/mib/vpaTable')
+        self.assertEqual([conn.host for conn in FakeHTTPConnection.opened], ['10.0.0.1', '10.0.0.2'])
+
+    def test_connection_closed_by_switch_not_kept(self):
+        self._open()
+        conn = FakeHTTPConnection.opened[0]
+        conn.will_close = True
+        self._open()
+        self.assertTrue(conn.closed)
+        self._open()
+        self.assertEqual(len(FakeHTTPConnection.opened), 2)
+
+    def test_idle_connections_bounded(self):
+        conns = [FakeHTTPConnection('10.0.0.1') for i in range(0, 3)]
+        for conn in conns:
+            self.pool._put((FakeHTTPConnection, '10.0.0.1', None), conn)
+        self.assertEqual([conn.closed for conn in conns], [False, False, True])
+        self.pool.close()
+        self.assertEqual([conn.closed for conn in conns], [True, True, True])
+        self.assertEqual(self.pool.idle, {})
+
+    def test_dropped_idle_connection_replaced(self):
+        self._open()
+        stale = FakeHTTPConnection.opened[0]
+        stale.peer.close() # closed by the switch while idle
+        self.assertEqual(self._open().read(), 'ok 1')
+        self.assertTrue(stale.closed)
+        self.assertEqual(len(stale.requests), 1)
+        self.assertEqual(len(FakeHTTPConnection.opened), 2)
+
+    def test_idle_connection_failing_write_replaced(self):
+        self._open()
+        stale = FakeHTTPConnection.opened[0]
+        stale.fail_write = True
+        self.assertEqual(self._open().read(), 'ok 1')
+        self.assertTrue(stale.closed)
+        self.assertEqual(len(FakeHTTPConnection.opened), 2)
+
+    def test_request_written_not_sent_again(self):
+        self._open()
+        conn = FakeHTTPConnection.opened[0]
+        conn.fail_read = True # the switch may have run it
+        self.assertRaises(urllib2.URLError, self._open)
+        self.assertTrue(conn.closed)
+        self.assertEqual(len(FakeHTTPConnection.opened), 1)
+
+    def test_no_host(self):
+        self.assertRaises(urllib2.URLError, self._open, 'http:///mib/vlanTable')
+
+
+class AOSConnectionOpenerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = {} # switch ip -> cookie header of each request
+        self.connections = [self._connection('10.0.0.1'), self._connection('10.0.0.2')]
+
+    def _connection(self, ip):
+        connection = AOSConnection('admin', 'switch', ip, False)
+        def open(conn_factory, req):
+            self.sent.setdefault(ip, []).append(req.get_header('Cookie'))
+            resp = urllib.addinfourl(StringIO('{}'), httplib.HTTPMessage(StringIO(
+                   'Set-Cookie: wv_sess=%s; path=/\r\n\r\n' % ip)), req.get_full_url())
+            resp.code = 200
+            resp.msg = 'OK'
+            return resp
+        connection.pool.open = open
+        return connection
+
+    def test_own_opener_and_pool(self):
+        first, second = self.connections
+        self.assertFalse(first.opener is second.opener)
+        self.assertFalse(first.pool is second.pool)
+        self.assertFalse(urllib2._opener in (first.opener, second.opener))
+
+    def test_cookie_kept_per_connection(self):
+        first, second = self.connections
+        first.get('auth', '', {})
+        first.get('mib', 'vlanTable', {})
+        second.get('mib', 'vlanTable', {})
+        self.assertEqual(self.sent['10.0.0.1'], [None, 'wv_sess=10.0.0.1'])
+        self.assertEqual(self.sent['10.0.0.2'], [None])
+
+
+TABLE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<!-- AOS web service -->
+<nodes>
+  <result>
+    <domain>mib</domain>
+    <diag>200</diag>
+    <output></output>
+    <error></error>
+    <data>
+      <rows>
+        <row name="10">
+          <vlanNumber>10</vlanNumber>
+          <vlanDescription>OpenStack-net-10</vlanDescription>
+        </row>
+        <row name="2">
+          <vlanNumber>2</vlanNumber>
+          <vlanDescription>OpenStack-net-2</vlanDescription>
+        </row>
+      </rows>
+    </data>
+  </result>
+</nodes>
+"""
+
+ERROR_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<nodes><result><domain>mib</domain><diag>400</diag><error><node name="1">no such vlan</node></error>
+<output>ERROR: VLAN 10 does not exist</output><data></data></result></nodes>
+"""
+
+TABLE_JSON = """{"result": {"domain": "mib", "diag": 200, "error": "", "output": "",
+                  "data": {"rows": {"10": {"vlanNumber": "10"}, "2": {"vlanNumber": "2"}}}}}
+"""
+
+
+class AOSDecoderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.api = AOSAPI(AOSConnection('admin', 'switch', '10.0.0.1', False, True, True, -1,
+                                        AOSHeaders({AOSAPI.ENC_ALT: True, 'api': '1.0'})))
+
+    def _dom_decode(self, data):
+        return AOSXMLDecoder(parseString(self.api.cruft.sub('', data)).getElementsByTagName('result')[0])
+
+    def _info(self, content_type):
+        headers = ''
+        if content_type:
+            headers = 'Content-Type: %s\r\n' % content_type
+        return httplib.HTTPMessage(StringIO(headers + '\r\n'))
+
+    def test_stream_decoder_same_as_dom_decoder(self):
+        for data in (TABLE_XML, ERROR_XML):
+            self.assertEqual(AOSXMLStreamDecoder(data), self._dom_decode(data))
+
+    def test_stream_decoder_repeated_names(self):
+        decoded = AOSXMLStreamDecoder('<result><error><e>a</e><e>b</e></error></result>')
+        self.assertEqual(decoded, {'result': {'error': {'e': ['a', 'b']}}})
+
+    def test_stream_decoder_no_result(self):
+        self.assertRaises(ValueError, AOSXMLStreamDecoder, '<nodes><other>1</other></nodes>')
+
+    def test_ordered_rows(self):
+        rows = AOSXMLStreamDecoder(TABLE_XML, OrderedDict)['result']['data']['rows']
+        self.assertEqual(rows.keys(), ['10', '2'])
+        info = self._info('application/vnd.alcatellucentaos+json')
+        rows = self.api.decode_type(info, TABLE_JSON, 200, True).data()['rows']
+        self.assertEqual(rows.keys(), ['10', '2'])
+
+    def test_json_by_content_type(self):
+        result = self.api.decode_type(self._info('application/vnd.alcatellucentaos+json'), TABLE_JSON)
+        self.assertTrue(result.success())
+        self.assertEqual(result.data()['rows']['10'], {'vlanNumber': '10'})
+
+    def test_xml_by_content_type(self):
+        result = self.api.decode_type(self._info('application/vnd.alcatellucentaos+xml'), ERROR_XML)
+        self.assertEqual(result, AOSResult(self._dom_decode(ERROR_XML)))
+        self.assertEqual(result.diag(), 400)
+        self.assertEqual(result.errors(), {'1': 'no such vlan'})
+
+    def test_xml_if_no_content_type(self):
+        for content_type in (None, 'text/html'):
+            result = self.api.decode_type(self._info(content_type), TABLE_XML)
+            self.assertTrue(result.success())
+            self.assertEqual(result.data()['rows']['2']['vlanDescription'], 'OpenStack-net-2')
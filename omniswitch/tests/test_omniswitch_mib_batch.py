@@ -0,0 +1,68 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: test_omniswitch_mib_batch.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+
+
+import unittest
+
+from neutron.plugins.omniswitch.consumer import AOSResult
+from neutron.plugins.omniswitch.omniswitch_mib_batch import OmniSwitchMibBatch
+
+
+class OmniSwitchMibBatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = [] # (method, table, args)
+        self.diags = {} # table -> diag of its requests, 200 if not set
+        self.batch = OmniSwitchMibBatch(self._request)
+
+    def _request(self, method, domain, urn, args):
+        self.sent.append((method, urn, args))
+        return AOSResult({'result': {'diag': self.diags.get(urn, 200), 'error': ''}})
+
+    def test_same_row_merged(self):
+        self.batch.add('put', 'vlanTable', ['vlanNumber:10', 'vlanDescription:a'])
+        self.batch.add('put', 'vlanTable', ['vlanNumber:10', 'vlanDescription:b'])
+        self.assertTrue(self.batch.execute())
+        self.assertEqual(self.sent, [('put', 'vlanTable', {'mibObject0': 'vlanNumber:10',
+                                                           'mibObject1': 'vlanDescription:b'})])
+
+    def test_row_after_failed_row_skipped(self):
+        self.diags['vlanTable'] = 400
+        vlan = self.batch.add('put', 'vlanTable', ['vlanNumber:10'])
+        unp = self.batch.add('put', 'alaDaUserNetProfileTable', ['alaDaUserNetProfileName:OpenStack-UNP-10'], 1, vlan)
+        other = self.batch.add('put', 'vpaTable', ['vpaIfIndex:1001', 'vpaVlanNumber:11'], 2)
+        self.assertFalse(self.batch.execute())
+        self.assertEqual(self.batch.errors(unp), 'skipped')
+        self.assertTrue(self.batch.succeeded(other))
+
+    def test_stops_at_connection_error(self):
+        self.diags['vlanTable'] = 0
+        for vlan_id in range(10, 15):
+            self.batch.add('put', 'vlanTable', ['vlanNumber:%d' % vlan_id])
+        self.assertFalse(self.batch.execute())
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual([self.batch.errors(row) for row in range(1, 5)], ['skipped'] * 4)
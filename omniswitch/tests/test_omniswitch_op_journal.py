@@ -0,0 +1,88 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: test_omniswitch_op_journal.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+
+
+import unittest
+
+from neutron.plugins.omniswitch.omniswitch_fanout import OmniSwitchFanOutResult
+from neutron.plugins.omniswitch.omniswitch_op_journal import OmniSwitchOpJournal
+
+
+class FakeDriver(object):
+
+    def __init__(self, switch_ip):
+        self.switch_ip = switch_ip
+
+
+class FakeOp(object):
+
+    def __init__(self, ret):
+        self.ret = ret
+
+    def wait(self):
+        return self.ret
+
+
+class OmniSwitchOpJournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.ddi_list = {'10.0.0.1': FakeDriver('10.0.0.1'), '10.0.0.2': FakeDriver('10.0.0.2')}
+        self.journal = OmniSwitchOpJournal()
+        self.undone = [] # (switch_ip, function_name, args)
+
+    def _submit(self, ddi_obj, function_name, args):
+        self.undone.append((ddi_obj.switch_ip, function_name, tuple(args)))
+        return FakeOp(True)
+
+    def test_rollback_reverse_order(self):
+        ddi_obj = self.ddi_list['10.0.0.1']
+        self.journal.record(ddi_obj, 'create_network', [10, 'net'])
+        self.journal.record(ddi_obj, 'create_port', [10, 'aa:bb:cc:dd:ee:ff'])
+        self.assertTrue(self.journal.rollback(self._submit))
+        self.assertEqual(self.undone, [('10.0.0.1', 'delete_port', (10, 'aa:bb:cc:dd:ee:ff')),
+                                       ('10.0.0.1', 'delete_network', (10,))])
+        self.assertEqual(self.journal.entries, [])
+
+    def test_failed_op_not_undone(self):
+        ddi_obj = self.ddi_list['10.0.0.1']
+        self.journal.record(ddi_obj, 'create_port', [10, 'aa:bb:cc:dd:ee:ff'], False)
+        self.journal.record(ddi_obj, 'create_vpa', [10, '1/1'])
+        self.journal.rollback(self._submit)
+        self.assertEqual(self.undone, [])
+
+    def test_failed_create_network_deletes_vlan(self):
+        result = OmniSwitchFanOutResult()
+        result.set_result('10.0.0.1', True)
+        result.set_result('10.0.0.2', False)
+        self.journal.record_result(self.ddi_list, 'create_network', [10, 'net'], result)
+        self.journal.rollback(self._submit)
+        self.assertEqual(sorted(self.undone), [('10.0.0.1', 'delete_network', (10,)),
+                                               ('10.0.0.2', 'delete_vlan_locked', (10,))])
+
+    def test_rollback_failure(self):
+        self.journal.record(self.ddi_list['10.0.0.1'], 'create_network', [10, 'net'])
+        self.assertFalse(self.journal.rollback(lambda ddi_obj, function_name, args: FakeOp(False)))
@@ -0,0 +1,460 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: test_omniswitch_op_queue.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+
+import socket
+import threading
+import time
+import unittest
+
+from neutron.plugins.omniswitch.omniswitch_op_queue import OmniSwitchOpQueue, OmniSwitchOpWorkers
+
+
+class FakeDriver(object):
+
+    """ records the driver apis called, get_config_state blocks until release() """
+
+    switch_ip = '10.0.0.1'
+
+    def __init__(self, session_pool_size=1):
+        self.session_pool_size = session_pool_size
+        self.log = [] # ('start'|'end', function_name, args)
+        self.lock = threading.Lock()
+        self.gate = threading.Event()
+
+    def release(self):
+        self.gate.set()
+
+    def take_connect_error(self):
+        return None
+
+    def get_config_state(self, *args):
+        return self._call('get_config_state', args, self.gate.wait)
+
+    def create_network(self, *args):
+        return self._call('create_network', args)
+
+    def delete_network(self, *args):
+        return self._call('delete_network', args)
+
+    def create_port(self, *args):
+        return self._call('create_port', args)
+
+    def delete_port(self, *args):
+        return self._call('delete_port', args)
+
+    def create_vpa(self, *args):
+        return self._call('create_vpa', args)
+
+    def save_config(self, *args):
+        return self._call('save_config', args)
+
+    def calls(self, function_name):
+        return [args for event, name, args in self.log if event == 'start' and name == function_name]
+
+    def index(self, event, function_name, args):
+        return self.log.index((event, function_name, tuple(args)))
+
+    def _call(self, function_name, args, wait=None):
+        self._record('start', function_name, args)
+        if wait:
+            wait()
+        else:
+            time.sleep(0.05)
+        self._record('end', function_name, args)
+        return True
+
+    def _record(self, event, function_name, args):
+        self.lock.acquire()
+        self.log.append((event, function_name, tuple(args)))
+        self.lock.release()
+
+
+class OmniSwitchOpQueueCoalesceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.driver = FakeDriver()
+        self.queue = OmniSwitchOpQueue(self.driver.switch_ip, self.driver, max_deferral=0)
+        # keeps the worker busy, so that the ops submitted next stay pending
+        self.blocker = self.queue.submit('get_config_state', [[]])
+        self._wait_started('get_config_state')
+
+    def tearDown(self):
+        self.driver.release()
+
+    def _wait_started(self, function_name):
+        for i in range(0, 100):
+            if len(self.driver.calls(function_name)):
+                return
+            time.sleep(0.01)
+        self.fail("%s not started" % function_name)
+
+    def _run_all(self, ops):
+        self.driver.release()
+        return [op.wait() for op in ops]
+
+    def test_create_network_merged_with_pending_one(self):
+        ops = [self.queue.submit('create_network', [10, 'net']),
+               self.queue.submit('create_network', [10, 'net'])]
+        self.assertEqual(len(self.queue.pending), 1)
+        self.assertEqual(self._run_all(ops), [True, True])
+        self.assertEqual(self.driver.calls('create_network'), [(10, 'net')])
+
+    def test_create_network_not_merged_across_op_on_same_vlan(self):
+        ops = [self.queue.submit('create_network', [10, 'net']),
+               self.queue.submit('delete_network', [10]),
+               self.queue.submit('create_network', [10, 'net'])]
+        self.assertEqual(len(self.queue.pending), 3)
+        self.assertEqual(self._run_all(ops), [True, True, True])
+        self.assertEqual(len(self.driver.calls('create_network')), 2)
+
+    def test_create_network_of_other_vlans_not_merged(self):
+        ops = [self.queue.submit('create_network', [10, 'net']),
+               self.queue.submit('create_network', [11, 'net'])]
+        self.assertEqual(len(self.queue.pending), 2)
+        self._run_all(ops)
+
+    def test_create_and_delete_port_cancel_out(self):
+        create = self.queue.submit('create_port', [10, 'AA:BB:CC:DD:EE:FF'])
+        delete = self.queue.submit('delete_port', [10, 'aa:bb:cc:dd:ee:ff'])
+        self.assertEqual(len(self.queue.pending), 0)
+        self.assertTrue(create.done.is_set())
+        self.assertEqual(self._run_all([create, delete]), [True, True])
+        self.assertEqual(self.driver.calls('create_port'), [])
+        self.assertEqual(self.driver.calls('delete_port'), [])
+
+    def test_delete_port_of_other_mac_not_cancelled(self):
+        ops = [self.queue.submit('create_port', [10, 'aa:bb:cc:dd:ee:ff']),
+               self.queue.submit('delete_port', [10, 'aa:bb:cc:dd:ee:00'])]
+        self.assertEqual(len(self.queue.pending), 2)
+        self._run_all(ops)
+
+    def test_delete_port_not_cancelled_across_op_on_same_vlan(self):
+        ops = [self.queue.submit('create_port', [10, 'aa:bb:cc:dd:ee:ff']),
+               self.queue.submit('create_vpa', [10, '1/1']),
+               self.queue.submit('delete_port', [10, 'aa:bb:cc:dd:ee:ff'])]
+        self.assertEqual(len(self.queue.pending), 3)
+        self.assertEqual(self._run_all(ops), [True, True, True])
+        self.assertEqual(len(self.driver.calls('delete_port')), 1)
+
+    def test_low_priority_duplicates_merged(self):
+        ops = [self.queue.submit('save_config', [], True),
+               self.queue.submit('save_config', [], True)]
+        self.assertEqual(len(self.queue.pending), 1)
+        self.assertEqual(self._run_all(ops), [True, True])
+        self.assertEqual(len(self.driver.calls('save_config')), 1)
+
+
+class OmniSwitchOpQueueOrderTestCase(unittest.TestCase):
+
+    def _queue(self, session_pool_size):
+        self.driver = FakeDriver(session_pool_size)
+        self.driver.release()
+        return OmniSwitchOpQueue(self.driver.switch_ip, self.driver)
+
+    def test_single_worker_runs_in_submission_order(self):
+        queue = self._queue(1)
+        ops = [queue.submit('create_network', [10, 'a']),
+               queue.submit('create_network', [11, 'b']),
+               queue.submit('create_port', [10, 'aa:bb:cc:dd:ee:ff'])]
+        self.assertEqual([op.wait() for op in ops], [True, True, True])
+        self.assertEqual([args for event, name, args in self.driver.log if event == 'start'],
+                         [(10, 'a'), (11, 'b'), (10, 'aa:bb:cc:dd:ee:ff')])
+
+    def test_ops_on_same_vlan_in_order_others_in_parallel(self):
+        queue = self._queue(3)
+        ops = [queue.submit('create_network', [10, 'a']),
+               queue.submit('create_port', [10, 'aa:bb:cc:dd:ee:ff']),
+               queue.submit('create_network', [11, 'b'])]
+        [op.wait() for op in ops]
+        self.assertTrue(self.driver.index('end', 'create_network', [10, 'a']) <
+                        self.driver.index('start', 'create_port', [10, 'aa:bb:cc:dd:ee:ff']))
+        self.assertTrue(self.driver.index('start', 'create_network', [11, 'b']) <
+                        self.driver.index('end', 'create_network', [10, 'a']))
+
+    def test_ops_on_same_mac_in_order_across_vlans(self):
+        queue = self._queue(3)
+        ops = [queue.submit('create_port', [10, 'aa:bb:cc:dd:ee:ff']),
+               queue.submit('delete_port', [20, 'AA:BB:CC:DD:EE:FF'])]
+        [op.wait() for op in ops]
+        self.assertTrue(self.driver.index('end', 'create_port', [10, 'aa:bb:cc:dd:ee:ff']) <
+                        self.driver.index('start', 'delete_port', [20, 'AA:BB:CC:DD:EE:FF']))
+
+    def test_op_without_keys_runs_alone(self):
+        queue = self._queue(3)
+        ops = [queue.submit('create_network', [10, 'a']),
+               queue.submit('get_config_state', [[]]),
+               queue.submit('create_network', [11, 'b'])]
+        [op.wait() for op in ops]
+        self.assertTrue(self.driver.index('end', 'create_network', [10, 'a']) <
+                        self.driver.index('start', 'get_config_state', [[]]) <
+                        self.driver.index('end', 'get_config_state', [[]]) <
+                        self.driver.index('start', 'create_network', [11, 'b']))
+
+
+class OmniSwitchOpWorkersTestCase(unittest.TestCase):
+
+    def test_pool_bounds_calls_of_all_switches(self):
+        workers = OmniSwitchOpWorkers(2)
+        drivers = [FakeDriver(4) for i in range(0, 3)]
+        ops = []
+        for driver in drivers:
+            driver.release()
+            queue = OmniSwitchOpQueue(driver.switch_ip, driver, workers=workers)
+            ops.extend([queue.submit('create_network', [vlan_id, 'net']) for vlan_id in range(10, 14)])
+        t0 = time.time()
+        self.assertEqual([op.wait() for op in ops], [True] * 12)
+        # 12 calls of 0.05 secs, 2 at a time
+        self.assertTrue(time.time() - t0 >= 0.25)
+        self.assertEqual(len(workers.workers), 2)
+
+    def test_queue_runs_at_most_one_call_per_session(self):
+        workers = OmniSwitchOpWorkers(4)
+        driver = FakeDriver(1)
+        driver.release()
+        queue = OmniSwitchOpQueue(driver.switch_ip, driver, workers=workers)
+        ops = [queue.submit('create_network', [vlan_id, 'net']) for vlan_id in range(10, 13)]
+        [op.wait() for op in ops]
+        events = [event for event, name, args in driver.log]
+        self.assertEqual(events, ['start', 'end'] * 3)
+
+    def test_switches_served_in_turn(self):
+        workers = OmniSwitchOpWorkers(1)
+        busy = FakeDriver(1)
+        other = FakeDriver(1)
+        busy.release()
+        other.release()
+        busy_queue = OmniSwitchOpQueue('10.0.0.1', busy, workers=workers)
+        other_queue = OmniSwitchOpQueue('10.0.0.2', other, workers=workers)
+        busy_ops = [busy_queue.submit('create_network', [vlan_id, 'net']) for vlan_id in range(10, 20)]
+        other_op = other_queue.submit('create_network', [10, 'net'])
+        other_op.wait()
+        self.assertTrue(len(busy.calls('create_network')) <= 3)
+        [op.wait() for op in busy_ops]
+
+
+class FakeCliDriver(object):
+
+    """ a driver which can not read back its config; the ops listed in 'errors' raise it once """
+
+    switch_ip = '10.0.0.2'
+
+    def __init__(self):
+        self.calls = []
+        self.errors = {} # function_name -> exception
+        self.connect_errors = {} # function_name -> connection error the call meets, without raising
+        self.connect_error = None
+
+    def take_connect_error(self):
+        connect_error = self.connect_error
+        self.connect_error = None
+        return connect_error
+
+    def create_network(self, *args):
+        return self._call('create_network', args)
+
+    def delete_network(self, *args):
+        return self._call('delete_network', args)
+
+    def _call(self, function_name, args):
+        self.calls.append((function_name, args))
+        if function_name in self.errors:
+            raise self.errors.pop(function_name)
+        if function_name in self.connect_errors:
+            self.connect_error = self.connect_errors.pop(function_name)
+            return False
+        return True
+
+
+class FakeHealth(object):
+
+    def __init__(self):
+        self.failures = 0
+        self.successes = 0
+
+    def allow(self):
+        return True
+
+    def record_failure(self):
+        self.failures += 1
+
+    def record_success(self):
+        self.successes += 1
+
+
+class OmniSwitchOpQueueFailureTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.driver = FakeCliDriver()
+        self.health = FakeHealth()
+        self.queue = OmniSwitchOpQueue(self.driver.switch_ip, self.driver, self.health)
+
+    def test_connection_error_recorded(self):
+        self.driver.errors['create_network'] = socket.error('connection refused')
+        self.assertFalse(self.queue.call('create_network', [10, 'net']))
+        self.assertEqual((self.health.failures, self.health.successes), (1, 0))
+
+    def test_connection_error_of_the_call_recorded(self):
+        self.driver.connect_errors['create_network'] = 'connection refused'
+        self.assertFalse(self.queue.call('create_network', [10, 'net']))
+        self.assertTrue(self.queue.call('create_network', [11, 'net']))
+        self.assertEqual((self.health.failures, self.health.successes), (1, 1))
+
+    def test_other_error_not_recorded(self):
+        self.driver.errors['create_network'] = ValueError('create_network can not be batched')
+        self.assertFalse(self.queue.call('create_network', [10, 'net']))
+        self.assertEqual((self.health.failures, self.health.successes), (0, 0))
+
+    def test_failed_deletion_sent_again(self):
+        self.driver.errors['delete_network'] = socket.error('connection refused')
+        self.assertFalse(self.queue.call('delete_network', [10]))
+        self.assertTrue(self.queue.call('create_network', [11, 'net']))
+        for i in range(0, 100):
+            if len(self.driver.calls) == 3:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.driver.calls, [('delete_network', (10,)), ('create_network', (11, 'net')),
+                                             ('delete_network', (10,))])
+        self.assertEqual(self.queue.failed, [])
+
+    def test_failed_deletion_superseded(self):
+        self.driver.errors['delete_network'] = socket.error('connection refused')
+        self.assertFalse(self.queue.call('delete_network', [10]))
+        self.assertTrue(self.queue.call('create_network', [10, 'net']))
+        time.sleep(0.1)
+        self.assertEqual(self.driver.calls, [('delete_network', (10,)), ('create_network', (10, 'net'))])
+
+    def test_failed_creation_not_kept(self):
+        self.driver.errors['create_network'] = socket.error('connection refused')
+        self.queue.call('create_network', [10, 'net'])
+        self.assertEqual(self.queue.failed, [])
+
+
+class FakeEngineDriver(object):
+
+    """ a driver which starts its calls without waiting (start_call), as with a telnet engine;
+        they end when the test calls finish(). the other driver apis run in the worker """
+
+    switch_ip = '10.0.0.3'
+
+    def __init__(self, session_pool_size=1):
+        self.session_pool_size = session_pool_size
+        self.started = [] # (function_name, args, callback) of the calls started
+        self.ended = 0
+        self.calls = [] # (function_name, args) of the calls run in the worker
+        self.lock = threading.Lock()
+
+    def start_call(self, function_name, args, callback):
+        if function_name == 'save_config':
+            return False
+        self.lock.acquire()
+        self.started.append((function_name, tuple(args), callback))
+        self.lock.release()
+        return True
+
+    def finish(self, ret=True, connect_error=None):
+        """ ends the oldest call still running, from another thread as the engine does """
+        function_name, args, callback = self.started[self.ended]
+        self.ended += 1
+        thread = threading.Thread(target=callback, args=(ret, connect_error))
+        thread.start()
+        thread.join()
+
+    def take_connect_error(self):
+        return None
+
+    def save_config(self, *args):
+        self.calls.append(('save_config', args))
+        return True
+
+
+class OmniSwitchOpQueueStartCallTestCase(unittest.TestCase):
+
+    def _wait_started(self, driver, count):
+        for i in range(0, 100):
+            if len(driver.started) >= count:
+                return
+            time.sleep(0.01)
+        self.fail("%d calls started instead of %d" % (len(driver.started), count))
+
+    def test_worker_not_held_by_started_calls(self):
+        workers = OmniSwitchOpWorkers(1)
+        drivers = [FakeEngineDriver(2) for i in range(0, 3)]
+        ops = []
+        for driver in drivers:
+            queue = OmniSwitchOpQueue(driver.switch_ip, driver, workers=workers)
+            ops.extend([queue.submit('create_network', [vlan_id, 'net']) for vlan_id in (10, 11)])
+        for driver in drivers:
+            self._wait_started(driver, 2)
+        self.assertEqual([op.done.is_set() for op in ops], [False] * 6)
+        for driver in drivers:
+            driver.finish()
+            driver.finish(False)
+        self.assertEqual([op.wait() for op in ops], [True, False] * 3)
+
+    def test_calls_started_up_to_session_pool_size(self):
+        driver = FakeEngineDriver(2)
+        queue = OmniSwitchOpQueue(driver.switch_ip, driver)
+        ops = [queue.submit('create_network', [vlan_id, 'net']) for vlan_id in (10, 11, 12)]
+        self._wait_started(driver, 2)
+        time.sleep(0.05)
+        self.assertEqual(len(driver.started), 2)
+        driver.finish()
+        self._wait_started(driver, 3)
+        driver.finish()
+        driver.finish()
+        self.assertEqual([op.wait() for op in ops], [True, True, True])
+
+    def test_op_on_same_vlan_waits_for_callback(self):
+        driver = FakeEngineDriver(2)
+        queue = OmniSwitchOpQueue(driver.switch_ip, driver)
+        ops = [queue.submit('create_network', [10, 'net']),
+               queue.submit('create_port', [10, 'aa:bb:cc:dd:ee:ff'])]
+        self._wait_started(driver, 1)
+        time.sleep(0.05)
+        self.assertEqual(len(driver.started), 1)
+        driver.finish()
+        self._wait_started(driver, 2)
+        self.assertEqual(driver.started[1][:2], ('create_port', (10, 'aa:bb:cc:dd:ee:ff')))
+        driver.finish()
+        self.assertEqual([op.wait() for op in ops], [True, True])
+
+    def test_connection_error_of_callback_recorded(self):
+        driver = FakeEngineDriver()
+        health = FakeHealth()
+        queue = OmniSwitchOpQueue(driver.switch_ip, driver, health)
+        op = queue.submit('delete_network', [10])
+        self._wait_started(driver, 1)
+        driver.finish(False, 'connection refused')
+        self.assertFalse(op.wait())
+        self.assertEqual((health.failures, health.successes), (1, 0))
+        self.assertEqual(queue.failed, [('delete_network', [10])])
+
+    def test_call_not_started_run_in_worker(self):
+        driver = FakeEngineDriver()
+        queue = OmniSwitchOpQueue(driver.switch_ip, driver)
+        self.assertTrue(queue.call('save_config', []))
+        self.assertEqual(driver.calls, [('save_config', ())])
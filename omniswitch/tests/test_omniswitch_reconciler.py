@@ -0,0 +1,98 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: test_omniswitch_reconciler.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+
+
+import unittest
+
+from neutron.plugins.omniswitch.omniswitch_reconciler import OmniSwitchConfigState
+from neutron.plugins.omniswitch.omniswitch_reconciler import OmniSwitchReconciler
+
+
+class FakeDriver(object):
+
+    switch_ip = '10.0.0.1'
+
+    def __init__(self, actual):
+        self.actual = actual
+
+    def get_config_state(self, ports=[]):
+        return self.actual
+
+
+class FakeOp(object):
+
+    def __init__(self, ret):
+        self.ret = ret
+
+    def wait(self):
+        return self.ret
+
+
+class OmniSwitchReconcilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.driver = FakeDriver(self._state([10, 20], [(10, 'aa:bb:cc:dd:ee:01')]))
+        self.db = [self._state([10], [])] # desired state returned by each DB read, the last one repeats
+        self.applied = []
+        self.reconciler = OmniSwitchReconciler(self._get_desired_state, self._submit)
+
+    def _state(self, vlans, mac_rules):
+        state = OmniSwitchConfigState()
+        for vlan_id in vlans:
+            state.vlans[vlan_id] = 'net'
+            state.unp_vlans.add(vlan_id)
+        state.mac_rules.update(mac_rules)
+        return state
+
+    def _get_desired_state(self):
+        if len(self.db) > 1:
+            return {self.driver: self.db.pop(0)}
+        return {self.driver: self.db[0]}
+
+    def _submit(self, ddi_obj, function_name, args):
+        if function_name == 'apply_config_ops':
+            self.applied.extend(args[0])
+            return FakeOp(True)
+        return FakeOp(getattr(ddi_obj, function_name)(*args))
+
+    def test_delta(self):
+        self.assertEqual(self.reconciler.plan()[self.driver],
+                         [('delete_unp_macrule', [10, 'aa:bb:cc:dd:ee:01']),
+                          ('delete_unp_vlan', [20]), ('delete_vlan', [20])])
+
+    def test_desired_state_taken_after_read(self):
+        # vlan 20 and the port were created while the switch was read
+        self.db = [self._state([10], []), self._state([10, 20], [(10, 'aa:bb:cc:dd:ee:01')])]
+        self.assertEqual(self.reconciler.plan()[self.driver], [])
+
+    def test_apply_rechecks_db(self):
+        plan = self.reconciler.plan()
+        # vlan 20 created and vlan 30 deleted between plan and apply
+        self.db = [self._state([10, 20], [])]
+        plan[self.driver].append(('create_vlan', [30, 'net']))
+        self.assertTrue(self.reconciler.apply(plan))
+        self.assertEqual(self.applied, [('delete_unp_macrule', [10, 'aa:bb:cc:dd:ee:01'])])
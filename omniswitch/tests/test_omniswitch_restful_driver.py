@@ -0,0 +1,131 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: test_omniswitch_restful_driver.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+
+import unittest
+
+from neutron.plugins.omniswitch.consumer import AOSResult
+from neutron.plugins.omniswitch.omniswitch_reconciler import OmniSwitchConfigState
+from neutron.plugins.omniswitch.omniswitch_restful_driver import OmniSwitchRestfulDriver
+
+
+class FakeRestfulDriverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = [] # (method, domain, urn, args)
+        self.diags = {} # domain -> diag of its requests, 200 if not set
+        self.rows = {} # urn -> rows returned by its queries
+        self.driver = OmniSwitchRestfulDriver('10.0.0.1')
+        self.driver.connect = lambda: True
+        self.driver.disconnect = lambda: None
+        self.driver._request = self._request
+
+    def _request(self, method, domain, urn='', args={}):
+        self.sent.append((method, domain, urn, args))
+        result = {'diag': self.diags.get(domain, 200), 'error': ''}
+        if method == 'query' and urn in self.rows:
+            result['data'] = {'rows': self.rows[urn]}
+        return AOSResult({'result': result})
+
+    def _posted(self):
+        return [(sent[2], sent[3]['mibObject0']) for sent in self.sent if sent[0] == 'post']
+
+    def _sent(self, domain):
+        return [sent for sent in self.sent if sent[1] == domain]
+
+
+class OmniSwitchConfigPushTestCase(FakeRestfulDriverTestCase):
+
+    def setUp(self):
+        super(OmniSwitchConfigPushTestCase, self).setUp()
+        self.driver.set_push_threshold(2)
+        self.state = OmniSwitchConfigState() # config read back after the push
+        self.driver._read_config_state = lambda ports: self.state
+        self.ops = [('create_vlan', [10, 'a']), ('create_vlan', [11, 'b'])]
+
+    def test_pushed_file_applied(self):
+        self.state.vlans.update({10: 'a', 11: 'b'})
+        self.assertTrue(self.driver.apply_config_ops(self.ops))
+        self.assertEqual([(sent[1], sent[2]) for sent in self.sent],
+                         [('push', 'openstack_provisioning.cfg'), ('cli', 'aos')])
+        self.assertEqual(self.sent[1][3], {'cmd': 'configuration apply openstack_provisioning.cfg'})
+
+    def test_ops_not_applied_sent_as_mib_writes(self):
+        self.state.vlans[10] = 'a'
+        self.assertTrue(self.driver.apply_config_ops(self.ops))
+        self.assertEqual([sent[3]['mibObject0'] for sent in self._sent('mib')], ['vlanNumber:11'])
+
+    def test_failed_apply_checked_with_read_back(self):
+        self.diags['cli'] = 400
+        self.assertTrue(self.driver.apply_config_ops(self.ops))
+        self.assertEqual(len(self._sent('mib')), 2)
+
+    def test_small_change_set_not_pushed(self):
+        self.assertTrue(self.driver.apply_config_ops(self.ops[:1]))
+        self.assertEqual([sent[1] for sent in self.sent], ['mib'])
+
+
+class OmniSwitchSaveConfigTestCase(FakeRestfulDriverTestCase):
+
+    def setUp(self):
+        super(OmniSwitchSaveConfigTestCase, self).setUp()
+        self.rows['chasChassisTable'] = {'1': {'chasPrimaryPhysicalIndex': '65'}}
+        self._set_status('2', 3, 2)
+
+    def _set_status(self, change, certify, sync):
+        self.rows['configManager'] = {'0': {'configChangeStatus': change}}
+        self.rows['chasControlModuleTable'] = {'65': {'chasControlCertifyStatus': str(certify),
+                                                      'chasControlSynchronizationStatus': str(sync)}}
+
+    def test_nothing_to_save_skipped(self):
+        self._set_status('1', 3, 4)
+        self.assertTrue(self.driver.start_save_config())
+        self.assertEqual(self._posted(), [])
+        self.assertTrue(self.driver.check_save_config())
+
+    def test_changed_config_saved(self):
+        self.assertTrue(self.driver.start_save_config())
+        self.assertEqual(self._posted(), [('configManager', 'configWriteMemory:1'),
+                                          ('chasControlModuleTable', 'entPhysicalIndex:65')])
+        self.assertTrue(self.driver.check_save_config())
+
+    def test_save_in_progress(self):
+        self.assertTrue(self.driver.start_save_config())
+        self._set_status('1', 2, 3)
+        self.assertEqual(self.driver.check_save_config(), None)
+
+    def test_unreadable_status_polled_until_timeout(self):
+        self.assertTrue(self.driver.start_save_config())
+        del self.rows['chasControlModuleTable']
+        self.assertEqual(self.driver.check_save_config(), None)
+        self.driver.save_timeout = 0
+        self.assertFalse(self.driver.check_save_config())
+
+    def test_save_timeout(self):
+        self.driver.save_timeout = 0
+        self.driver.save_poll_interval = 0
+        self._set_status('2', 2, 3)
+        self.assertFalse(self.driver.save_config())
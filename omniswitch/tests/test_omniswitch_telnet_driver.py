@@ -0,0 +1,232 @@
+#!/bin/env python
+#
+#  Copyright 2014 Alcatel-Lucent Enterprise.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may not use this file
+#  except in compliance with the License. You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software distributed under the License
+#  is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+#  either express or implied. See the License for the specific language governing permissions
+#  and limitations under the License.
+#
+#
+# $File: test_omniswitch_telnet_driver.py$
+
+# $Build: OONP_H_R01_6$
+
+# $Date: 05/06/2014 12:10:39$
+
+# $Author: vapoonat$
+
+#
+#
+
+
+import socket
+import threading
+import unittest
+
+from neutron.plugins.omniswitch import omniswitch_telnet_driver
+from neutron.plugins.omniswitch.omniswitch_telnet_driver import OmniSwitchTelnetDriver
+
+
+class FakeSwitch(object):
+
+    """ the switch behind the FakeTelnet sessions """
+
+    def __init__(self):
+        self.sessions = [] # FakeTelnet opened to the switch, in order
+        self.ran = [] # commands run, in order
+        self.errors = set() # commands answered with an ERROR
+        self.unanswered = set() # commands run without answer, as on a slow switch
+        self.held = set() # commands answered only once 'release' is set
+        self.holding = threading.Event() # a held command is waiting
+        self.release = threading.Event()
+        self.down = False # the connections are refused
+        self.refuse_login = False
+
+    def drop_sessions(self):
+        """ the switch closes the open sessions, their next read gets EOF """
+        for session in self.sessions:
+            session.closed_by_switch = True
+
+
+class FakeTelnet(object):
+
+    """ stands for telnetlib.Telnet; answers as an AOS 6x switch, without a socket """
+
+    switch = None
+
+    def __init__(self, host, port, timeout):
+        if self.switch.down:
+            raise socket.error(111, 'Connection refused')
+        self.switch.sessions.append(self)
+        self.buf = 'login : '
+        self.pending = [] # lines written, not answered yet
+        self.writes = []
+        self.logged_in = False
+        self.password = False
+        self.closed = False
+        self.closed_by_switch = False
+
+    def write(self, data):
+        if self.closed:
+            raise socket.error(9, 'Bad file descriptor')
+        self.writes.append(data)
+        lines = data.split('\n')[:-1]
+        while len(lines) and not self.logged_in:
+            lines.pop(0)
+            if not self.password:
+                self.password = True
+                self.buf += 'Password : '
+            elif self.switch.refuse_login:
+                self.password = False
+                self.buf += '\r\nlogin : '
+            else:
+                self.logged_in = True
+                self.buf += '\r\nWelcome to the Alcatel-Lucent OmniSwitch 6000\r\n-> '
+        self.pending.extend(lines)
+
+    def read_until(self, match, timeout=None):
+        self._answer()
+        if self.closed_by_switch and len(self.buf) == 0:
+            raise EOFError('telnet connection closed')
+        end = self.buf.find(match)
+        if end < 0:
+            end = len(self.buf)
+        else:
+            end += len(match)
+        text, self.buf = self.buf[:end], self.buf[end:]
+        return text
+
+    def expect(self, patterns, timeout=None):
+        self._answer()
+        for index in range(0, len(patterns)):
+            match = patterns[index].search(self.buf)
+            if match:
+                text, self.buf = self.buf[:match.end()], self.buf[match.end():]
+                return (index, match, text)
+        if self.closed_by_switch and len(self.buf) == 0:
+            raise EOFError('telnet connection closed')
+        text, self.buf = self.buf, ''
+        return (-1, None, text)
+
+    def read_very_eager(self):
+        self._answer()
+        if self.closed_by_switch and len(self.buf) == 0:
+            raise EOFError('telnet connection closed')
+        text, self.buf = self.buf, ''
+        return text
+
+    def close(self):
+        self.closed = True
+
+    def _answer(self):
+        while len(self.pending) and not self.closed_by_switch:
+            command = self.pending.pop(0)
+            if command in self.switch.held:
+                self.switch.holding.set()
+                self.switch.release.wait(5)
+            if command:
+                self.switch.ran.append(command)
+            if command in self.switch.unanswered:
+                continue
+            self.buf += command + '\r\n'
+            if command in self.switch.errors:
+                self.buf += 'ERROR: %s failed\r\n' % command
+            self.buf += '-> '
+
+
+class OmniSwitchTelnetDriverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.switch = FakeSwitch()
+        FakeTelnet.switch = self.switch
+        self.telnet = omniswitch_telnet_driver.telnetlib.Telnet
+        omniswitch_telnet_driver.telnetlib.Telnet = FakeTelnet
+        self.driver = OmniSwitchTelnetDriver('10.0.0.1', True)
+        self.driver.set_keepalive_interval(0)
+
+    def tearDown(self):
+        omniswitch_telnet_driver.telnetlib.Telnet = self.telnet
+
+    def test_pipelined_answers_split_at_prompts(self):
+        self.switch.errors.add('vlan 11')
+        rets = self.driver.send_batch(['vlan 10', 'vlan 11', 'vlan 12'])
+        self.assertEqual([ret for ret, output in rets], [True, False, True])
+        self.assertEqual(rets[1][1], ' vlan 11\r\nERROR: vlan 11 failed\r\n->')
+        self.assertEqual(self.switch.sessions[0].writes[-1], 'vlan 10\nvlan 11\nvlan 12\n')
+
+    def test_stop_on_error(self):
+        self.switch.errors.add('vlan 11')
+        rets = self.driver.send_batch(['vlan 10', 'vlan 11', 'vlan 12'], True)
+        self.assertEqual([ret for ret, output in rets], [True, False, False])
+        self.assertEqual(rets[2], (False, 'not sent'))
+        self.assertEqual(self.switch.ran, ['vlan 10', 'vlan 11'])
+
+    def test_session_kept_across_calls(self):
+        self.assertTrue(self.driver.sendCommand('vlan 10'))
+        self.assertTrue(self.driver.sendCommand('vlan 11'))
+        self.assertEqual(len(self.switch.sessions), 1)
+
+    def test_dead_session_sent_again(self):
+        self.assertTrue(self.driver.sendCommand('vlan 10'))
+        self.switch.drop_sessions()
+        self.assertTrue(self.driver.sendCommand('no vlan 10'))
+        self.assertEqual(self.switch.ran, ['vlan 10', 'no vlan 10'])
+        self.assertEqual(len(self.switch.sessions), 2)
+        self.assertEqual(self.driver.take_connect_error(), None)
+
+    def test_no_answer_not_sent_again(self):
+        self.switch.unanswered.add('no vlan 10')
+        self.assertFalse(self.driver.sendCommand('no vlan 10'))
+        self.assertEqual(self.switch.ran, ['no vlan 10'])
+        self.assertTrue(self.switch.sessions[0].closed)
+        self.assertTrue(self.driver.sendCommand('vlan 10'))
+        self.assertEqual(len(self.switch.sessions), 2)
+
+    def test_unreachable_switch(self):
+        self.switch.down = True
+        rets = self.driver.send_batch(['vlan 10'])
+        self.assertEqual(rets, [(False, 'not sent')])
+        self.assertTrue(self.driver.take_connect_error())
+        self.assertEqual(self.driver.take_connect_error(), None)
+
+    def test_login_refused_switch_reachable(self):
+        self.switch.refuse_login = True
+        self.assertFalse(self.driver.probe())
+        self.assertEqual(self.driver.take_connect_error(), None)
+
+    def test_connect_error_per_thread(self):
+        errors = {}
+        def call(name):
+            self.driver.sendCommand('vlan 10')
+            errors[name] = self.driver.take_connect_error()
+        self.switch.down = True
+        first = threading.Thread(target=call, args=('down',))
+        first.start()
+        first.join()
+        self.switch.down = False
+        second = threading.Thread(target=call, args=('up',))
+        second.start()
+        second.join()
+        self.assertTrue(errors['down'])
+        self.assertEqual(errors['up'], None)
+        self.assertEqual(self.driver.take_connect_error(), None)
+
+    def test_calls_at_once_run_in_pool_sessions(self):
+        self.driver.set_session_pool_size(2)
+        self.switch.held.add('vlan 10')
+        held = threading.Thread(target=self.driver.sendCommand, args=('vlan 10',))
+        held.start()
+        self.switch.holding.wait(5)
+        self.assertTrue(self.driver.sendCommand('vlan 11'))
+        self.assertEqual(self.switch.ran, ['vlan 11'])
+        self.switch.release.set()
+        held.join()
+        self.assertEqual(len(self.switch.sessions), 2)
+        self.assertTrue(self.driver.sendCommand('vlan 12'))
+        self.assertEqual(len(self.switch.sessions), 2)